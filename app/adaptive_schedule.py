@@ -0,0 +1,239 @@
+import logging
+import math
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Optional
+
+from celery.schedules import schedule
+
+logger = logging.getLogger(__name__)
+
+
+# Интервал опроса списков объявлений: стартовое значение и границы
+LIST_POLL_DEFAULT_SECONDS = float(os.getenv('LIST_POLL_DEFAULT_SECONDS', '3600'))
+LIST_POLL_MIN_SECONDS = float(os.getenv('LIST_POLL_MIN_SECONDS', '600'))
+LIST_POLL_MAX_SECONDS = float(os.getenv('LIST_POLL_MAX_SECONDS', '14400'))
+# Сколько новых ID за запуск считается "много": интервал сокращается
+LIST_POLL_BUSY_THRESHOLD = int(os.getenv('LIST_POLL_BUSY_THRESHOLD', '20'))
+LIST_POLL_SPEEDUP = float(os.getenv('LIST_POLL_SPEEDUP', '0.5'))
+LIST_POLL_SLOWDOWN = float(os.getenv('LIST_POLL_SLOWDOWN', '1.5'))
+
+# Как часто проверяется очередь деталей и сколько страниц деталей можно
+# запросить у realt.by за окно (на оба вида объявлений вместе)
+DETAIL_TICK_SECONDS = float(os.getenv('DETAIL_TICK_SECONDS', '300'))
+DETAIL_REQUEST_BUDGET = int(os.getenv('DETAIL_REQUEST_BUDGET', '600'))
+DETAIL_BUDGET_WINDOW = int(os.getenv('DETAIL_BUDGET_WINDOW', '3600'))
+# Потолок на один тик, чтобы бюджет окна расходовался равномерно, а не в первом тике
+DETAIL_TICK_MAX_REQUESTS = int(os.getenv(
+    'DETAIL_TICK_MAX_REQUESTS',
+    str(math.ceil(DETAIL_REQUEST_BUDGET * DETAIL_TICK_SECONDS / DETAIL_BUDGET_WINDOW)),
+))
+
+SCHEDULE_STORE_BACKEND = os.getenv('SCHEDULE_STORE_BACKEND', 'redis')  # redis | local
+SCHEDULE_KEY_PREFIX = 'schedule:'
+
+
+def next_interval(current, new_count, minimum=LIST_POLL_MIN_SECONDS, maximum=LIST_POLL_MAX_SECONDS,
+                  busy_threshold=LIST_POLL_BUSY_THRESHOLD):
+    """
+    Новый интервал опроса по числу новых ID последнего запуска: много новых -
+    опрашиваем чаще, ни одного - реже, иначе интервал не меняется
+    """
+    if new_count >= busy_threshold:
+        current *= LIST_POLL_SPEEDUP
+    elif new_count == 0:
+        current *= LIST_POLL_SLOWDOWN
+    return min(max(current, minimum), maximum)
+
+
+class LocalScheduleStore:
+    """
+    Состояние расписания в памяти процесса. Подходит для одного процесса
+    (тесты, локальный запуск) и как запасной вариант при недоступном Redis
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._intervals = {}
+        self._usage = {}
+        self._lock = threading.Lock()
+
+    def get_interval(self, name) -> Optional[float]:
+        return self._intervals.get(name)
+
+    def set_interval(self, name, seconds):
+        self._intervals[name] = float(seconds)
+
+    def consume(self, name, amount, limit, window) -> int:
+        bucket = int(self.clock() // window)
+        with self._lock:
+            # Старые окна больше не нужны
+            self._usage = {key: used for key, used in self._usage.items() if key[1] >= bucket}
+            used = self._usage.get((name, bucket), 0)
+            granted = max(0, min(amount, limit - used))
+            self._usage[(name, bucket)] = used + granted
+        return granted
+
+
+class RedisScheduleStore:
+    """
+    Состояние расписания в Redis: его видят и beat, и все воркеры
+    """
+
+    def __init__(self, client, clock=time.time, prefix=SCHEDULE_KEY_PREFIX):
+        self.client = client
+        self.clock = clock
+        self.prefix = prefix
+
+    def get_interval(self, name) -> Optional[float]:
+        value = self.client.get(f'{self.prefix}interval:{name}')
+        return float(value) if value is not None else None
+
+    def set_interval(self, name, seconds):
+        self.client.set(f'{self.prefix}interval:{name}', float(seconds))
+
+    def consume(self, name, amount, limit, window) -> int:
+        if amount <= 0:
+            return 0
+        key = f'{self.prefix}budget:{name}:{int(self.clock() // window)}'
+        pipe = self.client.pipeline()
+        pipe.incrby(key, amount)
+        pipe.expire(key, window * 2)
+        used = pipe.execute()[0]
+        excess = min(amount, max(0, used - limit))
+        if excess:
+            # Вернуть то, что не поместилось в бюджет окна
+            self.client.decrby(key, excess)
+        return amount - excess
+
+
+class FallbackScheduleStore:
+    """
+    Обращается к основному хранилищу, а при его ошибке - к запасному,
+    чтобы недоступный Redis не останавливал beat и задачи
+    """
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+
+    def _call(self, method, *args):
+        try:
+            return getattr(self.primary, method)(*args)
+        except Exception as e:
+            logger.warning(f"Schedule store {method} failed, using local state: {e}")
+            return getattr(self.fallback, method)(*args)
+
+    def get_interval(self, name):
+        return self._call('get_interval', name)
+
+    def set_interval(self, name, seconds):
+        return self._call('set_interval', name, seconds)
+
+    def consume(self, name, amount, limit, window):
+        return self._call('consume', name, amount, limit, window)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _make_store(backend):
+    if backend == 'redis':
+        from redis_client import get_redis
+        return FallbackScheduleStore(RedisScheduleStore(get_redis()), LocalScheduleStore())
+    return LocalScheduleStore()
+
+
+def get_schedule_store():
+    """
+    Общее для процесса хранилище, выбирается через SCHEDULE_STORE_BACKEND
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _make_store(SCHEDULE_STORE_BACKEND)
+    return _store
+
+
+class AdaptiveSchedule(schedule):
+    """
+    Расписание Celery beat с интервалом из хранилища: его подстраивает
+    record_list_run после каждого запуска задачи
+    """
+
+    def __init__(self, name, default=LIST_POLL_DEFAULT_SECONDS, minimum=LIST_POLL_MIN_SECONDS,
+                 maximum=LIST_POLL_MAX_SECONDS, store=None, app=None):
+        self.name = name
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.store = store
+        super().__init__(run_every=timedelta(seconds=default), app=app)
+
+    def current_interval(self) -> float:
+        seconds = (self.store or get_schedule_store()).get_interval(self.name)
+        if seconds is None:
+            seconds = self.default
+        return min(max(seconds, self.minimum), self.maximum)
+
+    def is_due(self, last_run_at):
+        self.run_every = timedelta(seconds=self.current_interval())
+        return super().is_due(last_run_at)
+
+    def __reduce__(self):
+        # Хранилище не сериализуется в файл расписания beat
+        return self.__class__, (self.name, self.default, self.minimum, self.maximum)
+
+    def __repr__(self):
+        return f'<adaptive {self.name}: {self.minimum:g}..{self.maximum:g}s>'
+
+    def __eq__(self, other):
+        if isinstance(other, AdaptiveSchedule):
+            return (self.name, self.default, self.minimum, self.maximum) == \
+                (other.name, other.default, other.minimum, other.maximum)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+
+def record_list_run(name, new_count, store=None) -> float:
+    """
+    Сохраняет новый интервал опроса по итогам запуска и возвращает его
+    """
+    store = store or get_schedule_store()
+    current = store.get_interval(name)
+    interval = next_interval(LIST_POLL_DEFAULT_SECONDS if current is None else current, new_count)
+    store.set_interval(name, interval)
+    logger.info(f"{name}: {new_count} new IDs, next poll in {interval:g}s")
+    return interval
+
+
+def plan_detail_requests(backlog: Dict[str, int], store=None, budget=DETAIL_REQUEST_BUDGET,
+                         window=DETAIL_BUDGET_WINDOW, tick_max=DETAIL_TICK_MAX_REQUESTS) -> Dict[str, int]:
+    """
+    Сколько страниц деталей запросить в этом тике для каждого вида объявлений.
+    Берёт из бюджета окна не больше tick_max и делит выданное пропорционально очередям.
+    """
+    total = sum(backlog.values())
+    if not total:
+        return {}
+    wanted = min(total, tick_max)
+    granted = (store or get_schedule_store()).consume('details', wanted, budget, window)
+    if not granted:
+        logger.info(f"Detail request budget exhausted, backlog {total}")
+        return {}
+
+    plan = {kind: granted * pending // total for kind, pending in backlog.items()}
+    # Остаток от округления отдаём самым длинным очередям
+    for kind in sorted(backlog, key=backlog.get, reverse=True):
+        if sum(plan.values()) >= granted:
+            break
+        if plan[kind] < backlog[kind]:
+            plan[kind] += 1
+    return {kind: count for kind, count in plan.items() if count}
@@ -1,5 +1,7 @@
 from celery import Celery
 from celery.schedules import crontab
+from kombu import Queue
+from adaptive_schedule import AdaptiveSchedule, DETAIL_TICK_SECONDS
 import os
 
 celery = Celery(
@@ -9,25 +11,73 @@ celery = Celery(
 )
 celery.autodiscover_tasks(['tasks'])
 
+LIST_QUEUE = 'list'
+DETAIL_QUEUE = 'detail'
+WEBHOOK_QUEUE = 'webhook'
+MAINTENANCE_QUEUE = 'maintenance'
+BATCH_QUEUE = 'batch'
+
+# Шаблоны fnmatch, проверяются по порядку до первого совпадения
+TASK_ROUTES = {
+    'tasks.parse_*_list': {'queue': LIST_QUEUE},
+    'tasks.parse_*_details': {'queue': DETAIL_QUEUE},
+    'tasks.parse_*_details_chunk': {'queue': DETAIL_QUEUE},
+    'tasks.send_*': {'queue': WEBHOOK_QUEUE},
+    'tasks.retry_webhooks': {'queue': WEBHOOK_QUEUE},
+    # Долгие разовые прогоны по всей коллекции не должны задерживать тик деталей
+    'tasks.retranslate': {'queue': BATCH_QUEUE},
+    'tasks.report_index_usage': {'queue': BATCH_QUEUE},
+    # Остальное (тик деталей, итог chord, аренды) - короткие задачи в maintenance
+    'tasks.*': {'queue': MAINTENANCE_QUEUE},
+}
+
+
+def _profile(queue, concurrency, prefetch, soft_time_limit, time_limit, max_tasks_per_child):
+    prefix = f'WORKER_{queue.upper()}_'
+    return {
+        'queues': [queue],
+        'concurrency': int(os.getenv(prefix + 'CONCURRENCY', concurrency)),
+        'prefetch_multiplier': int(os.getenv(prefix + 'PREFETCH', prefetch)),
+        'soft_time_limit': float(os.getenv(prefix + 'SOFT_TIME_LIMIT', soft_time_limit)),
+        'time_limit': float(os.getenv(prefix + 'TIME_LIMIT', time_limit)),
+        'max_tasks_per_child': int(os.getenv(prefix + 'MAX_TASKS_PER_CHILD', max_tasks_per_child)),
+    }
+
+
+# Профили воркеров: у каждой очереди свои процессы, поэтому длинная очередь
+# деталей не задерживает опрос списков и вебхуки. Запуск: python worker.py <очередь>
+WORKER_PROFILES = {
+    # Короткие задачи, важна задержка: берём по одной и держим отдельные процессы
+    LIST_QUEUE: _profile(LIST_QUEUE, 2, 1, 300, 360, 100),
+    # Долгие пачки с acks_late: prefetch 1, чтобы задачи не застревали у занятого процесса
+    DETAIL_QUEUE: _profile(DETAIL_QUEUE, 4, 1, 600, 720, 50),
+    WEBHOOK_QUEUE: _profile(WEBHOOK_QUEUE, 2, 4, 120, 180, 200),
+    # Тик деталей и итог chord: ждать за долгой задачей им нельзя
+    MAINTENANCE_QUEUE: _profile(MAINTENANCE_QUEUE, 2, 1, 120, 180, 200),
+    # Перевод заново и отчёт по индексам: по одной задаче, с длинным лимитом
+    BATCH_QUEUE: _profile(BATCH_QUEUE, 1, 1, 1800, 2100, 20),
+}
+
 celery.conf.update(
     timezone='UTC',
     enable_utc=True,
+    task_queues=[Queue(name) for name in WORKER_PROFILES],
+    task_default_queue=MAINTENANCE_QUEUE,
+    task_routes=TASK_ROUTES,
     beat_schedule={
-        'first_parse_apartments_every_1_hour': {
+        # Интервал опроса списков подстраивается под число новых ID (adaptive_schedule)
+        'first_parse_apartments_adaptive': {
             'task': 'tasks.parse_apartment_list',
-            'schedule': 3600.0,
+            'schedule': AdaptiveSchedule('apartments_list'),
         },
-        'first_parse_rent_every_1_hour': {
+        'first_parse_rent_adaptive': {
             'task': 'tasks.parse_rent_list',
-            'schedule': 3600.0,
-        },
-        'second_parse_apartments_a_day': {
-            'task': 'tasks.parse_apartment_details',
-            'schedule': crontab(hour=0, minute=0),
+            'schedule': AdaptiveSchedule('rent_list'),
         },
-        'second_parse_rent_a_day': {
-            'task': 'tasks.parse_rent_details',
-            'schedule': crontab(hour=0, minute=0),
+        # Детали разбираются по мере роста очереди в пределах бюджета запросов
+        'second_parse_details_continuously': {
+            'task': 'tasks.schedule_detail_parsing',
+            'schedule': DETAIL_TICK_SECONDS,
         },
         'send_apartments_webhooks_once_a_day': {
             'task': 'tasks.send_apartments_webhook_to_django',
@@ -36,6 +86,18 @@ celery.conf.update(
         'send_rent_webhooks_once_a_day': {
             'task': 'tasks.send_rent_webhook_to_django',
             'schedule': crontab(hour=1, minute=0),
+        },
+        'retry_failed_webhooks_every_minute': {
+            'task': 'tasks.retry_webhooks',
+            'schedule': 60.0,
+        },
+        'reap_expired_detail_leases_every_10_minutes': {
+            'task': 'tasks.reap_expired_leases',
+            'schedule': 600.0,
+        },
+        'report_index_usage_once_a_day': {
+            'task': 'tasks.report_index_usage',
+            'schedule': crontab(hour=3, minute=0),
         }
     }
 )
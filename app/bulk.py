@@ -0,0 +1,91 @@
+import logging
+import os
+import time
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+
+BULK_WRITE_BATCH_SIZE = int(os.getenv('BULK_WRITE_BATCH_SIZE', '200'))
+BULK_WRITE_FLUSH_INTERVAL = float(os.getenv('BULK_WRITE_FLUSH_INTERVAL', '5'))
+
+
+class BulkWriter:
+    """
+    Копит операции записи и отправляет их неупорядоченным bulk_write пачками.
+    Пачка уходит при наборе batch_size операций или когда с первой операции
+    в ней прошло больше flush_interval секунд. Итоги каждой пачки лежат в batches.
+    """
+
+    def __init__(self, coll, batch_size=BULK_WRITE_BATCH_SIZE, flush_interval=BULK_WRITE_FLUSH_INTERVAL,
+                 clock=time.monotonic):
+        self.coll = coll
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._ops = []
+        self._started_at = None
+        self.batches = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Досылаем накопленное даже при ошибке, чтобы не терять сделанную работу
+        self.flush()
+        return False
+
+    def add(self, op):
+        if not self._ops:
+            self._started_at = self._clock()
+        self._ops.append(op)
+        if len(self._ops) >= self.batch_size or self._clock() - self._started_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self._ops:
+            return None
+        ops, self._ops = self._ops, []
+
+        try:
+            result = self.coll.bulk_write(ops, ordered=False)
+            report = {
+                'size': len(ops),
+                'matched': result.matched_count,
+                'modified': result.modified_count,
+                'upserted': result.upserted_count,
+                'errors': 0,
+            }
+        except BulkWriteError as e:
+            details = e.details
+            report = {
+                'size': len(ops),
+                'matched': details.get('nMatched', 0),
+                'modified': details.get('nModified', 0),
+                'upserted': details.get('nUpserted', 0),
+                'errors': len(details.get('writeErrors', [])),
+            }
+            logger.error(f"Bulk write to {self.coll.name} finished with {report['errors']} errors")
+
+        self.batches.append(report)
+        logger.info(
+            f"Bulk write to {self.coll.name}: {report['size']} ops, matched {report['matched']}, "
+            f"modified {report['modified']}, upserted {report['upserted']}, errors {report['errors']}"
+        )
+        return report
+
+    def _total(self, key):
+        return sum(batch[key] for batch in self.batches)
+
+    @property
+    def modified_count(self):
+        return self._total('modified')
+
+    @property
+    def upserted_count(self):
+        return self._total('upserted')
+
+    @property
+    def error_count(self):
+        return self._total('errors')
@@ -0,0 +1,96 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+LIST_CRAWL_WINDOW = int(os.getenv('LIST_CRAWL_WINDOW', '2'))
+LIST_CRAWL_MAX_PAGES = int(os.getenv('LIST_CRAWL_MAX_PAGES', '30'))
+
+
+class ListingPage(list):
+    """
+    Объявления со страниц списка. commit() отмечает страницы в HTTP-кэше
+    как увиденные; вызывается только после того, как объявления сохранены в базе,
+    иначе сбой записи спрячет их до следующего изменения страницы
+    """
+
+    def __init__(self, items=(), commit: Optional[Callable[[], None]] = None):
+        super().__init__(items)
+        self._commit = commit
+
+    def commit(self):
+        if self._commit is not None:
+            self._commit()
+
+
+def commit_listing_pages(items):
+    commit = getattr(items, 'commit', None)
+    if commit is not None:
+        commit()
+
+
+def crawl_new_listings(
+    parse_page: Callable[[int], List[Dict]],
+    known_ids: Callable[[List[str]], Set[str]],
+    window: int = LIST_CRAWL_WINDOW,
+    max_pages: int = LIST_CRAWL_MAX_PAGES,
+) -> List[Dict]:
+    """
+    Обходит страницы списка (сортировка по createdAt) окнами по window страниц
+    и собирает ещё неизвестные объявления. Обход останавливается на первой странице,
+    которая пуста, не изменилась с прошлого обхода (парсер вернул None)
+    или целиком состоит из уже известных ID.
+    """
+    window = max(1, window)
+    new_items = []
+    seen = set()
+    processed = []
+
+    def result():
+        # Кэш отмечается только для страниц, которые разобраны целиком
+        return ListingPage(new_items, commit=lambda: [commit_listing_pages(page) for page in processed])
+
+    with ThreadPoolExecutor(max_workers=window, thread_name_prefix='list-crawl') as pool:
+        page = 1
+        while page <= max_pages:
+            pages = range(page, min(page + window, max_pages + 1))
+            futures = [(number, pool.submit(parse_page, number)) for number in pages]
+
+            for number, future in futures:
+                try:
+                    items = future.result()
+                except Exception as e:
+                    if number == 1:
+                        raise
+                    logger.warning(f"Listing page {number} failed, stopping crawl: {e}")
+                    return result()
+
+                if items is not None:
+                    processed.append(items)
+                if not items:
+                    return result()
+
+                ids = [item['_id'] for item in items]
+                known = known_ids(ids) | seen
+                fresh = [item for item in items if item['_id'] not in known]
+                for item in fresh:
+                    seen.add(item['_id'])
+                    new_items.append(item)
+
+                if not fresh:
+                    return result()
+
+            page += window
+
+    logger.warning(f"Listing crawl reached max_pages={max_pages}")
+    return result()
+
+
+def find_known_ids(coll, ids: Iterable[str]) -> Set[str]:
+    """
+    Возвращает те из ids, что уже есть в коллекции
+    """
+    return {doc['_id'] for doc in coll.find({'_id': {'$in': list(ids)}}, {'_id': 1})}
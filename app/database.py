@@ -1,35 +1,83 @@
-from pymongo import MongoClient, errors
+from pymongo import MongoClient, errors, uri_parser
 from contextlib import contextmanager
+import os
+import threading
+
+
+MONGO_URI = os.getenv('MONGO_URI', 'mongodb://mongo:27017/mydatabase')
+
+# Значения по умолчанию, если они не заданы в query-параметрах MONGO_URI
+DEFAULT_CLIENT_OPTIONS = {
+    'maxPoolSize': 50,
+    'minPoolSize': 0,
+    'maxIdleTimeMS': 300000,
+    'connectTimeoutMS': 5000,
+    'serverSelectionTimeoutMS': 5000,
+    'socketTimeoutMS': 30000,
+    'waitQueueTimeoutMS': 10000,
+}
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def _client_options(uri):
+    """
+    Опции пула из DEFAULT_CLIENT_OPTIONS, которые не переопределены в самом URI
+    """
+    uri_options = {key.lower() for key in uri_parser.parse_uri(uri)['options']}
+    return {key: value for key, value in DEFAULT_CLIENT_OPTIONS.items() if key.lower() not in uri_options}
+
+
+def _reset_after_fork():
+    # Пул соединений родителя нельзя использовать в дочернем процессе
+    global _client, _client_pid, _lock
+    _client = None
+    _client_pid = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_client():
+    """
+    Возвращает общий для процесса MongoClient, создавая его при первом обращении
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _lock:
+        if _client is None or _client_pid != pid:
+            _client = MongoClient(MONGO_URI, **_client_options(MONGO_URI))
+            _client_pid = pid
+        return _client
+
+
+def close_client():
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
 
 
 @contextmanager
 def get_apartments_db():
-    client = None
     try:
-        client = MongoClient("mongodb://mongo:27017/mydatabase")
-        db = client.apartments
-        yield db
+        yield get_client().apartments
     except errors.ConnectionFailure as e:
         raise RuntimeError(f"Не удалось подключиться к MongoDB: {e}")
-    finally:
-        if client:
-            client.close()
 
 
 @contextmanager
 def get_rental_db():
-    client = None
     try:
-        client = MongoClient("mongodb://mongo:27017/mydatabase")
-        db = client.rental
-        yield db
+        yield get_client().rental
     except errors.ConnectionFailure as e:
         raise RuntimeError(f"Не удалось подключиться к MongoDB: {e}")
-    finally:
-        if client:
-            client.close()
-
-
-def get_client():
-    client = MongoClient("mongodb://mongo:27017/mydatabase")
-    return client
\ No newline at end of file
@@ -0,0 +1,65 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+DETAIL_FETCH_WORKERS = int(os.getenv('DETAIL_FETCH_WORKERS', '16'))
+DETAIL_FETCH_PER_HOST = int(os.getenv('DETAIL_FETCH_PER_HOST', '8'))
+
+
+class HostLimiter:
+    """
+    Ограничивает число одновременных запросов к одному хосту
+    """
+
+    def __init__(self, per_host: int = DETAIL_FETCH_PER_HOST):
+        self.per_host = max(1, per_host)
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+
+    def for_url(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url or '').netloc
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_host)
+                self._semaphores[host] = semaphore
+        return semaphore
+
+
+def fetch_details(
+    docs: Iterable[Dict],
+    parse: Callable[[str], Dict],
+    max_workers: Optional[int] = None,
+    per_host: Optional[int] = None,
+) -> Iterator[Tuple[Dict, Optional[Dict], Optional[Exception]]]:
+    """
+    Параллельно скачивает и парсит страницы объявлений по полю link.
+    Отдаёт кортежи (документ, результат парсинга, ошибка) по мере готовности.
+    """
+    docs = list(docs)
+    if not docs:
+        return
+
+    limiter = HostLimiter(per_host or DETAIL_FETCH_PER_HOST)
+    workers = min(max_workers or DETAIL_FETCH_WORKERS, len(docs))
+
+    def _fetch(doc):
+        link = doc.get('link')
+        with limiter.for_url(link):
+            return parse(link)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='detail-fetch') as pool:
+        futures = {pool.submit(_fetch, doc): doc for doc in docs}
+        for future in as_completed(futures):
+            doc = futures[future]
+            try:
+                yield doc, future.result(), None
+            except Exception as e:
+                logger.warning(f"Failed to fetch {doc.get('link')}: {e}")
+                yield doc, None, e
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+
+from bson import Binary
+
+logger = logging.getLogger(__name__)
+
+
+HTTP_CACHE_BACKEND = os.getenv('HTTP_CACHE_BACKEND', 'disk')  # disk | mongo | off
+HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', '/tmp/realt-http-cache')
+
+
+def _url_key(url):
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+class DiskCacheStore:
+    """
+    Хранит валидаторы и сжатое тело страницы в файлах на локальном диске
+    """
+
+    def __init__(self, directory=HTTP_CACHE_DIR):
+        self.directory = directory
+
+    def _paths(self, url):
+        key = _url_key(url)
+        base = os.path.join(self.directory, key[:2], key)
+        return base + '.json', base + '.zz'
+
+    def get(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                entry = json.load(f)
+            with open(body_path, 'rb') as f:
+                entry['body'] = f.read()
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    @staticmethod
+    def _write_atomic(path, data):
+        # Пишем через временный файл, чтобы параллельные воркеры не читали недописанное
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def set(self, url, entry):
+        meta_path, body_path = self._paths(url)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        meta = {key: value for key, value in entry.items() if key != 'body'}
+        self._write_atomic(body_path, entry['body'])
+        self._write_atomic(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+
+class MongoCacheStore:
+    """
+    Хранит валидаторы и сжатое тело страницы в коллекции MongoDB
+    """
+
+    def __init__(self, coll):
+        self.coll = coll
+
+    def get(self, url):
+        doc = self.coll.find_one({'_id': _url_key(url)})
+        if not doc:
+            return None
+        doc.pop('_id', None)
+        doc['body'] = bytes(doc['body'])
+        return doc
+
+    def set(self, url, entry):
+        doc = dict(entry, url=url, body=Binary(entry['body']))
+        self.coll.replace_one({'_id': _url_key(url)}, doc, upsert=True)
+
+
+class CachedResponse:
+    def __init__(self, url, status_code, text, changed):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        # False, если сервер ответил 304 или тело совпало с сохранённым
+        self.changed = changed
+
+
+def _noop():
+    pass
+
+
+class StreamedResult:
+    def __init__(self, url, status_code, value, changed, commit=_noop):
+        self.url = url
+        self.status_code = status_code
+        self.value = value
+        self.changed = changed
+        # Сохраняет запись кэша, если fetch_streamed вызван с defer_save
+        self.commit = commit
+
+
+class HttpCache:
+    """
+    Условные GET-запросы (If-None-Match / If-Modified-Since) поверх любого
+    клиента с методом get(url, headers=...). Без хранилища просто проксирует запрос.
+    Вытеснения нет, поэтому через кэш ходят только страницы списка: их число
+    ограничено, а страницы деталей запрашиваются по одному разу.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+
+    def _load(self, key):
+        if self.store is None:
+            return None
+        try:
+            return self.store.get(key)
+        except Exception as e:
+            logger.warning(f"HTTP cache read failed for {key}: {e}")
+            return None
+
+    def _save(self, key, entry):
+        try:
+            self.store.set(key, entry)
+        except Exception as e:
+            logger.warning(f"HTTP cache write failed for {key}: {e}")
+
+    @staticmethod
+    def _new_entry(entry, response_headers, body_text):
+        """
+        Возвращает (изменилось ли тело, новая запись кэша или None, если сохранять нечего)
+        """
+        body_hash = hashlib.sha256(body_text.encode('utf-8')).hexdigest()
+        changed = not entry or entry.get('body_hash') != body_hash
+        response_headers = response_headers or {}
+        etag = response_headers.get('ETag')
+        last_modified = response_headers.get('Last-Modified')
+        if not changed and entry.get('etag') == etag and entry.get('last_modified') == last_modified:
+            return changed, None
+        return changed, {
+            'etag': etag,
+            'last_modified': last_modified,
+            'body_hash': body_hash,
+            'body': zlib.compress(body_text.encode('utf-8')),
+        }
+
+    def _remember(self, key, entry, response_headers, body_text):
+        """
+        Сохраняет валидаторы и тело, возвращает True, если тело изменилось
+        """
+        changed, new_entry = self._new_entry(entry, response_headers, body_text)
+        if new_entry is not None:
+            self._save(key, new_entry)
+        return changed
+
+    @staticmethod
+    def _body_text(entry):
+        return zlib.decompress(entry['body']).decode('utf-8')
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def fetch(self, session, url, headers=None, **kwargs):
+        entry = self._load(url)
+        request_headers = dict(headers or {})
+        request_headers.update(self.conditional_headers(entry))
+
+        response = session.get(url, headers=request_headers, **kwargs)
+
+        if response.status_code == 304 and entry:
+            return CachedResponse(url, 304, self._body_text(entry), changed=False)
+
+        text = response.text
+        if self.store is None or response.status_code != 200:
+            return CachedResponse(url, response.status_code, text, changed=True)
+
+        changed = self._remember(url, entry, getattr(response, 'headers', None), text)
+        return CachedResponse(url, response.status_code, text, changed=changed)
+
+    def fetch_streamed(self, client, url, consume, headers=None, defer_save=False):
+        """
+        Потоковый вариант fetch: тело читает consume(iter_bytes), который может
+        остановиться, не дочитав ответ. В кэше хранится JSON с результатом consume,
+        поэтому при 304 возвращается сохранённый результат, а не страница.
+        С defer_save запись кэша сохраняется только при вызове result.commit():
+        пока вызывающий не сохранил результат, страница не считается увиденной.
+        """
+        key = f'stream:{url}'
+        entry = self._load(key)
+        request_headers = dict(headers or {})
+        request_headers.update(self.conditional_headers(entry))
+
+        with client.stream('GET', url, headers=request_headers) as response:
+            status_code = response.status_code
+            if status_code == 304 and entry:
+                return StreamedResult(url, 304, json.loads(self._body_text(entry)), changed=False)
+            value = consume(response.iter_bytes())
+            response_headers = response.headers
+
+        if self.store is None or status_code != 200:
+            return StreamedResult(url, status_code, value, changed=True)
+
+        body_text = json.dumps(value, ensure_ascii=False)
+        if not defer_save:
+            changed = self._remember(key, entry, response_headers, body_text)
+            return StreamedResult(url, status_code, value, changed=changed)
+
+        changed, new_entry = self._new_entry(entry, response_headers, body_text)
+        commit = _noop if new_entry is None else (lambda: self._save(key, new_entry))
+        return StreamedResult(url, status_code, value, changed=changed, commit=commit)
+
+
+_http_cache = None
+_http_cache_lock = threading.Lock()
+
+
+def _make_store(backend):
+    if backend == 'disk':
+        return DiskCacheStore(HTTP_CACHE_DIR)
+    if backend == 'mongo':
+        from database import get_client
+        return MongoCacheStore(get_client().http_cache.pages)
+    return None
+
+
+def get_http_cache():
+    """
+    Общий для процесса кэш, хранилище выбирается через HTTP_CACHE_BACKEND
+    """
+    global _http_cache
+    if _http_cache is None:
+        with _http_cache_lock:
+            if _http_cache is None:
+                _http_cache = HttpCache(_make_store(HTTP_CACHE_BACKEND))
+    return _http_cache
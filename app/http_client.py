@@ -0,0 +1,68 @@
+import os
+import threading
+
+import httpx
+
+
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '20'))
+HTTP_KEEPALIVE_SIZE = int(os.getenv('HTTP_KEEPALIVE_SIZE', '10'))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '20'))
+HTTP_POOL_TIMEOUT = float(os.getenv('HTTP_POOL_TIMEOUT', '30'))
+HTTP2_ENABLED = os.getenv('HTTP2_ENABLED', '1') == '1'
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def _make_client():
+    return httpx.Client(
+        http2=HTTP2_ENABLED,
+        limits=httpx.Limits(
+            max_connections=HTTP_POOL_SIZE,
+            max_keepalive_connections=HTTP_KEEPALIVE_SIZE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        # Таймауты на каждый запрос: зависшее соединение не блокирует воркер навсегда
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT),
+        follow_redirects=True,
+    )
+
+
+def _reset_after_fork():
+    # Соединения родителя нельзя переиспользовать в дочернем процессе
+    global _client, _client_pid, _lock
+    _client = None
+    _client_pid = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_http_client():
+    """
+    Возвращает общий для процесса HTTP-клиент с пулом keep-alive соединений
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _lock:
+        if _client is None or _client_pid != pid:
+            _client = _make_client()
+            _client_pid = pid
+        return _client
+
+
+def close_http_client():
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
@@ -0,0 +1,94 @@
+import logging
+from typing import Dict, List, NamedTuple, Optional
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSpec(NamedTuple):
+    name: str
+    keys: List
+    unique: bool = False
+    partial: Optional[Dict] = None
+
+    def options(self) -> Dict:
+        options = {'name': self.name}
+        if self.unique:
+            options['unique'] = True
+        if self.partial is not None:
+            options['partialFilterExpression'] = self.partial
+        return options
+
+
+# Индексы коллекций объявлений (apartments.apartments и rental.rental).
+# Частичные индексы по состоянию держат в себе только очередь, а не всю коллекцию
+LISTING_INDEXES = [
+    # Очередь деталей: list_first_state_ids покрывается индексом целиком,
+    # claim_listings и reserve_for_dispatch берут из него документы по порядку created_at
+    IndexSpec('state_first_created_at', [('state', ASCENDING), ('created_at', ASCENDING), ('_id', ASCENDING)],
+              partial={'state': 'first'}),
+    # Истёкшие аренды для reap_expired_leases
+    IndexSpec('state_processing_lease', [('state', ASCENDING), ('lease_expires', ASCENDING)],
+              partial={'state': 'processing'}),
+    # Дельта-вебхук: iter_pending_deltas читает только этот индекс
+    IndexSpec('state_second_changed_at',
+              [('state', ASCENDING), ('changed_at', ASCENDING), ('_id', ASCENDING), ('sent_version', ASCENDING)],
+              partial={'state': 'second', 'changed_at': {'$exists': True}}),
+    # Последнее изменение для опроса в pipeline_watcher
+    IndexSpec('changed_at', [('changed_at', DESCENDING)],
+              partial={'changed_at': {'$exists': True}}),
+    IndexSpec('state_created_at', [('state', ASCENDING), ('created_at', ASCENDING)]),
+    IndexSpec('state_updated_at', [('state', ASCENDING), ('updated_at', ASCENDING)]),
+    # _id выводится из ссылки, поэтому дубль ссылки - ошибка в данных
+    IndexSpec('link_unique', [('link', ASCENDING)], unique=True,
+              partial={'link': {'$type': 'string'}}),
+]
+
+WEBHOOK_RETRY_INDEXES = [
+    IndexSpec('kind_state_next_attempt',
+              [('kind', ASCENDING), ('state', ASCENDING), ('next_attempt_at', ASCENDING)]),
+]
+
+
+def ensure_indexes(coll, specs: List[IndexSpec]) -> Dict[str, str]:
+    """
+    Создаёт недостающие индексы коллекции. Каждый индекс создаётся отдельно:
+    конфликт опций или дубли в данных у одного не мешают остальным.
+    Возвращает имя индекса -> 'created', 'exists' или текст ошибки.
+    """
+    existing = coll.index_information()
+    report = {}
+    for spec in specs:
+        if spec.name in existing:
+            report[spec.name] = 'exists'
+            continue
+        try:
+            coll.create_index(spec.keys, **spec.options())
+            report[spec.name] = 'created'
+            logger.info(f"Created index {spec.name} on {coll.full_name}")
+        except OperationFailure as e:
+            report[spec.name] = f'error: {e}'
+            logger.error(f"Failed to create index {spec.name} on {coll.full_name}: {e}")
+    return report
+
+
+def index_usage(coll) -> Dict[str, Dict]:
+    """
+    Статистика $indexStats: сколько раз индекс использовался с момента запуска сервера.
+    Пустой словарь, если сервер (или mongomock) её не отдаёт
+    """
+    try:
+        stats = coll.aggregate([{'$indexStats': {}}])
+        return {
+            doc['name']: {'ops': int(doc['accesses']['ops']), 'since': doc['accesses']['since']}
+            for doc in stats
+        }
+    except (OperationFailure, NotImplementedError) as e:
+        logger.warning(f"Index stats are not available for {coll.full_name}: {e}")
+        return {}
+
+
+def unused_indexes(usage: Dict[str, Dict]) -> List[str]:
+    return sorted(name for name, stats in usage.items() if stats['ops'] == 0 and name != '_id_')
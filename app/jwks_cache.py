@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+import requests
+from jwt import PyJWK, PyJWKClientError
+from jwt.exceptions import PyJWKError
+
+logger = logging.getLogger(__name__)
+
+
+JWKS_CACHE_TTL = float(os.getenv('JWKS_CACHE_TTL', '3600'))
+JWKS_MIN_REFRESH_INTERVAL = float(os.getenv('JWKS_MIN_REFRESH_INTERVAL', '60'))
+JWKS_FETCH_TIMEOUT = float(os.getenv('JWKS_FETCH_TIMEOUT', '5'))
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+
+
+class JWKSCache:
+    """
+    Кэш ключей подписи из JWKS, ключ кэша - kid.
+    Ключи перечитываются по истечении ttl, а также при встрече неизвестного kid,
+    но не чаще одного раза в min_refresh_interval секунд.
+    """
+
+    def __init__(self, url, ttl=JWKS_CACHE_TTL, min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL,
+                 timeout=JWKS_FETCH_TIMEOUT, clock=time.monotonic):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._fetched_at = None
+        self._last_attempt = None
+
+    def _fetch(self):
+        try:
+            response = requests.get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+            jwks = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise PyJWKClientError(f'Fail to fetch data from the url, err: "{e}"')
+
+        keys = {}
+        for data in jwks.get('keys', []):
+            try:
+                key = PyJWK(data)
+            except PyJWKError:
+                continue
+            if key.key_id:
+                keys[key.key_id] = key
+        return keys
+
+    def _refresh(self, now):
+        self._last_attempt = now
+        try:
+            keys = self._fetch()
+        except PyJWKClientError as e:
+            # При недоступности JWKS продолжаем работать на старых ключах
+            if not self._keys:
+                raise
+            logger.warning(f"JWKS refresh failed, using cached keys: {e}")
+            return
+        self._keys = keys
+        self._fetched_at = now
+
+    def _can_refresh(self, now):
+        return self._last_attempt is None or now - self._last_attempt >= self.min_refresh_interval
+
+    def get_signing_key(self, kid):
+        with self._lock:
+            now = self._clock()
+            expired = self._fetched_at is None or now - self._fetched_at >= self.ttl
+            if expired and self._can_refresh(now):
+                self._refresh(now)
+
+            key = self._keys.get(kid)
+            if key is None and self._can_refresh(now):
+                self._refresh(now)
+                key = self._keys.get(kid)
+
+        if key is None:
+            raise PyJWKClientError(f'Unable to find a signing key that matches: "{kid}"')
+        return key
+
+    def get_signing_key_from_jwt(self, token):
+        header = jwt.get_unverified_header(token)
+        return self.get_signing_key(header.get('kid'))
+
+
+class TokenCache:
+    """
+    Ограниченный LRU-кэш уже проверенных токенов, запись живёт до exp токена
+    """
+
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE, clock=time.time):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def put(self, token, payload):
+        expires_at = payload.get('exp')
+        if not isinstance(expires_at, (int, float)):
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def decode_with_cache(token, jwks_cache, token_cache, **decode_kwargs):
+    """
+    Проверяет токен, используя кэш ключей и кэш уже проверенных токенов
+    """
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
+    signing_key = jwks_cache.get_signing_key_from_jwt(token)
+    payload = jwt.decode(token, signing_key.key, **decode_kwargs)
+    token_cache.put(token, payload)
+    return payload
+
@@ -0,0 +1,169 @@
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+DETAIL_LEASE_SECONDS = int(os.getenv('DETAIL_LEASE_SECONDS', '900'))
+DETAIL_CLAIM_BATCH = int(os.getenv('DETAIL_CLAIM_BATCH', '50'))
+# Сколько отправленное в очередь деталей объявление не выбирается повторно
+DETAIL_DISPATCH_TTL_SECONDS = int(os.getenv('DETAIL_DISPATCH_TTL_SECONDS', str(DETAIL_LEASE_SECONDS)))
+# Неразобранная страница откладывается на backoff * 2^(попытка-1), но не больше max,
+# а после DETAIL_MAX_ATTEMPTS неудач объявление больше не раздаётся
+DETAIL_RETRY_BACKOFF_SECONDS = int(os.getenv('DETAIL_RETRY_BACKOFF_SECONDS', '300'))
+DETAIL_RETRY_BACKOFF_MAX_SECONDS = int(os.getenv('DETAIL_RETRY_BACKOFF_MAX_SECONDS', '86400'))
+DETAIL_MAX_ATTEMPTS = int(os.getenv('DETAIL_MAX_ATTEMPTS', '5'))
+
+PENDING_STATE = 'first'
+PROCESSING_STATE = 'processing'
+PARKED_STATE = 'failed'
+LEASE_FIELDS = {'lease_owner': '', 'lease_expires': '', 'dispatched_at': ''}
+# Счётчик неудач снимается только после успешного разбора страницы
+RETRY_FIELDS = {'detail_attempts': '', 'next_attempt_at': ''}
+# Сначала старые объявления: случайный uuid5 в _id порядка не задаёт
+QUEUE_ORDER = [('created_at', 1), ('_id', 1)]
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def worker_id() -> str:
+    """
+    ID текущего процесса; считается при каждом вызове, чтобы после fork
+    дочерние процессы Celery получали свой
+    """
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _due(now) -> Dict:
+    return {'$or': [{'next_attempt_at': {'$exists': False}}, {'next_attempt_at': {'$lte': now}}]}
+
+
+def dispatchable_query(ids: Optional[List] = None, ttl_seconds: int = DETAIL_DISPATCH_TTL_SECONDS,
+                       clock=_utcnow) -> Dict:
+    """
+    Объявления в 'first', у которых подошло время повтора и которые ещё
+    не отправлены в очередь деталей или отправлены больше ttl_seconds назад
+    и так и не взяты воркером
+    """
+    now = clock()
+    query = {
+        'state': PENDING_STATE,
+        '$and': [
+            {'$or': [
+                {'dispatched_at': {'$exists': False}},
+                {'dispatched_at': {'$lt': now - timedelta(seconds=ttl_seconds)}},
+            ]},
+            _due(now),
+        ],
+    }
+    if ids is not None:
+        query['_id'] = {'$in': list(ids)}
+    return query
+
+
+def reserve_for_dispatch(coll, limit: int, ids: Optional[List] = None,
+                         ttl_seconds: int = DETAIL_DISPATCH_TTL_SECONDS, clock=_utcnow) -> List:
+    """
+    Отмечает dispatched_at до limit объявлений из dispatchable_query и возвращает
+    их ID. Следующий тик и наблюдатель их не выбирают, поэтому бюджет запросов
+    не тратится на пачки, которые уже ждут в очереди.
+    """
+    if limit <= 0:
+        return []
+    query = dispatchable_query(ids, ttl_seconds, clock)
+    candidates = [doc['_id'] for doc in coll.find(query, {'_id': 1}).sort(QUEUE_ORDER).limit(limit)]
+    if not candidates:
+        return []
+    now = clock()
+    coll.update_many(dict(query, _id={'$in': candidates}), {'$set': {'dispatched_at': now}})
+    # Параллельный вызов мог отметить часть кандидатов раньше - берём только свои
+    return [doc['_id'] for doc in coll.find({'_id': {'$in': candidates}, 'dispatched_at': now}, {'_id': 1})]
+
+
+def claim_listings(
+    coll,
+    owner: str,
+    limit: int = DETAIL_CLAIM_BATCH,
+    query: Optional[Dict] = None,
+    lease_seconds: int = DETAIL_LEASE_SECONDS,
+    clock=_utcnow,
+) -> List[Dict]:
+    """
+    Атомарно забирает до limit объявлений из 'first' в 'processing' с арендой
+    на lease_seconds. Каждый документ достаётся ровно одному воркеру, поэтому
+    параллельные запуски не парсят одни и те же страницы. Отложенные после
+    неудачи объявления не берутся, пока не подойдёт их время.
+    """
+    claimed = []
+    while len(claimed) < limit:
+        now = clock()
+        doc = coll.find_one_and_update(
+            {'$and': [dict(query or {}, state=PENDING_STATE), _due(now)]},
+            {'$set': {
+                'state': PROCESSING_STATE,
+                'lease_owner': owner,
+                'lease_expires': now + timedelta(seconds=lease_seconds),
+                'updated_at': now,
+            }},
+            sort=QUEUE_ORDER,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            break
+        claimed.append(doc)
+    return claimed
+
+
+def retry_delay(attempts: int, backoff: int = DETAIL_RETRY_BACKOFF_SECONDS,
+                max_delay: int = DETAIL_RETRY_BACKOFF_MAX_SECONDS) -> timedelta:
+    return timedelta(seconds=min(backoff * 2 ** (attempts - 1), max_delay))
+
+
+def release_listings(coll, ids: List, owner: str, max_attempts: int = DETAIL_MAX_ATTEMPTS, clock=_utcnow) -> int:
+    """
+    Возвращает в 'first' объявления, которые воркер не смог обработать, и
+    откладывает их следующую раздачу с растущей паузой. После max_attempts
+    неудач (снятое объявление, постоянная ошибка разбора) объявление уходит
+    в 'failed': иначе такие страницы занимали бы весь бюджет каждого тика.
+    """
+    if not ids:
+        return 0
+    now = clock()
+    owned = {'_id': {'$in': list(ids)}, 'state': PROCESSING_STATE, 'lease_owner': owner}
+    by_attempts: Dict[int, List] = {}
+    for doc in coll.find(owned, {'detail_attempts': 1}):
+        by_attempts.setdefault(doc.get('detail_attempts', 0) + 1, []).append(doc['_id'])
+
+    released = 0
+    for attempts, attempt_ids in by_attempts.items():
+        if attempts >= max_attempts:
+            update = {'state': PARKED_STATE, 'detail_attempts': attempts, 'updated_at': now}
+            logger.warning(f"Parked {len(attempt_ids)} listings in {coll.name} after {attempts} failed attempts")
+        else:
+            update = {'state': PENDING_STATE, 'detail_attempts': attempts,
+                      'next_attempt_at': now + retry_delay(attempts), 'updated_at': now}
+        result = coll.update_many(dict(owned, _id={'$in': attempt_ids}), {'$set': update, '$unset': LEASE_FIELDS})
+        released += result.modified_count
+    return released
+
+
+def reap_expired_leases(coll, clock=_utcnow) -> int:
+    """
+    Возвращает в 'first' объявления, аренда которых истекла
+    (воркер упал или завис, не закончив обработку)
+    """
+    now = clock()
+    result = coll.update_many(
+        {'state': PROCESSING_STATE, 'lease_expires': {'$lt': now}},
+        {'$set': {'state': PENDING_STATE, 'updated_at': now}, '$unset': LEASE_FIELDS},
+    )
+    if result.modified_count:
+        logger.warning(f"Returned {result.modified_count} expired leases in {coll.name}")
+    return result.modified_count
@@ -1,11 +1,12 @@
 from flask import Flask, request, jsonify
 from flask_restful import Api, Resource, reqparse
 from database import get_client
-import jwt
-from jwt import PyJWKClient, InvalidTokenError
+from jwt import InvalidTokenError, PyJWKClientError
+from jwks_cache import JWKSCache, TokenCache, decode_with_cache
 import os
 from dotenv import load_dotenv
 from tasks import *
+from services import API_PROJECTION
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,21 +23,22 @@ api = Api(app)
 AUDIENCE = os.getenv('AZURE_CLIENT_ID')
 ISSUER = f'https://login.microsoftonline.com/{AZURE_TENANT_ID}/v2.0'
 
+jwks_cache = JWKSCache(JWKS_URL)
+token_cache = TokenCache()
+
 
 def validate_token(token):
     try:
-        jwks_client = PyJWKClient(JWKS_URL)
-        signing_key = jwks_client.get_signing_key_from_jwt(token)
-
-        payload = jwt.decode(
+        payload = decode_with_cache(
             token,
-            signing_key.key,
+            jwks_cache,
+            token_cache,
             algorithms=["RS256"],
             audience=AUDIENCE,
             issuer=ISSUER,
         )
         return payload
-    except InvalidTokenError as e:
+    except (InvalidTokenError, PyJWKClientError) as e:
         print(f"Token validation error: {str(e)}")
         return None
 
@@ -61,7 +63,7 @@ class Apartment(Resource):
         if not payload:
             return {"error": "Invalid or expired token"}, 402
 
-        apartment = coll.find_one(filter={'_id': id})
+        apartment = coll.find_one(filter={'_id': id}, projection=API_PROJECTION)
 
         if apartment:
             return apartment
@@ -88,7 +90,7 @@ class Rent(Resource):
         if not payload:
             return {"error": "Invalid or expired token"}, 402
 
-        rent = coll.find_one(filter={'_id': id})
+        rent = coll.find_one(filter={'_id': id}, projection=API_PROJECTION)
 
         if rent:
             return rent
@@ -166,4 +168,5 @@ api.add_resource(Rent, "/rent/<id>")
 
 
 if __name__ == "__main__":
+    ensure_all_indexes()
     app.run(host='0.0.0.0', port=5000)
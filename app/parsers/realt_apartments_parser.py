@@ -1,8 +1,11 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 
-import requests
-from bs4 import BeautifulSoup
 import fake_useragent
+from crawler import ListingPage
+from http_cache import get_http_cache
+from http_client import get_http_client
+from rate_limiter import rate_limited
+from parsers.realt_extractor import extract_detail, collect_listing_links
 from uuid import UUID, uuid5
 
 
@@ -13,65 +16,37 @@ def stable_uuid_for(link: str) -> str:
     return str(uuid5(NAMESPACE_APARTMENTS, link))
 
 
-def parse_all_apartments_ids_from_realt() -> List[Dict]:
-    session = requests.Session()
-    url = "https://realt.by/belarus/sale/flats/?page=1&sortType=createdAt"
+def parse_all_apartments_ids_from_realt(page: int = 1, skip_unchanged: bool = True) -> Optional[List[Dict]]:
+    session = rate_limited(get_http_client())
+    url = f"https://realt.by/belarus/sale/flats/?page={page}&sortType=createdAt"
     headers = {'user-agent': fake_useragent.UserAgent().random}
 
-    response = session.get(url, headers=headers)
-    soup = BeautifulSoup(response.text, 'lxml')
-
-    block = soup.find('div', class_="t-0 l-0 absolute w-full")
-    if not block:
-        return []
-
-    apartment_ids = []
-
-    apartments = block.find_all('div', attrs={'data-index': True})
+    result = get_http_cache().fetch_streamed(
+        session, url, lambda chunks: collect_listing_links(chunks), headers=headers,
+        defer_save=True,
+    )
+    if skip_unchanged and not result.changed:
+        return None
 
-    for apt in apartments:
-        apt_tag = apt.find('a', class_='z-1 absolute top-0 left-0 w-full h-full cursor-pointer')
-        apt_link = 'https://realt.by' + apt_tag.get('href') if apt_tag else None
-        if apt_link:
-            apt_id = stable_uuid_for(apt_link)
-            apartment_ids.append({'_id': apt_id, 'link': apt_link, 'state': 'first'})
+    # Страница отмечается в кэше через commit(), когда объявления уже в базе
+    links = result.value
+    if links is None:
+        return ListingPage(commit=result.commit)
 
-    return apartment_ids
+    return ListingPage(
+        [{'_id': stable_uuid_for(link), 'link': link, 'state': 'first'} for link in links],
+        commit=result.commit,
+    )
 
 
 def parse_apartment_data_from_realt(url: str):
-    session = requests.Session()
+    session = rate_limited(get_http_client())
     headers = {'user-agent': fake_useragent.UserAgent().random}
 
+    # Страница деталей запрашивается один раз на объявление, поэтому в HTTP-кэш
+    # она не пишется: кэш хранит только страницы списка
     response = session.get(url, headers=headers)
-    soup = BeautifulSoup(response.text, 'lxml')
-
-    title = soup.find('h1', class_='order-1 mb-0.5 md:-order-2 md:mb-4 block w-full !inline-block lg:text-h1Lg text-h1 font-raleway font-bold flex items-center').text
-    price = soup.find('h2', class_='!inline-block mr-1 lg:text-h2Lg text-h2 font-raleway font-bold flex items-center').text
-    title = title.replace('\xa0', ' ').strip()
-    price = price.replace('\xa0', ' ').strip()
-    description_section = soup.find('h3', string='Описание')
-    description = ''
-    if description_section:
-        desc_div = description_section.find_next('div', class_='text-basic-900')
-        if desc_div:
-            description = desc_div.get_text(separator="\n").replace('\xa0', ' ').strip()
-    data = {'title': title, 'price': price, 'description': description}
-
-    for li in soup.select('ul.w-full.-my-1 > li'):
-        key = li.select_one('span.text-basic').get_text(strip=True)
-        divs = li.find_all('div', class_='w-1/2')
-        if len(divs) >= 2:
-            value_p = divs[1].find('p')
-            value = value_p.get_text(strip=True) if value_p else None
-            if value is None:
-                value_p = divs[1].find('a')
-                value = value_p.get_text(strip=True) if value_p else None
-                value = value.replace('\xa0', ' ').strip()
-        else:
-            value = None
-        data[key] = value
-
+    data = extract_detail(response.text)
     data['state'] = 'second'
     data['link'] = url
     data['_id'] = stable_uuid_for(url)
@@ -0,0 +1,197 @@
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from lxml import etree
+
+
+# Классы элементов страниц realt.by, по которым ищутся данные
+TITLE_CLASS = 'order-1 mb-0.5 md:-order-2 md:mb-4 block w-full !inline-block lg:text-h1Lg text-h1 font-raleway font-bold flex items-center'
+PRICE_CLASS = '!inline-block mr-1 lg:text-h2Lg text-h2 font-raleway font-bold flex items-center'
+LISTING_BLOCK_CLASS = 't-0 l-0 absolute w-full'
+LISTING_LINK_CLASS = 'z-1 absolute top-0 left-0 w-full h-full cursor-pointer'
+LISTING_ID_SPAN_CLASS = 'relative z-[2]'
+
+
+def _class_is(value):
+    # Совпадение всего атрибута class, как у BeautifulSoup с class_='a b c'
+    return f'normalize-space(@class)="{value}"'
+
+
+def _has_class(name):
+    # Совпадение одного класса из списка, как у CSS-селектора .name
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+
+# Выражения компилируются один раз при импорте модуля
+_TITLE = etree.XPath(f'(//h1[{_class_is(TITLE_CLASS)}])[1]')
+_PRICE = etree.XPath(f'(//h2[{_class_is(PRICE_CLASS)}])[1]')
+_DESCRIPTION = etree.XPath(f'(//h3[.="Описание"])[1]/following::div[{_has_class("text-basic-900")}][1]')
+_PROPERTY_ITEMS = etree.XPath(f'//ul[{_has_class("w-full")} and {_has_class("-my-1")}]/li')
+_PROPERTY_KEY = etree.XPath(f'(.//span[{_has_class("text-basic")}])[1]')
+_PROPERTY_VALUE_CELLS = etree.XPath(f'.//div[{_has_class("w-1/2")}]')
+_FIRST_P = etree.XPath('(.//p)[1]')
+_FIRST_A = etree.XPath('(.//a)[1]')
+
+_LISTING_BLOCK = etree.XPath(f'(//div[{_class_is(LISTING_BLOCK_CLASS)}])[1]')
+_LISTING_CARDS = etree.XPath('.//div[@data-index]')
+_LISTING_LINK = etree.XPath(f'(.//a[{_class_is(LISTING_LINK_CLASS)}])[1]')
+_LISTING_ID_SPAN = etree.XPath(f'(.//span[{_class_is(LISTING_ID_SPAN_CLASS)}])[1]')
+
+_SKIP_TEXT_TAGS = {'script', 'style', 'template'}
+
+_local = threading.local()
+
+
+def _parser():
+    # Парсер lxml не потокобезопасен, поэтому держим по одному на поток
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        parser = _local.parser = etree.HTMLParser(encoding='utf-8')
+    return parser
+
+
+def parse_html(text: str):
+    if not text:
+        return None
+    return etree.fromstring(text.encode('utf-8'), _parser())
+
+
+def _strings(element):
+    # Текстовые узлы поддерева без комментариев и содержимого script/style
+    if not isinstance(element.tag, str) or element.tag in _SKIP_TEXT_TAGS:
+        return
+    if element.text:
+        yield element.text
+    for child in element:
+        yield from _strings(child)
+        if child.tail:
+            yield child.tail
+
+
+def _text(element, separator=''):
+    return separator.join(_strings(element))
+
+
+def _stripped_text(element):
+    return ''.join(s.strip() for s in _strings(element) if s.strip())
+
+
+def _first(xpath, element):
+    found = xpath(element)
+    return found[0] if found else None
+
+
+def extract_detail(text: str) -> Dict:
+    """
+    Достаёт заголовок, цену, описание и таблицу характеристик со страницы объявления
+    """
+    root = parse_html(text)
+    if root is None:
+        raise ValueError('Empty page')
+
+    title = _first(_TITLE, root)
+    price = _first(_PRICE, root)
+    if title is None or price is None:
+        raise ValueError('Title or price block not found')
+
+    description = ''
+    desc_div = _first(_DESCRIPTION, root)
+    if desc_div is not None:
+        description = _text(desc_div, separator='\n').replace('\xa0', ' ').strip()
+
+    data = {
+        'title': _text(title).replace('\xa0', ' ').strip(),
+        'price': _text(price).replace('\xa0', ' ').strip(),
+        'description': description,
+    }
+
+    for li in _PROPERTY_ITEMS(root):
+        key_span = _first(_PROPERTY_KEY, li)
+        if key_span is None:
+            continue
+        value = None
+        cells = _PROPERTY_VALUE_CELLS(li)
+        if len(cells) >= 2:
+            value_p = _first(_FIRST_P, cells[1])
+            if value_p is not None:
+                value = _stripped_text(value_p)
+            else:
+                value_a = _first(_FIRST_A, cells[1])
+                if value_a is not None:
+                    value = _stripped_text(value_a).replace('\xa0', ' ').strip()
+        data[_stripped_text(key_span)] = value
+
+    return data
+
+
+def _card_link(card, require_id_span):
+    if require_id_span and _first(_LISTING_ID_SPAN, card) is None:
+        return None
+    anchor = _first(_LISTING_LINK, card)
+    href = anchor.get('href') if anchor is not None else None
+    return 'https://realt.by' + href if href else None
+
+
+def extract_listing_links(text: str, require_id_span: bool = False) -> Optional[List[str]]:
+    """
+    Достаёт ссылки на объявления из карточек выдачи.
+    None - если на странице нет блока с результатами.
+    """
+    root = parse_html(text)
+    if root is None:
+        return None
+
+    block = _first(_LISTING_BLOCK, root)
+    if block is None:
+        return None
+
+    links = [_card_link(card, require_id_span) for card in _LISTING_CARDS(block)]
+    return [link for link in links if link]
+
+
+class ListingLinkStream:
+    """
+    Потоковый разбор страницы выдачи: ссылки отдаются по мере закрытия карточек,
+    а чтение chunks прекращается сразу после конца блока с результатами.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], require_id_span: bool = False):
+        self.chunks = chunks
+        self.require_id_span = require_id_span
+        self.block_found = False
+
+    def __iter__(self) -> Iterator[str]:
+        parser = etree.HTMLPullParser(events=('start', 'end'), encoding='utf-8')
+        block = None
+
+        for chunk in self.chunks:
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if block is None:
+                    if event == 'start' and element.tag == 'div' \
+                            and ' '.join(element.get('class', '').split()) == LISTING_BLOCK_CLASS:
+                        block = element
+                        self.block_found = True
+                    continue
+                if event != 'end':
+                    continue
+                if element is block:
+                    return
+                if element.tag == 'div' and element.get('data-index') is not None:
+                    link = _card_link(element, self.require_id_span)
+                    # Разобранная карточка больше не нужна, освобождаем память
+                    element.clear(keep_tail=True)
+                    if link:
+                        yield link
+
+        parser.close()
+
+
+def collect_listing_links(chunks: Iterable[bytes], require_id_span: bool = False) -> Optional[List[str]]:
+    """
+    То же, что extract_listing_links, но по потоку байтов.
+    None - если на странице нет блока с результатами.
+    """
+    stream = ListingLinkStream(chunks, require_id_span)
+    links = list(stream)
+    return links if stream.block_found else None
@@ -0,0 +1,272 @@
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+# Сколько копить события перед запуском задач: пачка вставок списка
+# превращается в одну раздачу деталей, а не в задачу на каждое объявление
+PIPELINE_DETAIL_DEBOUNCE_SECONDS = float(os.getenv('PIPELINE_DETAIL_DEBOUNCE_SECONDS', '2'))
+PIPELINE_WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv('PIPELINE_WEBHOOK_DEBOUNCE_SECONDS', '10'))
+# Повторно отданный ID не раздаётся, пока не истечёт аренда деталей
+PIPELINE_DEDUP_SECONDS = float(os.getenv('PIPELINE_DEDUP_SECONDS', os.getenv('DETAIL_LEASE_SECONDS', '900')))
+PIPELINE_POLL_SECONDS = float(os.getenv('PIPELINE_POLL_SECONDS', '15'))
+PIPELINE_POLL_LIMIT = int(os.getenv('PIPELINE_POLL_LIMIT', '500'))
+PIPELINE_MAX_AWAIT_MS = int(os.getenv('PIPELINE_MAX_AWAIT_MS', '1000'))
+
+# Новые объявления из списка и завершённые (или переведённые заново) детали
+CHANGE_PIPELINE = [{'$match': {'$or': [
+    {'operationType': 'insert', 'fullDocument.state': 'first'},
+    {'operationType': 'update', 'updateDescription.updatedFields.changed_at': {'$exists': True}},
+]}}]
+
+# Код ошибки standalone-сервера: change streams есть только у replica set
+CHANGE_STREAM_UNSUPPORTED = 40573
+# Токен продолжения уже вытеснен из oplog (ChangeStreamHistoryLost, InvalidResumeToken)
+RESUME_TOKEN_LOST = {286, 260}
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+class PipelineSink:
+    """
+    Копит события одного вида объявлений и запускает задачи не чаще, чем
+    раз в debounce: детали - для накопленных ID, вебхук - один на все изменения
+    """
+
+    def __init__(self, kind, on_details: Callable[[str, List], None], on_webhook: Callable[[str], None],
+                 detail_debounce=PIPELINE_DETAIL_DEBOUNCE_SECONDS, webhook_debounce=PIPELINE_WEBHOOK_DEBOUNCE_SECONDS,
+                 dedup_seconds=PIPELINE_DEDUP_SECONDS, clock=time.monotonic):
+        self.kind = kind
+        self.on_details = on_details
+        self.on_webhook = on_webhook
+        self.detail_debounce = detail_debounce
+        self.webhook_debounce = webhook_debounce
+        self.dedup_seconds = dedup_seconds
+        self.clock = clock
+        self._pending = {}
+        self._pending_since = None
+        self._changed_since = None
+        self._dispatched: Dict = {}
+
+    def pending(self, _id):
+        now = self.clock()
+        dispatched_at = self._dispatched.get(_id)
+        if dispatched_at is not None and now - dispatched_at < self.dedup_seconds:
+            return
+        if self._pending_since is None:
+            self._pending_since = now
+        self._pending[_id] = None
+
+    def changed(self):
+        if self._changed_since is None:
+            self._changed_since = self.clock()
+
+    @property
+    def idle(self) -> bool:
+        """
+        Всё накопленное уже передано в задачи
+        """
+        return not self._pending and self._changed_since is None
+
+    def flush(self, force=False) -> bool:
+        """
+        Запускает накопленное, если вышло время ожидания. True, если что-то запущено
+        """
+        now = self.clock()
+        fired = False
+        if self._pending and (force or now - self._pending_since >= self.detail_debounce):
+            ids = list(self._pending)
+            self.on_details(self.kind, ids)
+            self._dispatched = {key: at for key, at in self._dispatched.items() if now - at < self.dedup_seconds}
+            self._dispatched.update(dict.fromkeys(ids, now))
+            self._pending = {}
+            self._pending_since = None
+            fired = True
+        if self._changed_since is not None and (force or now - self._changed_since >= self.webhook_debounce):
+            self.on_webhook(self.kind)
+            self._changed_since = None
+            fired = True
+        return fired
+
+
+def handle_change(change, sink: PipelineSink):
+    if change['operationType'] == 'insert':
+        sink.pending(change['documentKey']['_id'])
+    else:
+        sink.changed()
+
+
+def load_resume_token(state_coll, name):
+    doc = state_coll.find_one({'_id': name})
+    return doc.get('resume_token') if doc else None
+
+
+def save_resume_token(state_coll, name, token, clock=_utcnow):
+    state_coll.update_one(
+        {'_id': name},
+        {'$set': {'resume_token': token, 'updated_at': clock()}},
+        upsert=True,
+    )
+
+
+def drop_resume_token(state_coll, name):
+    state_coll.update_one({'_id': name}, {'$unset': {'resume_token': ''}})
+
+
+def supports_change_streams(coll) -> bool:
+    # У mongomock метода watch нет совсем, standalone-сервер откажет при открытии потока
+    return callable(getattr(type(coll), 'watch', None))
+
+
+def run_change_stream(coll, state_coll, name, sink: PipelineSink, stop: threading.Event,
+                      max_await_ms=PIPELINE_MAX_AWAIT_MS):
+    """
+    Читает change stream коллекции. Токен продолжения сохраняется после того,
+    как события переданы в задачи, поэтому после перезапуска ничего не теряется
+    """
+    token = load_resume_token(state_coll, name)
+    saved = token
+    with coll.watch(CHANGE_PIPELINE, resume_after=token, max_await_time_ms=max_await_ms) as stream:
+        logger.info(f"Слежу за change stream {name}")
+        while not stop.is_set():
+            change = stream.try_next()
+            if change is not None:
+                handle_change(change, sink)
+                continue
+            # Поток пуст: запускаем накопленное и фиксируем позицию
+            sink.flush()
+            if sink.idle and stream.resume_token != saved:
+                saved = stream.resume_token
+                save_resume_token(state_coll, name, saved)
+        sink.flush(force=True)
+
+
+def poll_once(coll, sink: PipelineSink, last_changed, limit=PIPELINE_POLL_LIMIT):
+    """
+    Один проход опроса: объявления в 'first' и документы с changed_at новее
+    last_changed (любые, если он None). Возвращает новый last_changed
+    """
+    for doc in coll.find({'state': 'first'}, {'_id': 1}).limit(limit):
+        sink.pending(doc['_id'])
+    query = {'changed_at': {'$gt': last_changed}} if last_changed is not None else {'changed_at': {'$exists': True}}
+    latest = coll.find_one(query, {'changed_at': 1}, sort=[('changed_at', -1)])
+    if latest:
+        last_changed = latest['changed_at']
+        sink.changed()
+    return last_changed
+
+
+def run_polling(coll, sink: PipelineSink, stop: threading.Event, interval=PIPELINE_POLL_SECONDS,
+                limit=PIPELINE_POLL_LIMIT):
+    """
+    Запасной вариант без change streams: раз в interval ищет объявления в 'first'
+    и документы с changed_at новее последнего увиденного
+    """
+    last_changed = None
+    latest = coll.find_one({'changed_at': {'$exists': True}}, {'changed_at': 1}, sort=[('changed_at', -1)])
+    if latest:
+        last_changed = latest['changed_at']
+
+    while True:
+        last_changed = poll_once(coll, sink, last_changed, limit)
+        sink.flush()
+        if stop.wait(interval):
+            break
+    sink.flush(force=True)
+
+
+def watch_collection(coll, state_coll, name, sink: PipelineSink, stop: threading.Event):
+    """
+    Change stream, если сервер его поддерживает, иначе опрос по состоянию
+    """
+    if supports_change_streams(coll):
+        try:
+            return run_change_stream(coll, state_coll, name, sink, stop)
+        except OperationFailure as e:
+            if e.code in RESUME_TOKEN_LOST:
+                # Пропущенные события уже не прочитать: забываем токен, один раз
+                # проходим коллекцию опросом и открываем поток с текущего момента
+                logger.warning(f"Токен продолжения {name} устарел, разовый опрос и новый поток: {e}")
+                drop_resume_token(state_coll, name)
+                poll_once(coll, sink, None)
+                sink.flush(force=True)
+                return run_change_stream(coll, state_coll, name, sink, stop)
+            if e.code != CHANGE_STREAM_UNSUPPORTED:
+                raise
+            logger.warning(f"Change streams недоступны для {name}, переключаюсь на опрос: {e}")
+    return run_polling(coll, sink, stop)
+
+
+def _dispatch_details(kind, ids):
+    # Тот же общий бюджет запросов, что и у schedule_detail_parsing: что не влезло,
+    # заберёт следующий тик расписания
+    import tasks
+    backlog = {kind: tasks.count_dispatchable(kind, ids)}
+    plan, dispatched = tasks.dispatch_planned_details(backlog, {kind: ids})
+    if kind in dispatched:
+        result = dispatched[kind]
+        logger.info(f"Запущен парсинг деталей {kind}: {result['ids']} ID в {result['chunks']} пачках")
+    elif backlog[kind]:
+        logger.info(f"Бюджет запросов исчерпан, {backlog[kind]} ID {kind} ждут тика расписания")
+
+
+def _dispatch_webhook(kind):
+    import tasks
+    task = tasks.send_apartments_webhook_to_django if kind == 'apartments' else tasks.send_rent_webhook_to_django
+    task.delay()
+    logger.info(f"Поставлен в очередь вебхук {kind}")
+
+
+def _supervise(target, stop, *args, retry_seconds=5):
+    # Ни обрыв соединения с Mongo, ни ошибка брокера при запуске задач не останавливают
+    # наблюдение: поток открывается заново с сохранённого токена
+    while not stop.is_set():
+        try:
+            target(*args, stop)
+        except Exception as e:
+            logger.exception(f"Наблюдение за {args[2]} прервано, перезапуск: {e}")
+            stop.wait(retry_seconds)
+
+
+def main(stop: Optional[threading.Event] = None):
+    from database import get_client
+
+    client = get_client()
+    stop = stop or threading.Event()
+    targets = [
+        ('apartments', client.apartments, 'apartments'),
+        ('rent', client.rental, 'rental'),
+    ]
+    threads = []
+    for kind, db, collection in targets:
+        sink = PipelineSink(kind, _dispatch_details, _dispatch_webhook)
+        thread = threading.Thread(
+            target=_supervise,
+            args=(watch_collection, stop, db[collection], db.pipeline_state, collection, sink),
+            name=f'watch-{kind}',
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+    except KeyboardInterrupt:
+        stop.set()
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,383 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+# Общий для всех процессов потолок запросов к одному хосту
+REALT_RATE_PER_SECOND = float(os.getenv('REALT_RATE_PER_SECOND', '4'))
+REALT_RATE_BURST = float(os.getenv('REALT_RATE_BURST', '8'))
+REALT_MAX_CONCURRENCY = int(os.getenv('REALT_MAX_CONCURRENCY', '8'))
+
+# Сколько запрос может ждать токен или слот, прежде чем сдаться
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '120'))
+RATE_SLOT_POLL_SECONDS = float(os.getenv('RATE_SLOT_POLL_SECONDS', '0.05'))
+# Слот освобождается сам, если процесс упал, не вернув его
+RATE_SLOT_LEASE_SECONDS = int(os.getenv('RATE_SLOT_LEASE_SECONDS', '60'))
+
+# Пауза для хоста после 429/5xx: base * 2^(n-1) подряд идущих ошибок, не больше max
+RATE_BACKOFF_BASE = float(os.getenv('RATE_BACKOFF_BASE', '2'))
+RATE_BACKOFF_MAX = float(os.getenv('RATE_BACKOFF_MAX', '300'))
+RATE_LIMIT_RETRIES = int(os.getenv('RATE_LIMIT_RETRIES', '2'))
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'redis')  # redis | local
+RATE_KEY_PREFIX = 'ratelimit:'
+
+
+class RateLimitTimeout(RuntimeError):
+    pass
+
+
+def _host(url) -> str:
+    return urlsplit(url or '').netloc
+
+
+def parse_retry_after(value, now=None) -> Optional[float]:
+    """
+    Retry-After в секундах: число или HTTP-дата. None, если заголовка нет или он битый
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - (now or datetime.now(timezone.utc))).total_seconds())
+
+
+def backoff_delay(strikes, retry_after=None, base=RATE_BACKOFF_BASE, maximum=RATE_BACKOFF_MAX) -> float:
+    if retry_after is not None:
+        return min(retry_after, maximum)
+    return min(base * 2 ** (strikes - 1), maximum)
+
+
+class LocalRateStore:
+    """
+    Токены, слоты и паузы в памяти процесса: запасной вариант без Redis.
+    Логика та же, что у Lua-скриптов RedisRateStore
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._blocked = {}
+        self._strikes = {}
+        self._slots = {}
+
+    def take(self, host, rate, burst) -> float:
+        with self._lock:
+            now = self.clock()
+            blocked = self._blocked.get(host, 0.0)
+            if blocked > now:
+                return blocked - now
+            tokens, ts = self._buckets.get(host, (burst, now))
+            tokens = min(burst, tokens + max(0.0, now - ts) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[host] = (tokens, now)
+            return wait
+
+    def penalize(self, host, retry_after=None, base=RATE_BACKOFF_BASE, maximum=RATE_BACKOFF_MAX) -> float:
+        with self._lock:
+            strikes = self._strikes[host] = self._strikes.get(host, 0) + 1
+            delay = backoff_delay(strikes, retry_after, base, maximum)
+            self._blocked[host] = max(self._blocked.get(host, 0.0), self.clock() + delay)
+            return delay
+
+    def forgive(self, host):
+        with self._lock:
+            self._strikes.pop(host, None)
+
+    def try_slot(self, host, limit, lease=RATE_SLOT_LEASE_SECONDS) -> Optional[str]:
+        with self._lock:
+            now = self.clock()
+            slots = {token: expires for token, expires in self._slots.get(host, {}).items() if expires > now}
+            self._slots[host] = slots
+            if len(slots) >= limit:
+                return None
+            token = uuid.uuid4().hex
+            slots[token] = now + lease
+            return token
+
+    def release_slot(self, host, token):
+        with self._lock:
+            self._slots.get(host, {}).pop(token, None)
+
+
+# Токен-бакет; время берётся у Redis, чтобы часы воркеров не расходились.
+# Возвращает строкой, сколько ждать до следующей попытки (0 - токен выдан)
+_TAKE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local blocked = tonumber(redis.call('GET', KEYS[2]) or '0')
+if blocked > now then
+    return tostring(blocked - now)
+end
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+"""
+
+# Пауза хоста после 429/5xx: растёт с числом ошибок подряд или берётся из Retry-After
+_PENALIZE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local retry_after = tonumber(ARGV[1])
+local base = tonumber(ARGV[2])
+local maximum = tonumber(ARGV[3])
+local strikes = redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], math.ceil(maximum * 2))
+local delay
+if retry_after >= 0 then
+    delay = math.min(retry_after, maximum)
+else
+    delay = math.min(base * 2 ^ (strikes - 1), maximum)
+end
+local blocked = math.max(tonumber(redis.call('GET', KEYS[1]) or '0'), now + delay)
+redis.call('SET', KEYS[1], tostring(blocked), 'EX', math.ceil(delay) + 1)
+return tostring(delay)
+"""
+
+# Слот одновременного запроса: элемент sorted set со сроком аренды в score
+_SLOT_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[3])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]) * 2)
+return 1
+"""
+
+
+class RedisRateStore:
+    """
+    Токены, слоты и паузы в Redis: лимит общий для всех процессов Celery
+    """
+
+    def __init__(self, client, prefix=RATE_KEY_PREFIX):
+        self.client = client
+        self.prefix = prefix
+        self._take = client.register_script(_TAKE_SCRIPT)
+        self._penalize = client.register_script(_PENALIZE_SCRIPT)
+        self._slot = client.register_script(_SLOT_SCRIPT)
+
+    def _key(self, kind, host):
+        return f'{self.prefix}{kind}:{host}'
+
+    def take(self, host, rate, burst) -> float:
+        return float(self._take(keys=[self._key('bucket', host), self._key('blocked', host)], args=[rate, burst]))
+
+    def penalize(self, host, retry_after=None, base=RATE_BACKOFF_BASE, maximum=RATE_BACKOFF_MAX) -> float:
+        args = [-1 if retry_after is None else retry_after, base, maximum]
+        return float(self._penalize(keys=[self._key('blocked', host), self._key('strikes', host)], args=args))
+
+    def forgive(self, host):
+        self.client.delete(self._key('strikes', host))
+
+    def try_slot(self, host, limit, lease=RATE_SLOT_LEASE_SECONDS) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if self._slot(keys=[self._key('slots', host)], args=[limit, lease, token]):
+            return token
+        return None
+
+    def release_slot(self, host, token):
+        self.client.zrem(self._key('slots', host), token)
+
+
+class FallbackRateStore:
+    """
+    Основное хранилище с переходом на локальное при ошибке, чтобы
+    недоступный Redis не останавливал парсинг
+    """
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+
+    def _call(self, method, *args):
+        try:
+            return getattr(self.primary, method)(*args)
+        except Exception as e:
+            logger.warning(f"Rate limit store {method} failed, using local limits: {e}")
+            return getattr(self.fallback, method)(*args)
+
+    def take(self, host, rate, burst):
+        return self._call('take', host, rate, burst)
+
+    def penalize(self, host, retry_after=None, base=RATE_BACKOFF_BASE, maximum=RATE_BACKOFF_MAX):
+        return self._call('penalize', host, retry_after, base, maximum)
+
+    def forgive(self, host):
+        return self._call('forgive', host)
+
+    def try_slot(self, host, limit, lease=RATE_SLOT_LEASE_SECONDS):
+        return self._call('try_slot', host, limit, lease)
+
+    def release_slot(self, host, token):
+        # Токен мог выдать любой из двух, неизвестный токен просто игнорируется
+        try:
+            self.primary.release_slot(host, token)
+        except Exception as e:
+            logger.warning(f"Rate limit store release_slot failed: {e}")
+        self.fallback.release_slot(host, token)
+
+
+class RateLimiter:
+    """
+    Перед запросом ждёт токен и свободный слот хоста, после ответа
+    ставит хост на паузу при 429/5xx
+    """
+
+    def __init__(self, store, rate=REALT_RATE_PER_SECOND, burst=REALT_RATE_BURST,
+                 concurrency=REALT_MAX_CONCURRENCY, max_wait=RATE_LIMIT_MAX_WAIT,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.store = store
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self._strikes = set()
+
+    def _wait(self, host, deadline, wait):
+        if self.clock() + wait > deadline:
+            raise RateLimitTimeout(f"Rate limit for {host} not acquired in {self.max_wait:g}s")
+        self.sleep(wait)
+
+    def acquire(self, host) -> str:
+        deadline = self.clock() + self.max_wait
+        while True:
+            wait = self.store.take(host, self.rate, self.burst)
+            if wait <= 0:
+                break
+            self._wait(host, deadline, wait)
+        while True:
+            token = self.store.try_slot(host, self.concurrency)
+            if token is not None:
+                return token
+            self._wait(host, deadline, RATE_SLOT_POLL_SECONDS)
+
+    def release(self, host, token):
+        self.store.release_slot(host, token)
+
+    @contextmanager
+    def slot(self, url):
+        host = _host(url)
+        token = self.acquire(host)
+        try:
+            yield host
+        finally:
+            self.release(host, token)
+
+    def observe(self, host, status_code, retry_after=None) -> float:
+        """
+        Учитывает ответ хоста. Возвращает паузу в секундах, если запрос стоит повторить
+        """
+        if status_code in RETRYABLE_STATUSES:
+            delay = self.store.penalize(host, parse_retry_after(retry_after))
+            self._strikes.add(host)
+            logger.warning(f"{host} answered {status_code}, backing off for {delay:g}s")
+            return delay
+        if host in self._strikes:
+            # Сбрасываем счётчик, только если этот процесс его увеличивал
+            self._strikes.discard(host)
+            self.store.forgive(host)
+        return 0.0
+
+
+class RateLimitedClient:
+    """
+    Обёртка над httpx.Client с методами get и stream, которые использует HttpCache.
+    Ответы 429/5xx повторяются после паузы до RATE_LIMIT_RETRIES раз.
+    """
+
+    def __init__(self, client, limiter, retries=RATE_LIMIT_RETRIES):
+        self.client = client
+        self.limiter = limiter
+        self.retries = retries
+
+    def get(self, url, **kwargs):
+        attempt = 0
+        while True:
+            with self.limiter.slot(url) as host:
+                response = self.client.get(url, **kwargs)
+            delay = self.limiter.observe(host, response.status_code, response.headers.get('Retry-After'))
+            if not delay or attempt >= self.retries:
+                return response
+            attempt += 1
+
+    @contextmanager
+    def stream(self, method, url, **kwargs):
+        attempt = 0
+        while True:
+            with self.limiter.slot(url) as host:
+                with self.client.stream(method, url, **kwargs) as response:
+                    delay = self.limiter.observe(host, response.status_code, response.headers.get('Retry-After'))
+                    if not delay or attempt >= self.retries:
+                        yield response
+                        return
+            attempt += 1
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def _make_store(backend):
+    if backend == 'redis':
+        from redis_client import get_redis
+        return FallbackRateStore(RedisRateStore(get_redis()), LocalRateStore())
+    return LocalRateStore()
+
+
+def get_rate_limiter():
+    """
+    Общий для процесса лимитер, хранилище выбирается через RATE_LIMIT_BACKEND
+    """
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(_make_store(RATE_LIMIT_BACKEND))
+    return _limiter
+
+
+def rate_limited(client):
+    """
+    Оборачивает HTTP-клиент общим лимитером процесса
+    """
+    return RateLimitedClient(client, get_rate_limiter())
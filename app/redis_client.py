@@ -0,0 +1,30 @@
+import os
+import threading
+
+import redis
+
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+
+# Короткие таймауты: Redis здесь служебный, без него код переходит на локальный запасной вариант
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', '2'))
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_redis():
+    """
+    Общий для процесса клиент Redis. Пул соединений redis-py сам
+    пересоздаётся в дочернем процессе после fork
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = redis.Redis.from_url(
+                    REDIS_URL,
+                    socket_timeout=REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+                )
+    return _client
@@ -1,56 +1,242 @@
 from database import get_apartments_db, get_rental_db
 from parsers.realt_apartments_parser import parse_all_apartments_ids_from_realt, parse_apartment_data_from_realt
 from parsers.realt_rent_parser import parse_rent_data_from_realt, parse_all_rent_ids_from_realt
-from translator import transform_mongo_apartments_to_django, transform_mongo_rent_to_django
-import requests
+from translator import (
+    transform_mongo_apartments_to_django, transform_mongo_rent_to_django,
+    get_translator, raw_hash, TRANSLATE_BATCH_SIZE,
+)
+from fetcher import fetch_details
+from crawler import commit_listing_pages, crawl_new_listings, find_known_ids
+from bulk import BulkWriter
+from leases import (
+    LEASE_FIELDS, RETRY_FIELDS, claim_listings, dispatchable_query, reap_expired_leases, release_listings,
+    reserve_for_dispatch, worker_id,
+)
+from webhooks import WEBHOOK_MODE, deliver_deltas, deliver_full, process_retry_queue, webhook_client
+from indexes import LISTING_INDEXES, WEBHOOK_RETRY_INDEXES, ensure_indexes, index_usage, unused_indexes
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from itertools import islice
+from datetime import datetime, timezone
+
+DUPLICATE_KEY_ERROR = 11000
+
+APARTMENTS_WEBHOOK_URL = 'http://django:8000/apartments-webhook-endpoint/'
+RENT_WEBHOOK_URL = 'http://django:8000/rent-webhook-endpoint/'
+
+# Служебные поля парсера, которые не входят в сырую запись
+RAW_SERVICE_FIELDS = ('_id', 'state')
+
+# Метка изменения ставится временем сервера в момент записи: время процесса
+# на начало долгой пачки может оказаться старше отметки вебхуков, и документ
+# не попадёт в дельту
+CHANGE_STAMP = {'changed_at': True, 'updated_at': True}
+
+# Служебные поля пайплайна, которые API не отдаёт: сырая запись парсера,
+# аренда и метки времени (datetime flask-restful в JSON не кодирует)
+API_HIDDEN_FIELDS = (
+    'raw', 'raw_hash', 'translator_version', *LEASE_FIELDS, *RETRY_FIELDS,
+    'changed_at', 'sent_at', 'sent_version', 'created_at', 'updated_at',
+)
+API_PROJECTION = dict.fromkeys(API_HIDDEN_FIELDS, 0)
+
+
+def insert_new_listings(coll, parsed):
+    """
+    Вставляет только ещё неизвестные объявления. Проверка идёт по ID текущей пачки,
+    а гонки с параллельными запусками гасятся неупорядоченной вставкой
+    с пропуском ошибок дублирования ключа.
+    """
+    known = find_known_ids(coll, [doc.get('_id') for doc in parsed])
+    new_docs = [doc for doc in parsed if doc.get('_id') not in known]
+    if not new_docs:
+        return []
+
+    now = datetime.now(timezone.utc)
+    for doc in new_docs:
+        doc.setdefault('created_at', now)
+        doc['updated_at'] = now
+
+    try:
+        coll.insert_many(new_docs, ordered=False)
+    except BulkWriteError as e:
+        write_errors = e.details.get('writeErrors', [])
+        if any(err.get('code') != DUPLICATE_KEY_ERROR for err in write_errors):
+            raise
+        duplicates = {err['index'] for err in write_errors}
+        new_docs = [doc for index, doc in enumerate(new_docs) if index not in duplicates]
+
+    return new_docs
+
+
+def attach_raw(data, pre_data, kind):
+    """
+    Сохраняет рядом с переведённым документом сырую запись парсера, её хэш
+    и версию переводчика, чтобы потом перевести заново без повторного парсинга
+    """
+    raw = {key: value for key, value in pre_data.items() if key not in RAW_SERVICE_FIELDS}
+    data['raw'] = raw
+    data['raw_hash'] = raw_hash(raw)
+    data['translator_version'] = get_translator(kind).version
+    return data
+
+
+def retranslate_collection(coll, kind, batch_size=TRANSLATE_BATCH_SIZE, verify_hashes=False):
+    """
+    Переводит заново документы с сохранённой сырой записью, у которых сменилась
+    версия переводчика. С verify_hashes проверяются все документы, и пересчитываются
+    также те, чья сырая запись изменилась после перевода. Пишутся только изменившиеся поля.
+    """
+    translator = get_translator(kind)
+    query = {'raw': {'$exists': True}}
+    if not verify_hashes:
+        query['translator_version'] = {'$ne': translator.version}
+
+    stats = {'scanned': 0, 'translated': 0}
+    cursor = iter(coll.find(query, sort=[('_id', 1)], batch_size=batch_size))
+
+    with BulkWriter(coll) as writer:
+        while True:
+            batch = list(islice(cursor, batch_size))
+            if not batch:
+                break
+            stats['scanned'] += len(batch)
+
+            stale = []
+            for doc in batch:
+                current_hash = raw_hash(doc['raw'])
+                if doc.get('raw_hash') != current_hash or doc.get('translator_version') != translator.version:
+                    stale.append((doc, current_hash))
+            if not stale:
+                continue
+
+            translated = translator.translate_many([doc['raw'] for doc, _ in stale])
+            for (doc, current_hash), data in zip(stale, translated):
+                changes = {key: value for key, value in data.items() if doc.get(key) != value}
+                update = {'$set': changes}
+                if changes:
+                    # Изменившийся перевод уйдёт в следующий дельта-вебхук
+                    update['$currentDate'] = CHANGE_STAMP
+                changes['raw_hash'] = current_hash
+                changes['translator_version'] = translator.version
+                writer.add(UpdateOne({'_id': doc['_id']}, update))
+            stats['translated'] += len(stale)
+
+    stats['modified'] = writer.modified_count
+    return stats
 
 
 def put_apartments_list_from_realt_to_mongo():
     try:
         with get_apartments_db() as db:
             coll = db.apartments
-            parsed_apartments = parse_all_apartments_ids_from_realt()
+            parsed_apartments = crawl_new_listings(
+                parse_all_apartments_ids_from_realt,
+                lambda ids: find_known_ids(coll, ids),
+            )
             if not parsed_apartments:
+                commit_listing_pages(parsed_apartments)
                 print("No new apartments found during parsing")
                 return []
 
-            existing_ids = {doc["_id"] for doc in coll.find({}, {"_id": 1})}
-            new_apartments = [apt for apt in parsed_apartments if apt.get("_id") not in existing_ids]
-
-            if new_apartments:
-                coll.insert_many(new_apartments)
-
-            return new_apartments
+            inserted = insert_new_listings(coll, parsed_apartments)
+            # Страницы списка отмечаются в HTTP-кэше только после записи объявлений
+            commit_listing_pages(parsed_apartments)
+            return inserted
     except Exception as e:
         print(f'Database connection error: {e}')
         return []
 
 
+def update_listing_details(coll, docs, parse_fn, transform_fn, kind, owner):
+    """
+    Парсит страницы арендованных воркером owner объявлений docs, переводит
+    и пачками пишет в coll, снимая аренду. Запись идёт только пока аренда
+    принадлежит owner: если её забрал другой воркер, документ не трогается.
+    Возвращает число изменённых документов и ID страниц, которые не удалось разобрать.
+    """
+    failed_ids = []
+    with BulkWriter(coll) as writer:
+        for doc, pre_data, error in fetch_details(docs, parse_fn):
+            current_id = doc.get('_id')
+            if error is not None:
+                failed_ids.append(current_id)
+                continue
+            data = transform_fn(pre_data)
+            data['state'] = 'second'
+            attach_raw(data, pre_data, kind)
+            if data:
+                writer.add(UpdateOne(
+                    {'_id': current_id, 'lease_owner': owner},
+                    {'$set': data, '$unset': {**LEASE_FIELDS, **RETRY_FIELDS}, '$currentDate': CHANGE_STAMP},
+                ))
+
+    return writer.modified_count, failed_ids
+
+
+def drain_listing_details(coll, parse_fn, transform_fn, kind, query=None):
+    """
+    Забирает объявления в 'first' пачками через аренду и обрабатывает их,
+    пока они не кончатся. Параллельные запуски делят очередь без повторных
+    запросов к realt.by. Неразобранные страницы возвращаются в 'first'
+    в конце прогона, чтобы не крутить их по кругу.
+    Возвращает число обновлённых документов или None, если обрабатывать было нечего.
+    """
+    owner = worker_id()
+    reap_expired_leases(coll)
+
+    claimed_any = False
+    updated_count = 0
+    failed_ids = []
+    try:
+        while True:
+            docs = claim_listings(coll, owner, query=query)
+            if not docs:
+                break
+            claimed_any = True
+            updated, failed = update_listing_details(coll, docs, parse_fn, transform_fn, kind, owner)
+            updated_count += updated
+            failed_ids.extend(failed)
+    finally:
+        release_listings(coll, failed_ids, owner)
+
+    return updated_count if claimed_any else None
+
+
+def list_first_state_ids(coll, limit=None):
+    cursor = coll.find({'state': 'first'}, {'_id': 1})
+    if limit:
+        cursor = cursor.limit(limit)
+    return [doc['_id'] for doc in cursor]
+
+
+def list_apartment_ids_to_update(limit=None):
+    with get_apartments_db() as db:
+        return list_first_state_ids(db.apartments, limit)
+
+
+def put_apartment_details_chunk(ids):
+    """
+    Обрабатывает одну пачку ID для fan-out задач; ошибки базы пробрасываются,
+    чтобы задача пачки могла повториться
+    """
+    with get_apartments_db() as db:
+        return drain_listing_details(
+            db.apartments, parse_apartment_data_from_realt, transform_mongo_apartments_to_django, 'apartments',
+            query={'_id': {'$in': list(ids)}},
+        ) or 0
+
+
 def put_apartment_info_from_realt_to_mongo():
     try:
         with get_apartments_db() as db:
-            coll = db.apartments
-
-            new_apartments = list(coll.find({'state': 'first'}))
-            if not new_apartments:
+            updated_count = drain_listing_details(
+                db.apartments, parse_apartment_data_from_realt, transform_mongo_apartments_to_django, 'apartments'
+            )
+            if updated_count is None:
                 print("No new apartments to update")
                 return None
 
-            updated_count = 0
-            for apartment in new_apartments:
-                current_id = apartment.get('_id')
-                pre_data = parse_apartment_data_from_realt(apartment.get('link'))
-                data = transform_mongo_apartments_to_django(pre_data)
-                data['state'] = 'second'
-                if data:
-                    result = coll.update_one(
-                        {'_id': current_id},
-                        {'$set': data},
-                        upsert=True
-                    )
-                    if result.modified_count > 0:
-                        updated_count += 1
-
             print(f"Updated {updated_count} apartments")
             return updated_count
     except Exception as e:
@@ -58,28 +244,24 @@ def put_apartment_info_from_realt_to_mongo():
         return []
 
 
+def send_webhook(db, coll, kind, url):
+    """
+    Доставляет объявления в Django пачками (ID или сами документы, см. WEBHOOK_PAYLOAD);
+    неотправленные пачки остаются в очереди повторов db.webhook_retries
+    """
+    with webhook_client(url, coll, kind) as client:
+        if WEBHOOK_MODE == 'delta':
+            sent = deliver_deltas(coll, db.webhook_state, db.webhook_retries, kind, client)
+        else:
+            sent = deliver_full(coll, db.webhook_retries, kind, client)
+    print(f'Webhook delivered {len(sent)} {kind} to django')
+    return sent
+
+
 def send_apartments_ids_webhook_to_django():
     try:
         with get_apartments_db() as db:
-            coll = db.apartments
-
-            django_webhook_url = 'http://django:8000/apartments-webhook-endpoint/'
-            headers = {'Content-Type': 'application/json'}
-            new_apartments = [str(apartment.get('_id')) for apartment in coll.find({'state': 'second'})]
-
-            try:
-                response = requests.post(
-                    django_webhook_url,
-                    json={'ids': new_apartments},
-                    headers=headers,
-                    timeout=10
-                )
-                response.raise_for_status()
-                print('Webhook send successfully to django')
-                return new_apartments
-            except requests.exceptions.RequestException as e:
-                print(f'Error sending webhook to Django: {e}')
-                raise
+            return send_webhook(db, db.apartments, 'apartments', APARTMENTS_WEBHOOK_URL)
     except Exception as e:
         print(f'Database connection error: {e}')
         return []
@@ -89,48 +271,47 @@ def put_rent_list_from_realt_to_mongo():
     try:
         with get_rental_db() as db:
             coll = db.rental
-            parsed_rents = parse_all_rent_ids_from_realt()
+            parsed_rents = crawl_new_listings(
+                parse_all_rent_ids_from_realt,
+                lambda ids: find_known_ids(coll, ids),
+            )
             if not parsed_rents:
+                commit_listing_pages(parsed_rents)
                 print("No new apartments found during parsing")
                 return []
 
-            existing_ids = {doc["_id"] for doc in coll.find({}, {"_id": 1})}
-            new_rents = [rent for rent in parsed_rents if rent.get("_id") not in existing_ids]
-
-            if new_rents:
-                coll.insert_many(new_rents)
-
-            return new_rents
+            inserted = insert_new_listings(coll, parsed_rents)
+            # Страницы списка отмечаются в HTTP-кэше только после записи объявлений
+            commit_listing_pages(parsed_rents)
+            return inserted
     except Exception as e:
         print(f'Database connection error: {e}')
         return []
 
 
+def list_rent_ids_to_update(limit=None):
+    with get_rental_db() as db:
+        return list_first_state_ids(db.rental, limit)
+
+
+def put_rent_details_chunk(ids):
+    with get_rental_db() as db:
+        return drain_listing_details(
+            db.rental, parse_rent_data_from_realt, transform_mongo_rent_to_django, 'rent',
+            query={'_id': {'$in': list(ids)}},
+        ) or 0
+
+
 def put_rent_info_from_realt_to_mongo():
     try:
         with get_rental_db() as db:
-            coll = db.rental
-
-            new_rents = list(coll.find({'state': 'first'}))
-            if not new_rents:
+            updated_count = drain_listing_details(
+                db.rental, parse_rent_data_from_realt, transform_mongo_rent_to_django, 'rent'
+            )
+            if updated_count is None:
                 print("No new apartments to update")
                 return None
 
-            updated_count = 0
-            for rent in new_rents:
-                current_id = rent.get('_id')
-                pre_data = parse_rent_data_from_realt(rent.get('link'))
-                data = transform_mongo_rent_to_django(pre_data)
-                data['state'] = 'second'
-                if data:
-                    result = coll.update_one(
-                        {'_id': current_id},
-                        {'$set': data},
-                        upsert=True
-                    )
-                    if result.modified_count > 0:
-                        updated_count += 1
-
             print(f"Updated {updated_count} apartments")
             return updated_count
     except Exception as e:
@@ -141,29 +322,135 @@ def put_rent_info_from_realt_to_mongo():
 def send_rent_ids_webhook_to_django():
     try:
         with get_rental_db() as db:
-            coll = db.rental
-
-            django_webhook_url = 'http://django:8000/rent-webhook-endpoint/'
-            headers = {'Content-Type': 'application/json'}
-            new_rents = [str(rent.get('_id')) for rent in coll.find({'state': 'second'})]
-
-            try:
-                response = requests.post(
-                    django_webhook_url,
-                    json={'ids': new_rents},
-                    headers=headers,
-                    timeout=10
-                )
-                response.raise_for_status()
-                print('Webhook send successfully to django')
-                return new_rents
-            except requests.exceptions.RequestException as e:
-                print(f'Error sending webhook to Django: {e}')
-                raise
+            return send_webhook(db, db.rental, 'rent', RENT_WEBHOOK_URL)
     except Exception as e:
         print(f'Database connection error: {e}')
         return []
 
 
+def reap_detail_leases():
+    """
+    Возвращает в очередь объявления с истёкшей арендой (упавшие воркеры)
+    """
+    try:
+        with get_apartments_db() as db:
+            apartments = reap_expired_leases(db.apartments)
+        with get_rental_db() as db:
+            rent = reap_expired_leases(db.rental)
+        return {'apartments': apartments, 'rent': rent}
+    except Exception as e:
+        print(f'Database connection error: {e}')
+        return {}
+
+
+def _detail_collection(kind):
+    if kind == 'apartments':
+        return get_apartments_db, 'apartments'
+    return get_rental_db, 'rental'
+
+
+def count_dispatchable(kind, ids=None):
+    """
+    Сколько объявлений вида kind (или из ids) можно отправить в очередь деталей
+    """
+    get_db, collection = _detail_collection(kind)
+    with get_db() as db:
+        return db[collection].count_documents(dispatchable_query(ids))
+
+
+def reserve_detail_ids(kind, limit, ids=None):
+    """
+    Забирает для очереди деталей до limit ещё не отправленных объявлений
+    """
+    get_db, collection = _detail_collection(kind)
+    with get_db() as db:
+        return reserve_for_dispatch(db[collection], limit, ids)
+
+
+def count_detail_backlog():
+    """
+    Сколько объявлений каждого вида ждёт парсинга деталей и ещё не отправлено
+    в очередь: уже отправленные пачки не должны тратить бюджет второй раз
+    """
+    return {kind: count_dispatchable(kind) for kind in ('apartments', 'rent')}
+
+
+def retry_webhooks():
+    """
+    Досылает пачки вебхуков из очередей повторов, у которых подошло время
+    """
+    targets = [
+        ('apartments', get_apartments_db, 'apartments', APARTMENTS_WEBHOOK_URL),
+        ('rent', get_rental_db, 'rental', RENT_WEBHOOK_URL),
+    ]
+    stats = {}
+    for kind, get_db, collection, url in targets:
+        try:
+            with get_db() as db, webhook_client(url, db[collection], kind) as client:
+                stats[kind] = process_retry_queue(db.webhook_retries, db[collection], kind, client)
+        except Exception as e:
+            print(f'Database connection error: {e}')
+    return stats
+
+
+def retranslate(kind, verify_hashes=False):
+    databases = {
+        'apartments': (get_apartments_db, 'apartments'),
+        'rent': (get_rental_db, 'rental'),
+    }
+    get_db, collection = databases[kind]
+    try:
+        with get_db() as db:
+            stats = retranslate_collection(db[collection], kind, verify_hashes=verify_hashes)
+            print(f"Retranslated {stats['translated']} of {stats['scanned']} {kind}, modified {stats['modified']}")
+            return stats
+    except Exception as e:
+        print(f'Database connection error: {e}')
+        return {}
+
+
+def _listing_collections():
+    return [
+        ('apartments', get_apartments_db, 'apartments'),
+        ('rent', get_rental_db, 'rental'),
+    ]
+
+
+def ensure_all_indexes():
+    """
+    Создаёт индексы коллекций объявлений и очередей повторов вебхуков.
+    Вызывается при старте воркеров и API, повторный вызов ничего не меняет
+    """
+    report = {}
+    for kind, get_db, collection in _listing_collections():
+        try:
+            with get_db() as db:
+                report[kind] = ensure_indexes(db[collection], LISTING_INDEXES)
+                report[f'{kind}_webhook_retries'] = ensure_indexes(db.webhook_retries, WEBHOOK_RETRY_INDEXES)
+        except Exception as e:
+            print(f'Database connection error: {e}')
+    return report
+
+
+def report_index_usage():
+    """
+    Использование индексов коллекций объявлений по $indexStats и список
+    индексов, к которым не было ни одного обращения
+    """
+    report = {}
+    for kind, get_db, collection in _listing_collections():
+        try:
+            with get_db() as db:
+                usage = index_usage(db[collection])
+        except Exception as e:
+            print(f'Database connection error: {e}')
+            continue
+        report[kind] = {'usage': usage, 'unused': unused_indexes(usage)}
+        if usage:
+            print(f"Index usage for {collection}: " + ', '.join(
+                f"{name}={stats['ops']}" for name, stats in sorted(usage.items())))
+    return report
+
+
 if __name__ == '__main__':
     put_apartment_info_from_realt_to_mongo()
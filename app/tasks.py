@@ -1,9 +1,39 @@
 from app_celery import celery
+from celery import chord
+from celery.signals import worker_ready
 from services import *
+from adaptive_schedule import plan_detail_requests, record_list_run
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# Сколько объявлений обрабатывает одна задача-пачка
+DETAIL_CHUNK_SIZE = int(os.getenv('DETAIL_CHUNK_SIZE', '50'))
+DETAIL_CHUNK_RETRY_COUNTDOWN = int(os.getenv('DETAIL_CHUNK_RETRY_COUNTDOWN', '30'))
+
+
+def dispatch_detail_chunks(chunk_task, ids, kind):
+    """
+    Раскладывает ID по пачкам и запускает chord: задачи-пачки расходятся
+    по всем воркерам, итог собирает aggregate_detail_results
+    """
+    chunks = [ids[i:i + DETAIL_CHUNK_SIZE] for i in range(0, len(ids), DETAIL_CHUNK_SIZE)]
+    result = chord(chunk_task.s(chunk) for chunk in chunks)(aggregate_detail_results.s(kind))
+    return {'chunks': len(chunks), 'ids': len(ids), 'chord_id': result.id}
+
+
+def run_detail_chunk(task, put_chunk, ids):
+    try:
+        processed = int(put_chunk(ids) or 0)
+        return {'status': 'success', 'ids': len(ids), 'details_processed': processed}
+    except Exception as e:
+        logger.error(f"Ошибка обработки пачки из {len(ids)} объявлений: {e}")
+        if task.request.retries >= task.max_retries:
+            # Пачка не валит весь chord: итог увидит её как неуспешную
+            return {'status': 'error', 'ids': len(ids), 'details_processed': 0, 'error': str(e)}
+        raise task.retry(exc=e, countdown=DETAIL_CHUNK_RETRY_COUNTDOWN)
+
 
 @celery.task(name='tasks.parse_apartment_list', bind=True)
 def parse_apartment_list(self):
@@ -14,6 +44,7 @@ def parse_apartment_list(self):
         logger.info("Начало парсинга списка квартир")
         result = put_apartments_list_from_realt_to_mongo() or []
         logger.info(f"Успешно спаршено {len(result)} квартир")
+        record_list_run('apartments_list', len(result))
         return {'status': 'success', 'count': len(result)}
     except Exception as e:
         logger.error(f"Ошибка парсинга списка: {e}")
@@ -23,19 +54,50 @@ def parse_apartment_list(self):
 @celery.task(name='tasks.parse_apartment_details', bind=True)
 def parse_apartment_details(self):
     """
-    Запуск парсинга деталей отдельной квартиры
+    Запуск парсинга деталей квартир: объявления в состоянии 'first'
+    раздаются пачками отдельным задачам
     """
     try:
         logger.info("Начало парсинга деталей квартир")
-        result = put_apartment_info_from_realt_to_mongo()
-        processed = int(result or 0)
-        logger.info(f"Успешно обработано {processed} деталей квартир")
-        return {'status': 'success', 'details_processed': processed}
+        ids = list_apartment_ids_to_update()
+        if not ids:
+            logger.info("Нет квартир для обновления")
+            return {'status': 'success', 'details_processed': 0}
+        result = dispatch_detail_chunks(parse_apartment_details_chunk, ids, 'apartments')
+        logger.info(f"Запущено {result['chunks']} пачек для {result['ids']} квартир")
+        return {'status': 'dispatched', **result}
     except Exception as e:
         logger.error(f"Ошибка парсинга деталей: {e}")
         raise self.retry(exc=e, countdown=60, max_retries=3)
 
 
+@celery.task(name='tasks.parse_apartment_details_chunk', bind=True, max_retries=3,
+             acks_late=True, reject_on_worker_lost=True)
+def parse_apartment_details_chunk(self, ids):
+    """
+    Парсинг деталей одной пачки квартир. Повтор безопасен: берутся только
+    ещё не обработанные объявления пачки
+    """
+    return run_detail_chunk(self, put_apartment_details_chunk, ids)
+
+
+@celery.task(name='tasks.aggregate_detail_results')
+def aggregate_detail_results(results, kind):
+    """
+    Сводит результаты задач-пачек одного запуска
+    """
+    processed = sum(r.get('details_processed', 0) for r in results)
+    failed = [r for r in results if r.get('status') != 'success']
+    logger.info(f"Детали {kind}: обработано {processed}, неуспешных пачек {len(failed)} из {len(results)}")
+    return {
+        'status': 'success' if not failed else 'partial',
+        'kind': kind,
+        'chunks': len(results),
+        'details_processed': processed,
+        'failed_chunks': len(failed),
+    }
+
+
 @celery.task(name='tasks.send_apartments_webhook_to_django', bind=True)
 def send_apartments_webhook_to_django(self):
     """
@@ -59,6 +121,7 @@ def parse_rent_list(self):
         logger.info("Начало парсинга списка арендных квартир")
         result = put_rent_list_from_realt_to_mongo() or []
         logger.info(f"Успешно спаршено {len(result)} арендных квартир")
+        record_list_run('rent_list', len(result))
         return {'status': 'success', 'count': len(result)}
     except Exception as e:
         logger.error(f"Ошибка парсинга списка: {e}")
@@ -68,19 +131,31 @@ def parse_rent_list(self):
 @celery.task(name='tasks.parse_rent_details', bind=True)
 def parse_rent_details(self):
     """
-    Запуск парсинга деталей отдельной арендной квартиры
+    Запуск парсинга деталей арендных квартир пачками
     """
     try:
         logger.info("Начало парсинга деталей арендных квартир")
-        result = put_rent_info_from_realt_to_mongo()
-        processed = int(result or 0)
-        logger.info(f"Успешно обработано {processed} деталей арендных квартир")
-        return {'status': 'success', 'details_processed': processed}
+        ids = list_rent_ids_to_update()
+        if not ids:
+            logger.info("Нет арендных квартир для обновления")
+            return {'status': 'success', 'details_processed': 0}
+        result = dispatch_detail_chunks(parse_rent_details_chunk, ids, 'rent')
+        logger.info(f"Запущено {result['chunks']} пачек для {result['ids']} арендных квартир")
+        return {'status': 'dispatched', **result}
     except Exception as e:
         logger.error(f"Ошибка парсинга деталей: {e}")
         raise self.retry(exc=e, countdown=60, max_retries=3)
 
 
+@celery.task(name='tasks.parse_rent_details_chunk', bind=True, max_retries=3,
+             acks_late=True, reject_on_worker_lost=True)
+def parse_rent_details_chunk(self, ids):
+    """
+    Парсинг деталей одной пачки арендных квартир
+    """
+    return run_detail_chunk(self, put_rent_details_chunk, ids)
+
+
 @celery.task(name='tasks.send_rent_webhook_to_django', bind=True)
 def send_rent_webhook_to_django(self):
     """
@@ -93,3 +168,78 @@ def send_rent_webhook_to_django(self):
     except Exception as e:
         logger.error(f"Error in send_webhook_to_django task: {e}")
         raise self.retry(exc=e, countdown=60, max_retries=3)
+
+
+@celery.task(name='tasks.retry_webhooks')
+def retry_webhooks_task():
+    """
+    Досылает неотправленные пачки вебхуков из очередей повторов
+    """
+    stats = retry_webhooks()
+    return {'status': 'success', **stats}
+
+
+def dispatch_planned_details(backlog, candidates=None):
+    """
+    Берёт из общего бюджета запросов план на backlog и раздаёт пачками
+    ещё не отправленные объявления. candidates ограничивает выбор ID
+    по видам; остальное дождётся следующего тика
+    """
+    chunk_tasks = {'apartments': parse_apartment_details_chunk, 'rent': parse_rent_details_chunk}
+    plan = plan_detail_requests(backlog)
+    dispatched = {}
+    for kind, limit in plan.items():
+        ids = reserve_detail_ids(kind, limit, (candidates or {}).get(kind))
+        if ids:
+            dispatched[kind] = dispatch_detail_chunks(chunk_tasks[kind], ids, kind)
+    return plan, dispatched
+
+
+@celery.task(name='tasks.schedule_detail_parsing')
+def schedule_detail_parsing():
+    """
+    Периодический тик: запускает парсинг деталей для накопившейся очереди
+    в пределах бюджета запросов к realt.by
+    """
+    plan, dispatched = dispatch_planned_details(count_detail_backlog())
+    if dispatched:
+        logger.info(f"Запущен парсинг деталей: {plan}")
+    return {'status': 'success', 'planned': plan, 'dispatched': dispatched}
+
+
+@celery.task(name='tasks.reap_expired_leases')
+def reap_expired_leases_task():
+    """
+    Возвращает в 'first' объявления, аренду которых не закрыл упавший воркер
+    """
+    result = reap_detail_leases()
+    return {'status': 'success', **result}
+
+
+@worker_ready.connect
+def ensure_indexes_on_startup(**kwargs):
+    # Индексы создаются при старте каждого воркера; уже существующие пропускаются
+    report = ensure_all_indexes()
+    logger.info(f"Indexes ensured: {report}")
+
+
+@celery.task(name='tasks.report_index_usage')
+def report_index_usage_task():
+    """
+    Статистика использования индексов коллекций объявлений
+    """
+    return {'status': 'success', **report_index_usage()}
+
+
+@celery.task(name='tasks.retranslate', bind=True)
+def retranslate_task(self, kind='apartments', verify_hashes=False):
+    """
+    Перевод заново сохранённых сырых записей после изменения маппинга
+    """
+    try:
+        logger.info(f"Retranslating {kind}")
+        stats = retranslate(kind, verify_hashes=verify_hashes) or {}
+        return {'status': 'success', **stats}
+    except Exception as e:
+        logger.error(f"Error in retranslate task: {e}")
+        raise self.retry(exc=e, countdown=60, max_retries=3)
@@ -1,531 +1,480 @@
+import hashlib
 import json
+import os
+import threading
+from functools import lru_cache
+from itertools import islice
+from operator import methodcaller
 
 
-def transform_mongo_apartments_to_django(mongo_data):
-    """
-    Переводит русские поля коллекции Apartments в mongo на английский и подгоняет под структуру API
-    """
-    DEFAULT_VALUES = {
-        # Обязательные поля для Location
-        'building.location.street': 'Не указана',
-        'building.location.house_number': '0',
-        'building.location.town.name': 'Не указан',
-        'building.location.town.region.name': 'Не указан',
-
-        # Обязательные поля для Apartment
-        'title': 'Без названия',
-        'price': 0.0,
-        'total_area': 0.0,
-        'room_count': 1,
-        'description': 'Нет описания',
-        'floor': 1,
-    }
-    # Инициализируем структуру как в API
-    django_data = {
-        "building": {
-            "location": {
-                "town": {
-                    "region": {
-                        "name": DEFAULT_VALUES['building.location.town.region.name']
-                    },
-                    "name": DEFAULT_VALUES['building.location.town.name']
-                },
-                "district": "",
-                "microdistrict": "",
-                "street": DEFAULT_VALUES['building.location.street'],
-                "house_number": DEFAULT_VALUES['building.location.house_number'],
-                "latitude": None,
-                "longitude": None
-            },
-            "floors_total": None,
-            "wall_material": "",
-            "construction_year": None,
-            "house_amenities": "",
-            "parking": ""
-        },
-        "images": [],
-        "title": DEFAULT_VALUES['title'],
-        "price": DEFAULT_VALUES['price'],
-        "total_area": DEFAULT_VALUES['total_area'],
-        "living_area": None,
-        "kitchen_area": None,
-        "balcony_area": None,
-        "balcony": None,
-        "room_count": DEFAULT_VALUES['room_count'],
-        "description": DEFAULT_VALUES['description'],
-        "floor": DEFAULT_VALUES['floor'],
-        "sale_conditions": None,
-        "bathroom_count": None,
-        "ceiling_height": None,
-        "renovation": "",
-        "condition": "New",
-        "contract_number": "",
-        "contract_date": None,
-        "level_count": None,
-        "ownership_type": None,
-        "link": ""
-    }
-
-    # Разделим маппинг на разные типы полей
-    direct_mapping = {
-        "title": "title",
-        "link": "link",
-        "description": "description",
-        "contract_number": "Номер договора",
-        "renovation": "Ремонт"
-    }
-
-    numeric_mapping = {
-        "price": ("price", lambda x: float(x.replace(" р.", "").replace(" ", "").replace(",", ".")) if isinstance(mongo_data.get("price"), str) else ("price", float)),
-        "total_area": ("Площадь общая", lambda x: float(x.replace(" м²", "").replace(",", "."))),
-        "living_area": ("Площадь жилая", lambda x: float(x.replace(" м²", "").replace(",", "."))),
-        "kitchen_area": ("Площадь кухни", lambda x: float(x.replace(" м²", "").replace(",", "."))),
-        "room_count": ("Количество комнат", int),
-        "ceiling_height": ("Высота потолков", lambda x: float(x.replace(" м", "").replace(",", "."))),
-        "construction_year": ("Год постройки", int)
-    }
-
-    choice_mapping = {
-        "balcony": {
-            "field": "Балкон",
-            "choices": {
-                "Лоджия": "Loggia",
-                "Балкон": "Classic",
-                "Французский балкон": "French",
-                "Угловой балкон": "Extended",
-                "Нет": "No",
-                "Отсутствует": "No"
-            },
-            'default': 'No'
-        },
-        "sale_conditions": {
-            "field": "Условия продажи",
-            "choices": {
-                "Чистая продажа": "Open",
-                "Свободная продажа": "Open",
-                "Альтернативная": "Alternative",
-                "Альтернатива": "Alternative",
-                "Условная": "Condition",
-                "С условием": "Condition"
-            },
-            'default': 'Open'
-        },
-        "condition": {
-            "field": "Состояние",
-            "choices": {
-                "Новостройка": "New",
-                "С ремонтом": "Almost",
-                "Хорошее": "Good",
-                "Удовлетворительное": "Fair",
-                "Требует ремонта": "Renovation",
-                "Аварийное": "Uninhabitable"
-            },
-            'default': 'New'
-        },
-        "ownership_type": {
-            "field": "Собственность",
-            "choices": {
-                "Частная": "Private",
-                "Приватная": "Private",
-                "Государственная": "State",
-                "Гос.": "State",
-                "Совместная": "Joint",
-                "Долевая": "Shared",
-                "Коллективная": "Collective",
-                "Иностранная": "Foreign"
-            },
-            'default': 'Private'
-        },
-        "wall_material": {
-            "field": "Тип дома",
-            "choices": {
-                "Панельный": "Panel",
-                "Кирпичный": "Brick",
-                "Монолитный": "Monolithic",
-                "Блочный": "Block"
-            },
-            'default': 'Panel'
-        }
-    }
-
-    # Обрабатываем прямые поля
-    for django_field, mongo_field in direct_mapping.items():
-        if mongo_field in mongo_data:
-            django_data[django_field] = str(mongo_data[mongo_field])
-
-    # Обрабатываем числовые поля
-    for django_field, (mongo_field, converter) in numeric_mapping.items():
-        if mongo_field in mongo_data:
-            try:
-                value = converter(mongo_data[mongo_field])
-                if django_field == "construction_year":
-                    # поле вложенное
-                    django_data["building"]["construction_year"] = value
-                else:
-                    django_data[django_field] = value
-            except (ValueError, TypeError, AttributeError):
-                pass
-
-    # Обрабатываем выборные поля
-    for django_field, config in choice_mapping.items():
-        mongo_field = config["field"]
-        if mongo_field in mongo_data:
-            value = mongo_data[mongo_field]
-            mapped = config["choices"].get(value, config["default"])
-            if django_field == "wall_material":
-                # кладём в нужное вложенное поле
-                django_data["building"]["wall_material"] = mapped
-            else:
-                django_data[django_field] = mapped
-
-    # Обрабатываем этажи
-    if "Этаж / этажность" in mongo_data:
-        try:
-            floor, floors_total = [x.strip() for x in mongo_data["Этаж / этажность"].split("/")]
-            django_data["floor"] = int(floor)
-            django_data["building"]["floors_total"] = int(floors_total)
-        except (ValueError, AttributeError):
-            pass
-
-    # Обрабатываем координаты
-    if "Координаты" in mongo_data:
-        try:
-            coords = mongo_data["Координаты"].split(",")
-            if len(coords) == 2:
-                lat, lon = [x.strip() for x in coords]
-                django_data["building"]["location"]["latitude"] = float(lat)
-                django_data["building"]["location"]["longitude"] = float(lon)
-        except (ValueError, AttributeError):
-            pass
-
-    # Заполняем адресные данные
-    address_fields = {
-        "building.location.town.region.name": ["Область", "Обл.", "Регион"],
-        "building.location.town.name": ["Населенный пункт", "Город", "г."],
-        "building.location.district": ["Район", "Р-н"],
-        "building.location.street": ["Улица", "ул.", "Адрес"],
-        "building.location.house_number": ["Дом", "Номер дома", "№ дома"]
-    }
-
-    for path, mongo_fields in address_fields.items():
-        for field in mongo_fields:
-            if field in mongo_data:
-                # Устанавливаем значение по пути в структуре
-                keys = path.split('.')
-                current = django_data
-                for key in keys[:-1]:
-                    current = current.setdefault(key, {})
-                current[keys[-1]] = str(mongo_data[field])
-                break
+# Ошибки разбора значения, при которых поле остаётся со значением по умолчанию
+CONVERSION_ERRORS = (ValueError, TypeError, AttributeError, IndexError)
 
-    return django_data
+# Значение, которое конвертер возвращает для цели, которую не нужно трогать
+MISSING = object()
 
+# Метка "поля нет в записи или конвертер не справился" для кэша и пакетного режима
+_FAILED = object()
 
-def transform_mongo_rent_to_django(mongo_data):
-    """
-    Переводит русские поля коллекции Apartments в mongo на английский и подгоняет под структуру API
-    """
-    DEFAULT_VALUES = {
-        # Обязательные поля для Location
-        'building.location.street': 'Не указана',
-        'building.location.house_number': '0',
-        'building.location.town.name': 'Не указан',
-        'building.location.town.region.name': 'Не указан',
-
-        # Обязательные поля для Apartment
-        'title': 'Без названия',
-        'price': 0.0,
-        'total_area': 0.0,
-        'room_count': 1,
-        'description': 'Нет описания',
-        'floor': 1,
-    }
-
-    django_data = {
-            "building": {
-                "location": {
-                    "town": {
-                        "region": {
-                            "name": DEFAULT_VALUES['building.location.town.region.name']
-                        },
-                        "name": DEFAULT_VALUES['building.location.town.name']
-                    },
-                    "district": "",
-                    "microdistrict": "",
-                    "street": DEFAULT_VALUES['building.location.street'],
-                    "house_number": DEFAULT_VALUES['building.location.house_number'],
-                    "latitude": None,
-                    "longitude": None
-                },
-                "floors_total": None,
-                "wall_material": "",
-                "construction_year": None,
-                "house_amenities": "",
-                "parking": ""
-            },
-
-            "images": [],
-
-            "title": DEFAULT_VALUES['title'],
-            "price": DEFAULT_VALUES['price'],
-
-            "total_area": DEFAULT_VALUES['total_area'],
-            "living_area": None,
-            "kitchen_area": None,
-
-            "balcony": False,
-            "floor": DEFAULT_VALUES['floor'],
-
-            "description": DEFAULT_VALUES['description'],
-
-            "room_count": DEFAULT_VALUES['room_count'],
-            "separate_rooms": None,
-
-            "renovation": "",
-            "furniture": True,
-            "bathroom": None,
-
-            "quarter": None,
-            "term_of_rent": None,
-            "contract_number": "",
-            "rent_conditions": None,
-            "prepayment": None,
-
-            "parking": False,
-            "layout": None
-    }
-
-    # ----- Прямые поля (строки без преобразований) -----
-    direct_mapping = {
-        "title": "title",
-        "description": "description",
-        "contract_number": "Номер договора",
-        "renovation": "Ремонт",  # в rent это произвольная строка — просто прокидываем
-        "layout": "Планировка",
-        "link": "link",
-    }
-
-    # ----- Числовые поля -----
-    def _to_float(s: str, repl: tuple[str, ...] = ()) -> float:
+# Сколько записей translate_batch разбирает за один проход по столбцам
+TRANSLATE_BATCH_SIZE = int(os.getenv('TRANSLATE_BATCH_SIZE', '1000'))
+
+# Версия кода конвертеров: увеличивать при изменении их поведения,
+# чтобы retranslate пересчитал уже переведённые документы
+TRANSLATOR_CODE_VERSION = 1
+
+# Размер LRU-кэша каждого числового конвертера; 0 - без кэша
+TRANSLATOR_MEMO_SIZE = int(os.getenv('TRANSLATOR_MEMO_SIZE', '4096'))
+
+# Каталог со спецификациями маппинга: по файлу <kind>.json на тип объявлений
+SPECS_DIR = os.getenv(
+    'TRANSLATION_SPECS_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'translation_specs'),
+)
+
+
+# ----- Конвертеры значений -----
+
+def _strip_units(units):
+    def convert(x):
+        for unit in units:
+            x = x.replace(unit, "")
+        return float(x.replace(",", "."))
+    return convert
+
+
+def _to_float(repl):
+    def convert(s):
         if s is None:
             raise TypeError
         v = str(s)
         for r in repl:
             v = v.replace(r, "")
-        v = v.replace(",", ".").strip()
-        return float(v)
-
-    numeric_mapping = {
-        "price": (
-            "price",
-            lambda x: _to_float(x, (" р.", "₽", " ",)) if isinstance(x, (str, bytes)) else float(x)
-        ),
-        "total_area": ("Площадь общая", lambda x: _to_float(x, (" м²",))),
-        "living_area": ("Площадь жилая", lambda x: _to_float(x, (" м²",))),
-        "kitchen_area": ("Площадь кухни", lambda x: _to_float(x, (" м²",))),
-        "room_count": ("Количество комнат", int),
-        "separate_rooms": ("Изолированные комнаты", int),  # если источник называет иначе — добавьте синоним внизу
-        "quarter": ("Квартал", lambda x: float(str(x).split()[0])),  # берём первое число из "2 кв. 2025"
-        "construction_year": ("Год постройки", int)  # уйдёт во вложенное building.construction_year
-    }
-
-    # ----- Выборные/булевы поля -----
-    choice_mapping = {
-        # Балкон в rent — булево
-        "balcony": {
-            "field": "Балкон",
-            "choices": {
-                "Балкон": True,
-                "Лоджия": True,
-                "Французский балкон": True,
-                "Угловой балкон": True,
-                "Есть": True,
-                "Да": True,
-                "Нет": False,
-                "Отсутствует": False
-            },
-            "default": False
-        },
-
-        # Санузел — нормализуем в короткие коды
-        "bathroom": {
-            "field": "Санузел",
-            "choices": {
-                "Совмещенный": "combined",
-                "Раздельный": "separate",
-                "Два и более": "multiple",
-                "Несколько": "multiple",
-            },
-            "default": None
-        },
-
-        # Мебель — булево
-        "furniture": {
-            "field": "Мебель",
-            "choices": {
-                "Есть": True,
-                "Да": True,
-                "Нет": False,
-                "Отсутствует": False
-            },
-            "default": True
-        },
-
-        # Срок аренды
-        "term_of_rent": {
-            "field": "Срок аренды",
-            "choices": {
-                "Посуточно": "daily",
-                "Краткосрочная": "short",
-                "Короткий срок": "short",
-                "Длительная": "long",
-                "Длительный срок": "long",
-                "Долгосрочная": "long",
-                "Ежемесячно": "monthly"
-            },
-            "default": None
-        },
-
-        # Условия аренды — сводим к кодам (множественность можно обрабатывать вне этого словаря)
-        "rent_conditions": {
-            "field": "Условия аренды",
-            "choices": {
-                "Можно с детьми": "kids_ok",
-                "Можно с животными": "pets_ok",
-                "Нельзя с животными": "no_pets",
-                "КУ включены": "utilities_included",
-                "Коммунальные включены": "utilities_included",
-                "Оплата по счётчикам": "utilities_separate",
-            },
-            "default": None
-        },
-
-        # Предоплата
-        "prepayment": {
-            "field": "Предоплата",
-            "choices": {
-                "1 месяц": "1_month",
-                "2 месяца": "2_months",
-                "100%": "100_percent",
-                "Без предоплаты": "no_prepayment"
-            },
-            "default": None
-        },
-
-        # Парковка в rent — булево
-        "parking": {
-            "field": "Парковка",
-            "choices": {
-                "Есть": True,
-                "Да": True,
-                "Нет": False,
-                "Отсутствует": False
-            },
-            "default": False
-        },
-
-        # Материал стен — остаётся во вложенном building.wall_material
-        "wall_material": {
-            "field": "Тип дома",
-            "choices": {
-                "Панельный": "Panel",
-                "Кирпичный": "Brick",
-                "Монолитный": "Monolithic",
-                "Блочный": "Block"
-            },
-            "default": "Panel"
-        }
-    }
-
-    # ----- Обработка прямых полей -----
-    for django_field, mongo_field in direct_mapping.items():
-        if mongo_field in mongo_data:
-            django_data[django_field] = str(mongo_data[mongo_field])
-
-    # ----- Обработка числовых полей -----
-    for django_field, (mongo_field, converter) in numeric_mapping.items():
-        if mongo_field in mongo_data:
-            try:
-                value = converter(mongo_data[mongo_field])
-                if django_field == "construction_year":
-                    # вложенное поле
-                    django_data.setdefault("building", {}).setdefault("construction_year", value)
-                    django_data["building"]["construction_year"] = value
-                else:
-                    django_data[django_field] = value
-            except (ValueError, TypeError, AttributeError):
-                pass
-
-    # ----- Обработка выборных/булевых полей -----
-    for django_field, config in choice_mapping.items():
-        mongo_field = config["field"]
-        if mongo_field in mongo_data:
-            raw_value = mongo_data[mongo_field]
-            mapped = config["choices"].get(raw_value, config["default"])
-
-            if django_field == "wall_material":
-                django_data.setdefault("building", {})["wall_material"] = mapped
-            else:
-                django_data[django_field] = mapped
-
-    # ----- Этаж / этажность -----
-    if "Этаж / этажность" in mongo_data:
-        try:
-            floor, floors_total = [x.strip() for x in str(mongo_data["Этаж / этажность"]).split("/")]
-            django_data["floor"] = int(floor)
-            django_data.setdefault("building", {})["floors_total"] = int(floors_total)
-        except (ValueError, AttributeError):
-            pass
-
-    # ----- Координаты -----
-    if "Координаты" in mongo_data:
+        return float(v.replace(",", ".").strip())
+    return convert
+
+
+def _apartment_price(x):
+    if isinstance(x, str):
+        return float(x.replace(" р.", "").replace(" ", "").replace(",", "."))
+    return float(x)
+
+
+_rent_price_from_str = _to_float((" р.", "₽", " "))
+
+
+def _rent_price(x):
+    if isinstance(x, (str, bytes)):
+        return _rent_price_from_str(x)
+    return float(x)
+
+
+def _quarter(x):
+    # берём первое число из "2 кв. 2025"
+    return float(str(x).split()[0])
+
+
+def _floor_and_total(value):
+    floor, floors_total = [x.strip() for x in str(value).split("/")]
+    floor = int(floor)
+    try:
+        return floor, int(floors_total)
+    except ValueError:
+        return floor, MISSING
+
+
+def _coordinates(value):
+    coords = str(value).split(",")
+    if len(coords) != 2:
+        raise ValueError(value)
+    lat, lon = [x.strip() for x in coords]
+    lat = float(lat)
+    try:
+        return lat, float(lon)
+    except ValueError:
+        return lat, MISSING
+
+
+def _choice(choices, default):
+    get = choices.get
+    return lambda value: get(value, default)
+
+
+# Конвертеры, на которые ссылаются спецификации. Фабрики получают "args" из спецификации
+CONVERTERS = {
+    'str': str,
+    'int': int,
+    'float': float,
+    'apartment_price': _apartment_price,
+    'rent_price': _rent_price,
+    'quarter': _quarter,
+    'floor_and_total': _floor_and_total,
+    'coordinates': _coordinates,
+}
+
+CONVERTER_FACTORIES = {
+    'strip_units': lambda *units: _strip_units(units),
+    'to_float': lambda *repl: _to_float(repl),
+}
+
+
+def _resolve_converter(config):
+    name = config.get('converter', 'str')
+    args = config.get('args')
+    if name in CONVERTER_FACTORIES:
+        return CONVERTER_FACTORIES[name](*(args or ()))
+    if name in CONVERTERS and args is None:
+        return CONVERTERS[name]
+    raise ValueError(f"Unknown converter in translation spec: {name!r}")
+
+
+def memoize_converter(convert, maxsize=TRANSLATOR_MEMO_SIZE):
+    """
+    Оборачивает конвертер в ограниченный LRU-кэш: повторяющиеся строки (площади,
+    этажи, цены) разбираются один раз, дальше - один поиск в словаре. Ошибка
+    разбора кэшируется как _FAILED. Ключи типизированы (1, 1.0 и True различаются),
+    нехешируемое значение даёт TypeError, то есть считается ошибкой разбора.
+    Счётчики - cache_info(), сброс - cache_clear().
+    """
+    def convert_or_fail(value):
         try:
-            coords = str(mongo_data["Координаты"]).split(",")
-            if len(coords) == 2:
-                lat, lon = [x.strip() for x in coords]
-                loc = django_data.setdefault("building", {}).setdefault("location", {})
-                loc["latitude"] = float(lat)
-                loc["longitude"] = float(lon)
-        except (ValueError, AttributeError):
-            pass
-
-    # ----- Адресные поля -----
-    address_fields = {
-        "building.location.town.region.name": ["Область", "Обл.", "Регион"],
-        "building.location.town.name": ["Населенный пункт", "Город", "г."],
-        "building.location.district": ["Район", "Р-н"],
-        "building.location.street": ["Улица", "ул.", "Адрес"],
-        "building.location.house_number": ["Дом", "Номер дома", "№ дома"]
-    }
-
-    # Если источник использует альтернативные названия, можно расширить:
-    address_synonyms = {
-        "separate_rooms": ["Раздельные комнаты", "Изолированные комнаты"]
-    }
-
-    # Пробуем заполнить адрес
-    for path, mongo_fields in address_fields.items():
-        for field in mongo_fields:
+            return convert(value)
+        except CONVERSION_ERRORS:
+            return _FAILED
+
+    return lru_cache(maxsize=maxsize, typed=True)(convert_or_fail)
+
+
+def _spec_converter(config):
+    # "memo": false в спецификации - для почти уникальных значений вроде координат
+    convert = _resolve_converter(config)
+    if TRANSLATOR_MEMO_SIZE > 0 and config.get('memo', True):
+        return memoize_converter(convert)
+    return convert
+
+
+# ----- Компиляция -----
+
+def _compile_copier(template):
+    """
+    Возвращает функцию копирования шаблона. Копируются только вложенные словари
+    и списки; функция отдаёт копию и кортеж её словарей, где номер словаря
+    (слот) вычислен заранее для каждого пути
+    """
+    nested = []
+    slots = {(): 0}
+
+    def walk(node, parents):
+        for key, value in node.items():
+            if isinstance(value, (dict, list)):
+                nested.append((slots[parents], key, isinstance(value, dict)))
+                if isinstance(value, dict):
+                    slots[parents + (key,)] = len(slots)
+                    walk(value, parents + (key,))
+
+    walk(template, ())
+
+    def copy():
+        data = template.copy()
+        containers = [data]
+        for slot, key, is_dict in nested:
+            parent = containers[slot]
+            value = parent[key] = parent[key].copy()
+            if is_dict:
+                containers.append(value)
+        return data, containers
+
+    return copy, slots
+
+
+class CompiledTranslator:
+    """
+    Переводчик документа из mongo в структуру API, собранный один раз.
+    Пути назначения заранее разбиты на (слот словаря, ключ), конвертеры
+    привязаны, а маппинг развёрнут в плоские списки операций.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.spec_hash = spec_hash(spec)
+        # Метка версии, которая сохраняется рядом с переведённым документом
+        self.version = f'{TRANSLATOR_CODE_VERSION}.{self.spec_hash[:12]}'
+        self.template = spec['template']
+        self._copy_template, self._slots = _compile_copier(self.template)
+
+        self.plain_ops = tuple(
+            [(mongo_field, str) + self._target(django_field)
+             for django_field, mongo_field in spec.get('direct', {}).items()]
+            + [(config['field'], _choice(config['choices'], config.get('default'))) + self._target(django_field)
+               for django_field, config in spec.get('choice', {}).items()]
+        )
+        # Числовые поля: в пакетном режиме разбираются по столбцам
+        self.numeric_ops = tuple(
+            (config['field'], _spec_converter(config)) + self._target(django_field)
+            for django_field, config in spec.get('numeric', {}).items()
+        )
+        self.ops = self.plain_ops + self.numeric_ops
+
+        # Поля, из которых получается два значения (этаж/этажность, координаты)
+        self.pair_ops = tuple(self._compile_pair(config) for config in spec.get('pairs', ()))
+        # С LRU у конвертеров (memoize_converter) разбор по столбцам только
+        # дублирует кэш, и пачка быстрее переводится поштучно. По столбцам
+        # пачка разбирается, когда кэши выключены (TRANSLATOR_MEMO_SIZE=0)
+        self._row_wise = any(hasattr(convert, 'cache_info') for _, convert, *_ in self.numeric_ops + self.pair_ops)
+
+        # Значение берётся из первого найденного варианта названия поля (адрес)
+        self.address_ops = tuple(
+            (tuple(mongo_fields),) + self._target(path) for path, mongo_fields in spec.get('first_found', {}).items()
+        )
+
+        # Поля верхнего уровня, которые может выдать перевод
+        targets = [*spec.get('direct', {}), *spec.get('choice', {}), *spec.get('numeric', {}),
+                   *(path for config in spec.get('pairs', ()) for path in config['targets']),
+                   *spec.get('first_found', {})]
+        self.output_fields = tuple(dict.fromkeys([*self.template, *(path.split('.')[0] for path in targets)]))
+
+    def _compile_pair(self, config):
+        targets = config['targets']
+        if len(targets) != 2:
+            raise ValueError(f"Pair mapping for {config['field']!r} needs exactly two targets")
+        return (config['field'], _spec_converter(config)) + tuple(self._target(path) for path in targets)
+
+    def _memoized_ops(self):
+        return [(field, convert) for field, convert, *_ in self.numeric_ops + self.pair_ops
+                if hasattr(convert, 'cache_info')]
+
+    def memo_stats(self):
+        """
+        Счётчики попаданий/промахов кэшей конвертеров по полям mongo
+        """
+        stats = {}
+        for field, convert in self._memoized_ops():
+            info = convert.cache_info()
+            stats[field] = {'hits': info.hits, 'misses': info.misses,
+                            'size': info.currsize, 'maxsize': info.maxsize}
+        return stats
+
+    def clear_memo(self):
+        for _, convert in self._memoized_ops():
+            convert.cache_clear()
+
+    def _target(self, path):
+        keys = tuple(path.split('.'))
+        if keys[:-1] not in self._slots:
+            raise ValueError(f"Unknown target path in translation spec: {path!r}")
+        return self._slots[keys[:-1]], keys[-1]
+
+    def __call__(self, mongo_data):
+        django_data, containers = self._copy_template()
+
+        for field, convert, slot, key in self.ops:
+            if field in mongo_data:
+                try:
+                    value = convert(mongo_data[field])
+                except CONVERSION_ERRORS:
+                    continue
+                if value is not _FAILED:
+                    containers[slot][key] = value
+
+        for field, convert, first, second in self.pair_ops:
             if field in mongo_data:
-                keys = path.split('.')
-                current = django_data
-                for key in keys[:-1]:
-                    current = current.setdefault(key, {})
-                current[keys[-1]] = str(mongo_data[field])
-                break
-
-    # Поддержка синонимов полей-значений
-    for django_field, names in address_synonyms.items():
-        if django_field not in django_data:
-            for name in names:
-                if name in mongo_data:
+                try:
+                    value = convert(mongo_data[field])
+                except CONVERSION_ERRORS:
+                    continue
+                if value is _FAILED:
+                    continue
+                containers[first[0]][first[1]] = value[0]
+                if value[1] is not MISSING:
+                    containers[second[0]][second[1]] = value[1]
+
+        for fields, slot, key in self.address_ops:
+            for field in fields:
+                if field in mongo_data:
+                    containers[slot][key] = str(mongo_data[field])
+                    break
+
+        return django_data
+
+    def translate_many(self, records):
+        """
+        Переводит пачку записей. При включённых кэшах конвертеров записи
+        переводятся поштучно через __call__. Без них числовые поля и пары
+        значений разбираются по столбцам: значения поля собираются со всей
+        пачки, и каждое уникальное значение конвертируется один раз. Строковые
+        и выборные поля дешёвые и применяются к каждой записи как в __call__.
+        Результат совпадает с поштучным вызовом.
+        """
+        if self._row_wise:
+            return list(map(self, records))
+
+        records = list(records)
+        copies = [self._copy_template() for _ in records]
+
+        for field, convert, slot, key in self.plain_ops:
+            for record, (_, containers) in zip(records, copies):
+                if field in record:
                     try:
-                        django_data[django_field] = int(mongo_data[name])
-                        break
-                    except (ValueError, TypeError):
+                        containers[slot][key] = convert(record[field])
+                    except CONVERSION_ERRORS:
                         pass
 
-    return django_data
+        for field, convert, slot, key in self.numeric_ops:
+            for value, (_, containers) in zip(_convert_column(records, field, convert), copies):
+                if value is not _FAILED:
+                    containers[slot][key] = value
+
+        for field, convert, first, second in self.pair_ops:
+            for value, (_, containers) in zip(_convert_column(records, field, convert), copies):
+                if value is not _FAILED:
+                    containers[first[0]][first[1]] = value[0]
+                    if value[1] is not MISSING:
+                        containers[second[0]][second[1]] = value[1]
+
+        for fields, slot, key in self.address_ops:
+            for record, (_, containers) in zip(records, copies):
+                for field in fields:
+                    if field in record:
+                        containers[slot][key] = str(record[field])
+                        break
+
+        return [data for data, _ in copies]
+
+
+# Типы, значения которых можно кэшировать по самому значению:
+# 1, 1.0 и True равны как ключи словаря, но конвертируются по-разному
+_CACHEABLE_TYPES = {str, object}
+
+
+def _convert_column(records, field, convert):
+    """
+    Столбец field по всем записям, пропущенный через convert; _FAILED там,
+    где поля нет или конвертер упал. Каждое уникальное значение разбирается
+    один раз, сам столбец собирается через map без цикла на Python.
+    """
+    raw_values = list(map(methodcaller('get', field, _FAILED), records))
+
+    if set(map(type, raw_values)) <= _CACHEABLE_TYPES:
+        parsed = {}
+        for raw in set(raw_values):
+            try:
+                parsed[raw] = _FAILED if raw is _FAILED else convert(raw)
+            except CONVERSION_ERRORS:
+                parsed[raw] = _FAILED
+        return list(map(parsed.__getitem__, raw_values))
+
+    values = []
+    for raw in raw_values:
+        try:
+            values.append(_FAILED if raw is _FAILED else convert(raw))
+        except CONVERSION_ERRORS:
+            values.append(_FAILED)
+    return values
+
+
+# ----- Загрузка спецификаций -----
+
+def spec_hash(spec):
+    """
+    Хэш спецификации: не зависит от порядка ключей и форматирования файла
+    """
+    canonical = json.dumps(spec, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def raw_hash(record):
+    """
+    Хэш сырой записи парсера: не зависит от порядка полей
+    """
+    canonical = json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _merge_specs(base, override):
+    # Словари сливаются рекурсивно, остальные значения (в т.ч. списки) заменяются
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge_specs(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_spec(kind, specs_dir=None):
+    """
+    Читает <kind>.json и раскрывает цепочку "extends"
+    """
+    specs_dir = specs_dir or SPECS_DIR
+    with open(os.path.join(specs_dir, f'{kind}.json'), encoding='utf-8') as f:
+        spec = json.load(f)
+    parent = spec.pop('extends', None)
+    if parent:
+        spec = _merge_specs(load_spec(parent, specs_dir), spec)
+    return spec
+
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def compile_spec(spec):
+    """
+    Компилирует спецификацию; одинаковые спецификации (по хэшу) компилируются один раз
+    """
+    key = spec_hash(spec)
+    translator = _compiled.get(key)
+    if translator is None:
+        with _compiled_lock:
+            translator = _compiled.get(key)
+            if translator is None:
+                translator = _compiled[key] = CompiledTranslator(spec)
+    return translator
+
+
+_translators = {}
+
+
+def get_translator(kind):
+    """
+    Переводчик для типа объявлений; спецификация читается при первом обращении
+    """
+    translator = _translators.get(kind)
+    if translator is None:
+        translator = _translators[kind] = compile_spec(load_spec(kind))
+    return translator
+
+
+def translate_batch(records, kind='apartments', batch_size=TRANSLATE_BATCH_SIZE):
+    """
+    Переводит поток записей (список, генератор или курсор mongo) пачками
+    по batch_size и отдаёт документы в исходном порядке
+    """
+    translator = get_translator(kind)
+    if translator._row_wise:
+        # Поштучный перевод не держит в памяти готовую пачку
+        yield from map(translator, records)
+        return
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield from translator.translate_many(batch)
+
+
+def transform_mongo_apartments_to_django(mongo_data):
+    """
+    Переводит русские поля коллекции Apartments в mongo на английский и подгоняет под структуру API
+    """
+    return get_translator('apartments')(mongo_data)
+
+
+def transform_mongo_rent_to_django(mongo_data):
+    """
+    Переводит русские поля коллекции Rental в mongo на английский и подгоняет под структуру API
+    """
+    return get_translator('rent')(mongo_data)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,391 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from pymongo import UpdateOne
+from requests.adapters import HTTPAdapter
+
+from bulk import BulkWriter
+from translator import get_translator
+
+logger = logging.getLogger(__name__)
+
+
+WEBHOOK_MODE = os.getenv('WEBHOOK_MODE', 'delta')  # delta | full
+# ids - только ID (Django читает документы через GET), documents - сами документы в NDJSON
+WEBHOOK_PAYLOAD = os.getenv('WEBHOOK_PAYLOAD', 'ids')
+# Размер одной пачки ID и число пачек, отправляемых одновременно
+WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', '1000'))
+WEBHOOK_CONCURRENCY = int(os.getenv('WEBHOOK_CONCURRENCY', '4'))
+WEBHOOK_TIMEOUT = float(os.getenv('WEBHOOK_TIMEOUT', '30'))
+WEBHOOK_GZIP = os.getenv('WEBHOOK_GZIP', '1') == '1'
+WEBHOOK_GZIP_LEVEL = int(os.getenv('WEBHOOK_GZIP_LEVEL', '6'))
+# Окно перед отметкой, которое просматривается повторно: изменения, записанные
+# другим воркером с чуть отстающими часами, не теряются. Повторов нет - их отсекает sent_version
+WEBHOOK_WATERMARK_OVERLAP_SECONDS = int(os.getenv('WEBHOOK_WATERMARK_OVERLAP_SECONDS', '300'))
+
+# Очередь повторов: пауза base * 2^(n-1), не больше max; после max_attempts пачка помечается dead
+WEBHOOK_RETRY_BASE_SECONDS = float(os.getenv('WEBHOOK_RETRY_BASE_SECONDS', '30'))
+WEBHOOK_RETRY_MAX_SECONDS = float(os.getenv('WEBHOOK_RETRY_MAX_SECONDS', '3600'))
+WEBHOOK_RETRY_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_RETRY_MAX_ATTEMPTS', '10'))
+# На это время пачка из очереди закрепляется за воркером, который её отправляет
+WEBHOOK_RETRY_CLAIM_SECONDS = int(os.getenv('WEBHOOK_RETRY_CLAIM_SECONDS', '120'))
+
+DELIVERABLE_STATE = 'second'
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def load_watermark(state_coll, kind) -> Optional[datetime]:
+    doc = state_coll.find_one({'_id': kind})
+    return doc.get('watermark') if doc else None
+
+
+def save_watermark(state_coll, kind, watermark, clock=_utcnow):
+    # Отметка только растёт, даже если два запуска сохраняют её одновременно
+    state_coll.update_one(
+        {'_id': kind},
+        {'$max': {'watermark': watermark}, '$set': {'updated_at': clock()}},
+        upsert=True,
+    )
+
+
+def backfill_changed_at(coll, clock=_utcnow) -> int:
+    """
+    Проставляет changed_at документам, сохранённым до появления дельта-режима,
+    чтобы они один раз ушли в вебхук
+    """
+    result = coll.update_many(
+        {'state': DELIVERABLE_STATE, 'changed_at': {'$exists': False}},
+        {'$set': {'changed_at': clock()}},
+    )
+    return result.modified_count
+
+
+def iter_pending_deltas(coll, since: Optional[datetime], skip_ids=frozenset()):
+    """
+    Документы, изменившиеся после since и ещё не доставленные в этой версии,
+    по возрастанию changed_at. skip_ids - ID, которые уже ждут в очереди повторов
+    """
+    query = {'state': DELIVERABLE_STATE, 'changed_at': {'$exists': True}}
+    if since is not None:
+        query['changed_at'] = {'$gt': since - timedelta(seconds=WEBHOOK_WATERMARK_OVERLAP_SECONDS)}
+    cursor = coll.find(query, {'_id': 1, 'changed_at': 1, 'sent_version': 1}) \
+        .sort([('changed_at', 1), ('_id', 1)])
+    for doc in cursor:
+        if doc.get('sent_version') != doc['changed_at'] and doc['_id'] not in skip_ids:
+            yield doc
+
+
+def mark_delivered(coll, docs, clock=_utcnow) -> int:
+    """
+    Отмечает доставленную версию. Если документ успел измениться во время
+    отправки, его changed_at уже другой и отметка не ставится
+    """
+    sent_at = clock()
+    with BulkWriter(coll) as writer:
+        for doc in docs:
+            writer.add(UpdateOne(
+                {'_id': doc['_id'], 'changed_at': doc['changed_at']},
+                {'$set': {'sent_version': doc['changed_at'], 'sent_at': sent_at}},
+            ))
+    return writer.modified_count
+
+
+def idempotency_key(kind, docs) -> str:
+    """
+    Ключ пачки: одинаковый для повторов одной и той же версии объявлений,
+    чтобы Django мог отбросить дубль
+    """
+    digest = hashlib.sha256(kind.encode('utf-8'))
+    for doc in docs:
+        changed_at = doc.get('changed_at')
+        digest.update(f'\n{doc["_id"]}@{changed_at.isoformat() if changed_at else ""}'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class WebhookClient:
+    """
+    Отправляет пачку ID в Django: тело в gzip, ключ идемпотентности в заголовке.
+    Бросает исключение, если ответ не 2xx
+    """
+
+    def __init__(self, url, session=None, timeout=WEBHOOK_TIMEOUT, compress=WEBHOOK_GZIP):
+        self.url = url
+        self.timeout = timeout
+        self.compress = compress
+        self._own_session = session is None
+        if session is None:
+            session = requests.Session()
+            session.mount(url, HTTPAdapter(pool_connections=1, pool_maxsize=max(1, WEBHOOK_CONCURRENCY)))
+        self.session = session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        if self._own_session:
+            self.session.close()
+
+    def _headers(self, content_type, key):
+        headers = {'Content-Type': content_type}
+        if key:
+            headers['Idempotency-Key'] = key
+        if self.compress:
+            headers['Content-Encoding'] = 'gzip'
+        return headers
+
+    def _post(self, body, headers):
+        response = self.session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def __call__(self, ids, since=None, key=None):
+        payload = {'ids': ids}
+        if since is not None:
+            payload['since'] = since.isoformat()
+        body = json.dumps(payload).encode('utf-8')
+        if self.compress:
+            body = gzip.compress(body, compresslevel=WEBHOOK_GZIP_LEVEL)
+        return self._post(body, self._headers('application/json', key))
+
+
+def _gzip_stream(blocks, level=WEBHOOK_GZIP_LEVEL):
+    # wbits 16 + 15: поток в формате gzip, как у gzip.compress
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def document_fields(kind) -> List[str]:
+    """
+    Поля документа, которые нужны Django: по умолчанию всё, что выдаёт переводчик,
+    без служебных полей парсера. Переопределяется через WEBHOOK_<KIND>_FIELDS
+    """
+    configured = os.getenv(f'WEBHOOK_{kind.upper()}_FIELDS')
+    if configured:
+        return [field.strip() for field in configured.split(',') if field.strip()]
+    return list(get_translator(kind).output_fields)
+
+
+class DocumentWebhookClient(WebhookClient):
+    """
+    Отправляет вместо ID сами переведённые документы построчно в NDJSON,
+    читая их из coll с проекцией fields. Тело пишется потоком, без сборки в памяти
+    """
+
+    def __init__(self, url, coll, fields, **kwargs):
+        super().__init__(url, **kwargs)
+        self.coll = coll
+        self.projection = dict.fromkeys(fields, 1)
+
+    def _lines(self, ids):
+        for doc in self.coll.find({'_id': {'$in': ids}}, self.projection):
+            yield json.dumps(doc, ensure_ascii=False, default=str).encode('utf-8') + b'\n'
+
+    def __call__(self, ids, since=None, key=None):
+        headers = self._headers(NDJSON_CONTENT_TYPE, key)
+        if since is not None:
+            headers['X-Webhook-Since'] = since.isoformat()
+        body = self._lines(ids)
+        if self.compress:
+            body = _gzip_stream(body)
+        return self._post(body, headers)
+
+
+def webhook_client(url, coll, kind, payload=WEBHOOK_PAYLOAD) -> WebhookClient:
+    if payload == 'documents':
+        return DocumentWebhookClient(url, coll, document_fields(kind))
+    return WebhookClient(url)
+
+
+def send_chunks(post: Callable, kind, chunks: List[List[Dict]], since=None,
+                concurrency=WEBHOOK_CONCURRENCY) -> Iterator[Tuple[List[Dict], str, Optional[Exception]]]:
+    """
+    Отправляет пачки, держа в полёте не больше concurrency запросов.
+    Отдаёт (пачка, ключ идемпотентности, ошибка) по мере завершения
+    """
+    if not chunks:
+        return
+    remaining = iter(chunks)
+    in_flight = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chunks))),
+                            thread_name_prefix='webhook') as pool:
+        def submit_next():
+            chunk = next(remaining, None)
+            if chunk is not None:
+                key = idempotency_key(kind, chunk)
+                future = pool.submit(post, [str(doc['_id']) for doc in chunk], since, key)
+                in_flight[future] = (chunk, key)
+
+        for _ in range(max(1, concurrency)):
+            submit_next()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk, key = in_flight.pop(future)
+                yield chunk, key, future.exception()
+                submit_next()
+
+
+def retry_delay(attempts, base=WEBHOOK_RETRY_BASE_SECONDS, maximum=WEBHOOK_RETRY_MAX_SECONDS) -> float:
+    return min(base * 2 ** (attempts - 1), maximum)
+
+
+def enqueue_retry(retry_coll, kind, chunk, key, since, error, clock=_utcnow):
+    """
+    Кладёт неотправленную пачку в очередь повторов (коллекция MongoDB)
+    """
+    now = clock()
+    retry_coll.update_one(
+        {'_id': key},
+        {
+            '$setOnInsert': {
+                'kind': kind,
+                'docs': [{'_id': doc['_id'], 'changed_at': doc.get('changed_at')} for doc in chunk],
+                'since': since,
+                'created_at': now,
+            },
+            # Пачка, которая уже была dead и снова не ушла из дельты, начинает попытки заново
+            '$set': {
+                'attempts': 1,
+                'state': 'pending',
+                'next_attempt_at': now + timedelta(seconds=retry_delay(1)),
+                'last_error': str(error),
+            },
+        },
+        upsert=True,
+    )
+
+
+def pending_retries(retry_coll, kind) -> Tuple[set, Optional[datetime]]:
+    """
+    ID объявлений в ожидающих пачках очереди повторов и самый старый их changed_at
+    """
+    ids = set()
+    oldest = None
+    for job in retry_coll.find({'kind': kind, 'state': 'pending'}, {'docs': 1}):
+        for doc in job['docs']:
+            ids.add(doc['_id'])
+            changed_at = doc.get('changed_at')
+            if changed_at is not None and (oldest is None or changed_at < oldest):
+                oldest = changed_at
+    return ids, oldest
+
+
+def _deliver(coll, retry_coll, kind, post, docs, since, batch_size, concurrency, clock) -> Tuple[List[str], List]:
+    """
+    Отправляет docs пачками. Возвращает ID доставленных и документы пачек,
+    ушедших в очередь повторов
+    """
+    chunks = [docs[i:i + batch_size] for i in range(0, len(docs), batch_size)]
+    sent_ids = []
+    failed = []
+    for chunk, key, error in send_chunks(post, kind, chunks, since, concurrency):
+        if error is None:
+            mark_delivered(coll, chunk, clock)
+            sent_ids.extend(str(doc['_id']) for doc in chunk)
+        else:
+            logger.warning(f"Webhook chunk of {len(chunk)} {kind} failed, queued for retry: {error}")
+            enqueue_retry(retry_coll, kind, chunk, key, since, error, clock)
+            failed.extend(chunk)
+    logger.info(f"Delivered {len(sent_ids)} {kind}, queued {len(failed)} for retry")
+    return sent_ids, failed
+
+
+def deliver_deltas(coll, state_coll, retry_coll, kind, post: Callable,
+                   batch_size=WEBHOOK_BATCH_SIZE, concurrency=WEBHOOK_CONCURRENCY, clock=_utcnow) -> List[str]:
+    """
+    Отправляет только новые и изменённые с прошлой доставки объявления пачками
+    по batch_size, до concurrency пачек одновременно. post(ids, since, key) должен
+    бросить исключение, если ответ не 2xx: такая пачка не отмечается и уходит
+    в очередь повторов. Объявления из ожидающих пачек очереди дельта не шлёт,
+    а отметка не уходит дальше самого старого недоставленного изменения:
+    пачка, от которой очередь отказалась (dead), снова попадёт в дельту.
+    Возвращает ID доставленных объявлений.
+    """
+    backfill_changed_at(coll, clock)
+    since = load_watermark(state_coll, kind)
+    queued_ids, oldest_queued = pending_retries(retry_coll, kind)
+    docs = list(iter_pending_deltas(coll, since, queued_ids))
+    if not docs:
+        return []
+
+    sent_ids, failed = _deliver(coll, retry_coll, kind, post, docs, since, batch_size, concurrency, clock)
+    watermark = docs[-1]['changed_at']
+    undelivered = [doc['changed_at'] for doc in failed]
+    if oldest_queued is not None:
+        undelivered.append(oldest_queued)
+    if undelivered:
+        # Чуть раньше самого старого недоставленного, чтобы $gt его не отрезал
+        watermark = min(watermark, min(undelivered) - timedelta(milliseconds=1))
+    save_watermark(state_coll, kind, watermark, clock)
+    return sent_ids
+
+
+def deliver_full(coll, retry_coll, kind, post: Callable,
+                 batch_size=WEBHOOK_BATCH_SIZE, concurrency=WEBHOOK_CONCURRENCY, clock=_utcnow) -> List[str]:
+    """
+    Отправляет все объявления в 'second' теми же пачками, без учёта отметки
+    """
+    docs = list(coll.find({'state': DELIVERABLE_STATE}, {'_id': 1, 'changed_at': 1}).sort('_id', 1))
+    sent_ids, _ = _deliver(coll, retry_coll, kind, post, docs, None, batch_size, concurrency, clock)
+    return sent_ids
+
+
+def process_retry_queue(retry_coll, coll, kind, post: Callable, clock=_utcnow) -> Dict[str, int]:
+    """
+    Повторяет пачки из очереди, у которых подошло время. Успешные удаляются
+    из очереди и отмечаются доставленными, неуспешные откладываются с растущей
+    паузой, а после WEBHOOK_RETRY_MAX_ATTEMPTS попыток помечаются dead.
+    """
+    stats = {'delivered': 0, 'rescheduled': 0, 'dead': 0}
+    now = clock()
+    while True:
+        job = retry_coll.find_one_and_update(
+            {'kind': kind, 'state': 'pending', 'next_attempt_at': {'$lte': now}},
+            {'$set': {'next_attempt_at': now + timedelta(seconds=WEBHOOK_RETRY_CLAIM_SECONDS)}},
+            sort=[('next_attempt_at', 1)],
+        )
+        if job is None:
+            break
+
+        ids = [str(doc['_id']) for doc in job['docs']]
+        try:
+            post(ids, job.get('since'), job['_id'])
+        except Exception as e:
+            attempts = job.get('attempts', 1) + 1
+            update = {'attempts': attempts, 'last_error': str(e)}
+            if attempts >= WEBHOOK_RETRY_MAX_ATTEMPTS:
+                update['state'] = 'dead'
+                stats['dead'] += 1
+                logger.error(f"Webhook chunk {job['_id']} of {kind} gave up after {attempts} attempts: {e}")
+            else:
+                update['next_attempt_at'] = clock() + timedelta(seconds=retry_delay(attempts))
+                stats['rescheduled'] += 1
+            retry_coll.update_one({'_id': job['_id']}, {'$set': update})
+            continue
+
+        mark_delivered(coll, job['docs'], clock)
+        retry_coll.delete_one({'_id': job['_id']})
+        stats['delivered'] += len(ids)
+
+    return stats
@@ -0,0 +1,51 @@
+import logging
+import os
+import socket
+import sys
+
+from app_celery import celery, WORKER_PROFILES
+
+logger = logging.getLogger(__name__)
+
+
+WORKER_POOL = os.getenv('WORKER_POOL', 'prefork')
+WORKER_LOGLEVEL = os.getenv('WORKER_LOGLEVEL', 'INFO')
+
+
+def worker_argv(profile_name, hostname=None):
+    """
+    Аргументы celery worker для профиля очереди из WORKER_PROFILES
+    """
+    try:
+        profile = WORKER_PROFILES[profile_name]
+    except KeyError:
+        raise ValueError(f"Unknown worker profile {profile_name!r}, expected one of {sorted(WORKER_PROFILES)}")
+
+    return [
+        'worker',
+        f'--hostname={profile_name}@{hostname or socket.gethostname()}',
+        f'--queues={",".join(profile["queues"])}',
+        f'--concurrency={profile["concurrency"]}',
+        f'--prefetch-multiplier={profile["prefetch_multiplier"]}',
+        f'--soft-time-limit={profile["soft_time_limit"]:g}',
+        f'--time-limit={profile["time_limit"]:g}',
+        f'--max-tasks-per-child={profile["max_tasks_per_child"]}',
+        f'--pool={WORKER_POOL}',
+        f'--loglevel={WORKER_LOGLEVEL}',
+    ]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print(f"Usage: python worker.py <{'|'.join(WORKER_PROFILES)}>")
+        return 2
+    args = worker_argv(argv[0])
+    import tasks  # noqa: F401 - регистрирует задачи в приложении
+    logger.info(f"Starting worker: {' '.join(args)}")
+    celery.worker_main(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Сравнение времени разбора страниц realt.by: прежний путь через BeautifulSoup
+и скомпилированные XPath-выражения parsers.realt_extractor.
+
+Запуск: python benchmarks/bench_extractor.py [итераций]
+"""
+import os
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+
+from parsers.realt_extractor import (  # noqa: E402
+    ListingLinkStream, collect_listing_links, extract_detail, extract_listing_links,
+)
+
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+
+
+def bs4_detail(text):
+    """Разбор страницы объявления в том виде, как он был до перехода на lxml"""
+    soup = BeautifulSoup(text, 'lxml')
+
+    title = soup.find('h1', class_='order-1 mb-0.5 md:-order-2 md:mb-4 block w-full !inline-block lg:text-h1Lg text-h1 font-raleway font-bold flex items-center').text
+    price = soup.find('h2', class_='!inline-block mr-1 lg:text-h2Lg text-h2 font-raleway font-bold flex items-center').text
+    title = title.replace('\xa0', ' ').strip()
+    price = price.replace('\xa0', ' ').strip()
+    description_section = soup.find('h3', string='Описание')
+    description = ''
+    if description_section:
+        desc_div = description_section.find_next('div', class_='text-basic-900')
+        if desc_div:
+            description = desc_div.get_text(separator="\n").replace('\xa0', ' ').strip()
+    data = {'title': title, 'price': price, 'description': description}
+
+    for li in soup.select('ul.w-full.-my-1 > li'):
+        key = li.select_one('span.text-basic').get_text(strip=True)
+        divs = li.find_all('div', class_='w-1/2')
+        if len(divs) >= 2:
+            value_p = divs[1].find('p')
+            value = value_p.get_text(strip=True) if value_p else None
+            if value is None:
+                value_p = divs[1].find('a')
+                value = value_p.get_text(strip=True) if value_p else None
+                value = value.replace('\xa0', ' ').strip()
+        else:
+            value = None
+        data[key] = value
+    return data
+
+
+def bs4_listing(text):
+    soup = BeautifulSoup(text, 'lxml')
+    block = soup.find('div', class_="t-0 l-0 absolute w-full")
+    if not block:
+        return None
+    links = []
+    for apt in block.find_all('div', attrs={'data-index': True}):
+        apt_tag = apt.find('a', class_='z-1 absolute top-0 left-0 w-full h-full cursor-pointer')
+        if apt_tag:
+            links.append('https://realt.by' + apt_tag.get('href'))
+    return links
+
+
+def _read(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def _measure(func, text, number):
+    return min(timeit.repeat(lambda: func(text), number=number, repeat=3)) / number * 1000
+
+
+def _chunks(data, size=16384, read=None):
+    for i in range(0, len(data), size):
+        if read is not None:
+            read.append(size)
+        yield data[i:i + size]
+
+
+def _first_link(data):
+    return next(iter(ListingLinkStream(_chunks(data))))
+
+
+def main(number=50):
+    cases = [
+        ('detail', _read('realt_detail_page.html'), bs4_detail, extract_detail),
+        ('listing', _read('realt_listing_page.html'), bs4_listing, extract_listing_links),
+    ]
+    print(f"{'page':<10}{'size, KB':>10}{'bs4, ms':>12}{'lxml, ms':>12}{'speedup':>10}")
+    for name, text, old, new in cases:
+        assert old(text) == new(text), f'{name}: results differ'
+        old_ms = _measure(old, text, number)
+        new_ms = _measure(new, text, number)
+        print(f"{name:<10}{len(text.encode()) / 1024:>10.1f}{old_ms:>12.2f}{new_ms:>12.2f}{old_ms / new_ms:>9.1f}x")
+
+    data = _read('realt_listing_page.html').encode('utf-8')
+    read = []
+    assert collect_listing_links(_chunks(data, read=read)) == extract_listing_links(data.decode('utf-8'))
+    stream_ms = _measure(lambda d: collect_listing_links(_chunks(d)), data, number)
+    first_ms = _measure(_first_link, data, number)
+    print(f"\nlisting stream: all links {stream_ms:.2f} ms, first link {first_ms:.2f} ms, "
+          f"read {min(sum(read), len(data)) / 1024:.1f} of {len(data) / 1024:.1f} KB")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
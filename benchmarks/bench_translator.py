@@ -0,0 +1,115 @@
+"""
+Микробенчмарк переводчика: прежние функции с построением маппинга на каждый вызов
+против скомпилированных переводчиков из app/translator.py и пакетного translate_batch.
+
+Запуск: python benchmarks/bench_translator.py [число записей]
+"""
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import legacy_translator  # noqa: E402
+import translator  # noqa: E402
+
+TOWNS = ['г. Минск', 'г. Гродно', 'г. Брест', 'г. Гомель', 'г. Витебск', 'г. Могилев', 'аг. Колодищи']
+REGIONS = ['Минская область', 'Гродненская область', 'Брестская область', 'Гомельская область']
+STREETS = ['Неманская ул.', 'Лидская ул.', 'пр-т Независимости', 'Притыцкого ул.', 'Сурганова ул.']
+HOUSE_TYPES = ['Панельный', 'Кирпичный', 'Монолитный', 'Блочный', 'Каркасный']
+BALCONIES = ['Лоджия', 'Балкон', 'Нет', 'Французский балкон', 'Есть']
+
+
+def make_record(rng, rent=False):
+    rooms = rng.randint(1, 4)
+    total = round(rng.uniform(25, 130), 1)
+    floors_total = rng.choice([5, 9, 12, 16, 19, 25])
+    record = {
+        'title': f'Продается {rooms}-комнатная квартира, {rng.choice(TOWNS)}, {rng.choice(STREETS)}',
+        'price': (f'{rng.randint(300, 3000):,} р./мес.' if rent else f'{rng.randint(40, 400):,} {rng.randint(0, 999):03d} р.').replace(',', ' '),
+        'description': 'Светлая квартира в тихом районе. Рядом школа и магазины.',
+        'Количество комнат': str(rooms),
+        'Площадь общая': f'{total} м²'.replace('.', rng.choice(['.', ','])),
+        'Площадь жилая': f'{round(total * 0.6, 1)} м²',
+        'Площадь кухни': f'{round(rng.uniform(6, 15), 1)} м²',
+        'Этаж / этажность': f'{rng.randint(1, floors_total)} / {floors_total}',
+        'Тип дома': rng.choice(HOUSE_TYPES),
+        'Высота потолков': f'{rng.choice(["2.5", "2.6", "2.7", "3"])} м',
+        'Год постройки': str(rng.randint(1960, 2025)),
+        'Балкон': rng.choice(BALCONIES),
+        'Ремонт': rng.choice(['Евроремонт', 'Хороший', 'Без отделки']),
+        'Номер договора': f'{rng.randint(1, 99)}/{rng.randint(1, 9)}а от 18.09.2025',
+        'Область': rng.choice(REGIONS),
+        'Населенный пункт': rng.choice(TOWNS),
+        'Улица': rng.choice(STREETS),
+        'Номер дома': str(rng.randint(1, 150)),
+        'Координаты': f'{53 + rng.random():.4f}, {27 + rng.random():.4f}',
+        'state': 'second',
+        'link': f'https://realt.by/object/{rng.randint(1000000, 4000000)}/',
+    }
+    if rent:
+        record.update({'Мебель': rng.choice(['Есть', 'Нет']), 'Парковка': rng.choice(['Есть', 'Нет']),
+                       'Срок аренды': rng.choice(['Длительный', 'Длительная', 'Посуточно'])})
+    else:
+        record.update({'Условия продажи': rng.choice(['Чистая продажа', 'Альтернатива']),
+                       'Собственность': 'Частная'})
+    return record
+
+
+def _best_us(runs, records, repeat=15):
+    """
+    Лучшее процессорное время на запись для каждого варианта. Варианты
+    запускаются вперемешку, чтобы фоновая нагрузка одинаково влияла на все
+    """
+    best = dict.fromkeys(runs, float('inf'))
+    for _ in range(repeat):
+        for name, run in runs.items():
+            started = time.process_time()
+            run(records)
+            best[name] = min(best[name], time.process_time() - started)
+    return {name: elapsed / len(records) * 1e6 for name, elapsed in best.items()}
+
+
+def _per_record(func):
+    def run(records):
+        for record in records:
+            func(record)
+    return run
+
+
+def _batch(kind):
+    def run(records):
+        for _ in translator.translate_batch(records, kind):
+            pass
+    return run
+
+
+def main(count=5000):
+    rng = random.Random(42)
+    cases = [
+        ('apartments', [make_record(rng) for _ in range(count)],
+         legacy_translator.transform_mongo_apartments_to_django, translator.transform_mongo_apartments_to_django),
+        ('rent', [make_record(rng, rent=True) for _ in range(count)],
+         legacy_translator.transform_mongo_rent_to_django, translator.transform_mongo_rent_to_django),
+    ]
+    print(f"{'kind':<12}{'records':>8}{'legacy, us':>12}{'compiled, us':>14}{'batch, us':>11}{'speedup':>10}")
+    for name, records, old, new in cases:
+        assert all(old(r) == new(r) for r in records), f'{name}: results differ'
+        assert list(translator.translate_batch(records, name)) == [new(r) for r in records], f'{name}: batch differs'
+        translator.get_translator(name).clear_memo()
+        timings = _best_us({'legacy': _per_record(old), 'compiled': _per_record(new), 'batch': _batch(name)}, records)
+        old_us, new_us, batch_us = timings['legacy'], timings['compiled'], timings['batch']
+        print(f"{name:<12}{count:>8}{old_us:>12.1f}{new_us:>14.1f}{batch_us:>11.1f}{old_us / batch_us:>9.1f}x")
+
+    for name, *_ in cases:
+        print(f'\nmemo hit rate, {name}:')
+        for field, stats in translator.get_translator(name).memo_stats().items():
+            total = stats['hits'] + stats['misses']
+            print(f"  {field:<24}{stats['hits'] / total if total else 0:>7.1%}  size {stats['size']}/{stats['maxsize']}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,91 @@
+"""
+Пропускная способность доставки вебхуков на локальную заглушку Django:
+одно тело со всеми ID (как раньше) против пачек в gzip с несколькими запросами в полёте.
+Заглушка тратит base + per_id * len(ids) секунд на запрос, как эндпоинт, который разбирает ID.
+
+Запуск: python benchmarks/bench_webhooks.py [число ID] [размер пачки] [параллельность]
+"""
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+
+from webhooks import WebhookClient, send_chunks  # noqa: E402
+
+BASE_LATENCY = 0.005
+PER_ID_LATENCY = 0.00002
+
+
+class StubDjango(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.wire_bytes += len(body)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        ids = json.loads(body)['ids']
+        time.sleep(BASE_LATENCY + PER_ID_LATENCY * len(ids))
+        self.server.received += len(ids)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubDjango)
+    server.wire_bytes = server.received = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/webhook/'
+
+
+def run(label, server, send, count):
+    server.wire_bytes = server.received = 0
+    started = time.perf_counter()
+    send()
+    elapsed = time.perf_counter() - started
+    assert server.received == count, (server.received, count)
+    print(f'{label:<28} {elapsed:7.3f} s  {count / elapsed:10.0f} ids/s  {server.wire_bytes / 1024:8.0f} KiB on wire')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    ids = [str(uuid.uuid4()) for _ in range(count)]
+    docs = [{'_id': i} for i in ids]
+    chunks = [docs[i:i + batch_size] for i in range(0, count, batch_size)]
+    server, url = start_stub()
+
+    def single_body():
+        requests.post(url, json={'ids': ids}, headers={'Content-Type': 'application/json'}, timeout=600) \
+            .raise_for_status()
+
+    def chunked(workers, compress):
+        def send():
+            with WebhookClient(url, compress=compress) as client:
+                for _, _, error in send_chunks(client, 'bench', chunks, concurrency=workers):
+                    assert error is None, error
+        return send
+
+    print(f'{count} ids, batch {batch_size}, concurrency {concurrency}')
+    run('single body (old)', server, single_body, count)
+    run('chunked, sequential', server, chunked(1, False), count)
+    run('chunked gzip, sequential', server, chunked(1, True), count)
+    run(f'chunked gzip, {concurrency} in flight', server, chunked(concurrency, True), count)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
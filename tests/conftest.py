@@ -65,6 +65,24 @@ def patch_fake_useragent(monkeypatch):
     yield
 
 
+# --------- rate_limiter: локальные лимиты вместо Redis ---------
+
+@pytest.fixture(autouse=True)
+def local_rate_limiter(monkeypatch):
+    """
+    Парсеры ходят в сеть через общий лимитер; в тестах он живёт в памяти
+    процесса и без лимитов по скорости, чтобы не обращаться к Redis.
+    """
+    try:
+        rate_limiter = importlib.import_module("rate_limiter")
+    except ModuleNotFoundError:
+        yield
+        return
+    limiter = rate_limiter.RateLimiter(rate_limiter.LocalRateStore(), rate=1e9, burst=1e9)
+    monkeypatch.setattr(rate_limiter, "_limiter", limiter)
+    yield
+
+
 # ----------------- Flask app: безопасный импорт -----------------
 
 @pytest.fixture
@@ -0,0 +1,164 @@
+import pickle
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.adaptive_schedule import (
+    AdaptiveSchedule,
+    FallbackScheduleStore,
+    LocalScheduleStore,
+    RedisScheduleStore,
+    next_interval,
+    plan_detail_requests,
+    record_list_run,
+)
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def incrby(self, key, amount):
+        self.calls.append(lambda: self.client.incrby(key, amount))
+
+    def expire(self, key, seconds):
+        self.calls.append(lambda: self.client.expire(key, seconds))
+
+    def execute(self):
+        return [call() for call in self.calls]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttl = {}
+
+    def get(self, key):
+        value = self.data.get(key)
+        return str(value).encode() if value is not None else None
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def incrby(self, key, amount):
+        self.data[key] = self.data.get(key, 0) + amount
+        return self.data[key]
+
+    def decrby(self, key, amount):
+        return self.incrby(key, -amount)
+
+    def expire(self, key, seconds):
+        self.ttl[key] = seconds
+        return True
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class BrokenStore:
+    def __getattr__(self, name):
+        def fail(*args):
+            raise ConnectionError("redis is down")
+        return fail
+
+
+@pytest.mark.parametrize("current,new_count,expected", [
+    (3600, 50, 1800),    # много новых - опрашиваем чаще
+    (3600, 0, 5400),     # ничего нового - реже
+    (3600, 5, 3600),     # обычный поток - без изменений
+    (700, 100, 600),     # не быстрее минимума
+    (14000, 0, 14400),   # не реже максимума
+])
+def test_next_interval(current, new_count, expected):
+    assert next_interval(current, new_count, minimum=600, maximum=14400, busy_threshold=20) == expected
+
+
+def test_record_list_run_adapts_interval_step_by_step():
+    store = LocalScheduleStore()
+    assert record_list_run("apartments_list", 40, store=store) == 1800
+    assert record_list_run("apartments_list", 40, store=store) == 900
+    assert record_list_run("apartments_list", 0, store=store) == 1350
+    assert store.get_interval("rent_list") is None
+
+
+def test_adaptive_schedule_uses_stored_interval():
+    store = LocalScheduleStore()
+    sched = AdaptiveSchedule("apartments_list", default=3600, minimum=600, maximum=14400, store=store)
+    now = datetime.now(timezone.utc)
+
+    due, next_check = sched.is_due(now - timedelta(seconds=1000))
+    assert not due
+    assert next_check == pytest.approx(2600, abs=5)
+
+    store.set_interval("apartments_list", 900)
+    due, next_check = sched.is_due(now - timedelta(seconds=1000))
+    assert due
+    assert next_check == pytest.approx(900, abs=5)
+
+
+def test_adaptive_schedule_clamps_and_pickles_without_store():
+    store = LocalScheduleStore()
+    store.set_interval("rent_list", 5)
+    sched = AdaptiveSchedule("rent_list", minimum=600, maximum=14400, store=store)
+    assert sched.current_interval() == 600
+
+    restored = pickle.loads(pickle.dumps(sched))
+    assert restored == sched
+    assert restored.store is None
+
+
+def test_local_store_budget_is_per_window():
+    clock = FakeClock(0)
+    store = LocalScheduleStore(clock=clock)
+    assert store.consume("details", 40, limit=100, window=3600) == 40
+    assert store.consume("details", 80, limit=100, window=3600) == 60
+    assert store.consume("details", 10, limit=100, window=3600) == 0
+
+    clock.now = 3600
+    assert store.consume("details", 10, limit=100, window=3600) == 10
+
+
+def test_redis_store_shares_state_and_returns_excess():
+    client = FakeRedis()
+    first = RedisScheduleStore(client, clock=FakeClock(7200))
+    second = RedisScheduleStore(client, clock=FakeClock(7300))
+
+    first.set_interval("apartments_list", 900)
+    assert second.get_interval("apartments_list") == 900.0
+
+    assert first.consume("details", 70, limit=100, window=3600) == 70
+    assert second.consume("details", 70, limit=100, window=3600) == 30
+    assert client.data["schedule:budget:details:2"] == 100
+    assert client.ttl["schedule:budget:details:2"] == 7200
+
+
+def test_fallback_store_keeps_working_without_redis():
+    store = FallbackScheduleStore(BrokenStore(), LocalScheduleStore())
+    store.set_interval("apartments_list", 1200)
+    assert store.get_interval("apartments_list") == 1200
+    assert store.consume("details", 5, 10, 3600) == 5
+
+
+def test_plan_detail_requests_splits_by_backlog():
+    store = LocalScheduleStore(clock=FakeClock(0))
+    plan = plan_detail_requests({"apartments": 300, "rent": 100}, store=store, budget=1000, tick_max=50)
+    assert plan == {"apartments": 38, "rent": 12}
+    assert sum(plan.values()) == 50
+
+
+def test_plan_detail_requests_respects_budget_and_small_backlog():
+    store = LocalScheduleStore(clock=FakeClock(0))
+    assert plan_detail_requests({"apartments": 3, "rent": 0}, store=store, budget=60, tick_max=50) == {"apartments": 3}
+    assert plan_detail_requests({"apartments": 500, "rent": 0}, store=store, budget=60, tick_max=50) == {"apartments": 50}
+    assert plan_detail_requests({"apartments": 500, "rent": 0}, store=store, budget=60, tick_max=50) == {"apartments": 7}
+    assert plan_detail_requests({"apartments": 500, "rent": 0}, store=store, budget=60, tick_max=50) == {}
+    assert plan_detail_requests({"apartments": 0, "rent": 0}, store=store) == {}
@@ -53,30 +53,66 @@ def _assert_crontab_at(cr, *, hour: int, minute: int):
 
 
 def test_beat_schedule_exists_and_valid(app_celery_module):
+    from adaptive_schedule import AdaptiveSchedule
+
     celery = app_celery_module.celery
     schedule = celery.conf.beat_schedule
 
-    assert "first_parse_every_1_hour" in schedule
-    assert "second_parse_a_day" in schedule
-    assert "send_webhooks_once_a_day" in schedule
+    assert "first_parse_apartments_adaptive" in schedule
+    assert "second_parse_details_continuously" in schedule
+    assert "send_apartments_webhooks_once_a_day" in schedule
 
-    hourly = schedule["first_parse_every_1_hour"]
-    assert hourly["task"] == "tasks.parse_apartment_list"
-    assert isinstance(hourly["schedule"], (int, float))
-    assert hourly["schedule"] == 3600.0
+    apartments = schedule["first_parse_apartments_adaptive"]
+    assert apartments["task"] == "tasks.parse_apartment_list"
+    assert isinstance(apartments["schedule"], AdaptiveSchedule)
+    assert apartments["schedule"].name == "apartments_list"
+    assert schedule["first_parse_rent_adaptive"]["schedule"].name == "rent_list"
 
-    from celery.schedules import crontab as crontab_cls
-    second = schedule["second_parse_a_day"]
-    sendwh = schedule["send_webhooks_once_a_day"]
+    details = schedule["second_parse_details_continuously"]
+    assert details["task"] == "tasks.schedule_detail_parsing"
+    assert isinstance(details["schedule"], (int, float))
 
-    assert second["task"] == "tasks.parse_apartment_details"
-    assert sendwh["task"] == "tasks.send_webhook_to_django"
-    assert isinstance(second["schedule"], crontab_cls)
+    sendwh = schedule["send_apartments_webhooks_once_a_day"]
+    assert sendwh["task"] == "tasks.send_apartments_webhook_to_django"
     assert isinstance(sendwh["schedule"], crontab_cls)
+    _assert_crontab_at(sendwh["schedule"], hour=1, minute=0)
 
-    _assert_crontab_at(second["schedule"], hour=12, minute=0)
-    _assert_crontab_at(sendwh["schedule"], hour=13, minute=0)
+    usage = schedule["report_index_usage_once_a_day"]
+    assert usage["task"] == "tasks.report_index_usage"
+    assert isinstance(usage["schedule"], crontab_cls)
 
 
 def test_autodiscover_does_not_crash_on_import(app_celery_module):
     assert hasattr(app_celery_module, "celery")
+
+
+@pytest.mark.parametrize("task_name,queue", [
+    ("tasks.parse_apartment_list", "list"),
+    ("tasks.parse_rent_list", "list"),
+    ("tasks.parse_apartment_details", "detail"),
+    ("tasks.parse_rent_details_chunk", "detail"),
+    ("tasks.send_apartments_webhook_to_django", "webhook"),
+    ("tasks.retry_webhooks", "webhook"),
+    ("tasks.aggregate_detail_results", "maintenance"),
+    ("tasks.schedule_detail_parsing", "maintenance"),
+    ("tasks.reap_expired_leases", "maintenance"),
+    ("tasks.retranslate", "batch"),
+    ("tasks.report_index_usage", "batch"),
+])
+def test_tasks_are_routed_to_dedicated_queues(app_celery_module, task_name, queue):
+    route = app_celery_module.celery.amqp.router.route({}, task_name)
+    assert route["queue"].name == queue
+
+
+def test_every_routed_queue_has_worker_profile(app_celery_module):
+    profiles = app_celery_module.WORKER_PROFILES
+    declared = {q.name for q in app_celery_module.celery.conf.task_queues}
+    routed = {route["queue"] for route in app_celery_module.TASK_ROUTES.values()}
+
+    assert routed <= declared == set(profiles)
+    assert profiles["list"]["prefetch_multiplier"] == 1
+    assert profiles["detail"]["prefetch_multiplier"] == 1
+    # Тик деталей не ждёт за долгими задачами пакетной очереди
+    assert profiles["maintenance"]["time_limit"] < profiles["batch"]["time_limit"]
+    for profile in profiles.values():
+        assert profile["soft_time_limit"] < profile["time_limit"]
@@ -3,6 +3,7 @@ import importlib
 import sys
 import types
 
+import mongomock
 import pytest
 
 
@@ -12,7 +13,7 @@ class FakeCollection:
     def __init__(self, docs=None):
         self._docs = list(docs or [])
 
-    def find_one(self, filter=None):
+    def find_one(self, filter=None, projection=None):
         if not filter:
             return self._docs[0] if self._docs else None
         if "_id" in filter:
@@ -98,3 +99,56 @@ def test_apartment_get_404_not_found(client_with_docs, monkeypatch):
     r = client.get("/apartments/unknown", headers={"Authorization": "Bearer good"})
     assert r.status_code == 404
     assert r.get_json()["error"] == "Apartment not found"
+
+
+# ---------------- документ, записанный парсингом деталей ----------------
+
+class BulkCollection:
+    """Коллекция mongomock с bulk_write, который понимает UpdateOne из pymongo 4"""
+
+    def __init__(self, coll):
+        self.coll = coll
+
+    def __getattr__(self, name):
+        return getattr(self.coll, name)
+
+    def bulk_write(self, ops, ordered=True):
+        modified = sum(self.coll.update_one(op._filter, op._doc).modified_count for op in ops)
+        return types.SimpleNamespace(matched_count=modified, modified_count=modified, upserted_count=0)
+
+
+@pytest.fixture
+def client_with_mongo(monkeypatch):
+    mongo = mongomock.MongoClient()
+    fake_database_mod = types.ModuleType("database")
+    fake_database_mod.get_client = lambda: mongo
+    fake_database_mod.get_apartments_db = lambda: mongo.apartments
+    fake_database_mod.get_rental_db = lambda: mongo.rental
+    monkeypatch.setitem(sys.modules, "database", fake_database_mod)
+
+    monkeypatch.delitem(sys.modules, "app.main", raising=False)
+    mod = importlib.import_module("app.main")
+    monkeypatch.setattr(mod, "validate_token", lambda t: {"sub": "user"})
+    return mod.app.test_client(), mongo
+
+
+@pytest.mark.parametrize("path, db_name, kind", [
+    ("/apartments", "apartments", "apartments"),
+    ("/rent", "rental", "rent"),
+])
+def test_get_listing_written_by_detail_path(client_with_mongo, path, db_name, kind):
+    import app.services as srv
+    from app.webhooks import mark_delivered
+    client, mongo = client_with_mongo
+    coll = mongo[db_name][db_name]
+    srv.insert_new_listings(coll, [{"_id": "42", "link": "http://x/42", "state": "processing", "lease_owner": "w1"}])
+    coll.update_one({"_id": "42"}, {"$currentDate": {"lease_expires": True, "dispatched_at": True}})
+
+    srv.update_listing_details(BulkCollection(coll), [coll.find_one({"_id": "42"})],
+                               lambda url: {"title": "flat"}, dict, kind, "w1")
+    mark_delivered(BulkCollection(coll), [coll.find_one({"_id": "42"})])
+
+    r = client.get(f"{path}/42", headers={"Authorization": "Bearer good"})
+
+    assert r.status_code == 200
+    assert r.get_json() == {"_id": "42", "link": "http://x/42", "state": "second", "title": "flat"}
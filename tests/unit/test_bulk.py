@@ -0,0 +1,87 @@
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import app.bulk as bulk
+
+
+class FakeBulkResult:
+    def __init__(self, n):
+        self.matched_count = n
+        self.modified_count = n
+        self.upserted_count = 0
+
+
+class FakeCollection:
+    name = "apartments"
+
+    def __init__(self, fail_with=None):
+        self.calls = []
+        self.fail_with = fail_with
+
+    def bulk_write(self, ops, ordered=True):
+        self.calls.append((list(ops), ordered))
+        if self.fail_with:
+            raise BulkWriteError(self.fail_with)
+        return FakeBulkResult(len(ops))
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _update(i):
+    return UpdateOne({"_id": str(i)}, {"$set": {"state": "second"}}, upsert=True)
+
+
+def test_flushes_by_batch_size():
+    coll = FakeCollection()
+
+    with bulk.BulkWriter(coll, batch_size=2, flush_interval=3600) as writer:
+        for i in range(5):
+            writer.add(_update(i))
+        assert [b["size"] for b in writer.batches] == [2, 2]
+
+    assert [b["size"] for b in writer.batches] == [2, 2, 1]
+    assert writer.modified_count == 5
+    assert all(ordered is False for _, ordered in coll.calls)
+
+
+def test_flushes_by_time_limit():
+    coll = FakeCollection()
+    clock = _Clock()
+    writer = bulk.BulkWriter(coll, batch_size=100, flush_interval=5, clock=clock)
+
+    writer.add(_update(1))
+    clock.now = 3
+    writer.add(_update(2))
+    assert writer.batches == []
+
+    clock.now = 6
+    writer.add(_update(3))
+    assert len(writer.batches) == 1 and writer.batches[0]["size"] == 3
+
+
+def test_reports_partial_errors():
+    details = {"nMatched": 1, "nModified": 1, "nUpserted": 1,
+               "writeErrors": [{"index": 2, "code": 11000, "errmsg": "dup"}]}
+    coll = FakeCollection(fail_with=details)
+
+    with bulk.BulkWriter(coll, batch_size=10) as writer:
+        writer.add(_update(1))
+        writer.add(_update(2))
+        writer.add(InsertOne({"_id": "dup"}))
+
+    assert writer.batches == [{"size": 3, "matched": 1, "modified": 1, "upserted": 1, "errors": 1}]
+    assert writer.error_count == 1
+    assert writer.upserted_count == 1
+
+
+def test_flush_on_empty_is_noop():
+    coll = FakeCollection()
+    writer = bulk.BulkWriter(coll)
+    assert writer.flush() is None
+    assert writer.batches == [] and coll.calls == []
@@ -0,0 +1,99 @@
+import mongomock
+import pytest
+
+import app.crawler as crawler
+
+
+def _pages(*pages):
+    """Фейковый парсер страниц: pages[i] - ID на странице i + 1"""
+    calls = []
+
+    def parse_page(page):
+        calls.append(page)
+        if page > len(pages):
+            return []
+        return [{"_id": _id, "link": f"https://realt.by/{_id}/", "state": "first"} for _id in pages[page - 1]]
+
+    return parse_page, calls
+
+
+def test_crawl_stops_on_first_fully_known_page():
+    parse_page, calls = _pages(["5", "4"], ["3", "2"], ["1", "0"], ["-1"])
+    known = {"3", "2", "1", "0"}
+
+    out = crawler.crawl_new_listings(parse_page, lambda ids: known & set(ids), window=2)
+
+    assert [item["_id"] for item in out] == ["5", "4"]
+    assert sorted(calls) == [1, 2]
+
+
+def test_crawl_commits_only_processed_pages():
+    committed = []
+
+    def parse_page(page):
+        ids = {1: ["5", "4"], 2: ["3", "2"], 3: ["1"], 4: ["0"]}[page]
+        items = [{"_id": _id, "state": "first"} for _id in ids]
+        return crawler.ListingPage(items, commit=lambda: committed.append(page))
+
+    out = crawler.crawl_new_listings(parse_page, lambda ids: {"3", "2"} & set(ids), window=4)
+
+    assert [item["_id"] for item in out] == ["5", "4"]
+    assert committed == []
+    out.commit()
+    # Страницы 3 и 4 загружены в том же окне, но не разобраны
+    assert committed == [1, 2]
+
+
+def test_crawl_catches_up_across_several_windows():
+    parse_page, calls = _pages(["9", "8"], ["7", "6"], ["5", "4"], ["3", "2"])
+    known = {"3", "2"}
+
+    out = crawler.crawl_new_listings(parse_page, lambda ids: known & set(ids), window=2)
+
+    assert [item["_id"] for item in out] == ["9", "8", "7", "6", "5", "4"]
+    assert sorted(calls) == [1, 2, 3, 4]
+
+
+def test_crawl_skips_items_shifted_between_pages():
+    # Новые объявления сдвигают выдачу: "6" попадает на обе страницы
+    parse_page, _ = _pages(["7", "6"], ["6", "5"], ["4"])
+    known = {"4"}
+
+    out = crawler.crawl_new_listings(parse_page, lambda ids: known & set(ids), window=3)
+
+    assert [item["_id"] for item in out] == ["7", "6", "5"]
+
+
+def test_crawl_respects_max_pages():
+    parse_page, calls = _pages(*[[str(i)] for i in range(100)])
+
+    out = crawler.crawl_new_listings(parse_page, lambda ids: set(), window=3, max_pages=5)
+
+    assert len(out) == 5
+    assert max(calls) == 5
+
+
+def test_crawl_first_page_error_propagates():
+    def parse_page(page):
+        raise RuntimeError("realt down")
+
+    with pytest.raises(RuntimeError):
+        crawler.crawl_new_listings(parse_page, lambda ids: set())
+
+
+def test_crawl_later_page_error_keeps_collected():
+    def parse_page(page):
+        if page == 2:
+            raise RuntimeError("timeout")
+        return [{"_id": f"p{page}"}]
+
+    out = crawler.crawl_new_listings(parse_page, lambda ids: set(), window=2)
+
+    assert out == [{"_id": "p1"}]
+
+
+def test_find_known_ids_queries_only_candidates():
+    coll = mongomock.MongoClient()["testdb"]["apartments"]
+    coll.insert_many([{"_id": "1"}, {"_id": "2"}, {"_id": "3"}])
+
+    assert crawler.find_known_ids(coll, ["2", "3", "4"]) == {"2", "3"}
@@ -1,5 +1,4 @@
 # tests/unit/test_database.py
-import types
 import pytest
 
 import app.database as database  # замените на ваш путь
@@ -10,51 +9,78 @@ class DummyDB:
 
 
 class DummyClient:
-    def __init__(self, uri):
+    def __init__(self, uri, **kwargs):
         # сохраняем, что было передано
         self._uri = uri
-        # эмулируем доступ к атрибуту .apartments
+        self.kwargs = kwargs
+        self.closed = False
+        # эмулируем доступ к атрибутам .apartments / .rental
         self.apartments = DummyDB()
+        self.rental = DummyDB()
 
+    def close(self):
+        self.closed = True
 
-def test_get_db_returns_apartments(monkeypatch):
-    captured = {}
 
-    def fake_client(uri):
-        captured["uri"] = uri
-        return DummyClient(uri)
+@pytest.fixture
+def fake_mongo(monkeypatch):
+    calls = []
+
+    def fake_client(uri, **kwargs):
+        client = DummyClient(uri, **kwargs)
+        calls.append(client)
+        return client
 
     # Подменяем MongoClient в тестируемом модуле
     monkeypatch.setattr(database, "MongoClient", fake_client)
+    database.close_client()
+    yield calls
+    database.close_client()
+
 
-    db = database.get_apartments_db()
+def test_get_db_returns_apartments(fake_mongo):
+    with database.get_apartments_db() as db:
+        # Проверяем, что вернулся именно DummyDB (экземпляр apartments)
+        assert isinstance(db, DummyDB)
 
     # Проверяем, что вызвали с правильным URI
-    assert captured["uri"] == "mongodb://mongo:27017/mydatabase"
+    assert fake_mongo[0]._uri == "mongodb://mongo:27017/mydatabase"
 
-    # Проверяем, что вернулся именно DummyDB (экземпляр apartments)
-    assert isinstance(db, DummyDB)
 
+def test_get_db_multiple_calls_share_one_client(fake_mongo):
+    with database.get_apartments_db() as db1:
+        pass
+    with database.get_rental_db() as db2:
+        pass
 
-def test_get_db_multiple_calls_create_new_clients(monkeypatch):
-    calls = []
+    assert db1 is fake_mongo[0].apartments
+    assert db2 is fake_mongo[0].rental
+    assert database.get_client() is fake_mongo[0]
+    # MongoClient создан один раз и не закрывается после использования
+    assert len(fake_mongo) == 1
+    assert fake_mongo[0].closed is False
 
-    def fake_client(uri):
-        calls.append(uri)
-        return DummyClient(uri)
 
-    monkeypatch.setattr(database, "MongoClient", fake_client)
+def test_client_recreated_after_fork(fake_mongo):
+    first = database.get_client()
+    database._reset_after_fork()
+    second = database.get_client()
+
+    assert first is not second
+    assert len(fake_mongo) == 2
+
+
+def test_pool_options_from_uri_take_precedence():
+    options = database._client_options("mongodb://mongo:27017/mydatabase?maxPoolSize=5&connectTimeoutMS=100")
+
+    assert "maxPoolSize" not in options
+    assert "connectTimeoutMS" not in options
+    assert options["serverSelectionTimeoutMS"] == database.DEFAULT_CLIENT_OPTIONS["serverSelectionTimeoutMS"]
+
+
+def test_close_client(fake_mongo):
+    client = database.get_client()
+    database.close_client()
 
-    db1 = database.get_apartments_db()
-    db2 = database.get_apartments_db()
-
-    # Должны быть разные объекты DummyDB
-    assert db1 is not db2
-    # Но оба должны быть DummyDB
-    assert isinstance(db1, DummyDB)
-    assert isinstance(db2, DummyDB)
-    # И MongoClient вызывался дважды
-    assert calls == [
-        "mongodb://mongo:27017/mydatabase",
-        "mongodb://mongo:27017/mydatabase",
-    ]
+    assert client.closed is True
+    assert database.get_client() is not client
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import app.fetcher as fetcher
+
+
+def test_fetch_details_returns_all_results():
+    docs = [{"_id": str(i), "link": f"https://realt.by/object/{i}/"} for i in range(10)]
+
+    out = list(fetcher.fetch_details(docs, lambda url: {"link": url}, max_workers=4))
+
+    assert len(out) == 10
+    assert {doc["_id"] for doc, _, _ in out} == {d["_id"] for d in docs}
+    assert all(err is None and res["link"] == doc["link"] for doc, res, err in out)
+
+
+def test_fetch_details_respects_per_host_limit():
+    docs = [{"_id": str(i), "link": f"https://realt.by/object/{i}/"} for i in range(12)]
+    lock = threading.Lock()
+    state = {"current": 0, "peak": 0}
+
+    def slow_parse(url):
+        with lock:
+            state["current"] += 1
+            state["peak"] = max(state["peak"], state["current"])
+        time.sleep(0.02)
+        with lock:
+            state["current"] -= 1
+        return {}
+
+    list(fetcher.fetch_details(docs, slow_parse, max_workers=8, per_host=3))
+
+    assert 1 < state["peak"] <= 3
+
+
+def test_fetch_details_yields_errors_without_stopping():
+    docs = [{"_id": "ok", "link": "https://realt.by/ok/"}, {"_id": "bad", "link": "https://realt.by/bad/"}]
+
+    def parse(url):
+        if "bad" in url:
+            raise ValueError("broken page")
+        return {"title": "ok"}
+
+    out = {doc["_id"]: (res, err) for doc, res, err in fetcher.fetch_details(docs, parse)}
+
+    assert out["ok"] == ({"title": "ok"}, None)
+    assert out["bad"][0] is None
+    assert isinstance(out["bad"][1], ValueError)
+
+
+def test_fetch_details_empty_input():
+    assert list(fetcher.fetch_details([], lambda url: {})) == []
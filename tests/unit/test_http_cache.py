@@ -0,0 +1,174 @@
+from contextlib import contextmanager
+
+import mongomock
+import pytest
+
+import app.http_cache as http_cache
+
+
+class _Response:
+    def __init__(self, status_code=200, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+
+class _StreamResponse(_Response):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chunks_read = 0
+
+    def iter_bytes(self):
+        for i in range(0, len(self.text), 4):
+            self.chunks_read += 1
+            yield self.text[i:i + 4].encode()
+
+
+class _Session:
+    """Отдаёт заранее заданные ответы и запоминает заголовки запросов"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.sent_headers = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.sent_headers.append(dict(headers or {}))
+        return self.responses.pop(0)
+
+    @contextmanager
+    def stream(self, method, url, headers=None):
+        yield self.get(url, headers=headers)
+
+
+@pytest.fixture(params=["disk", "mongo"])
+def cache(request, tmp_path):
+    if request.param == "disk":
+        store = http_cache.DiskCacheStore(str(tmp_path))
+    else:
+        store = http_cache.MongoCacheStore(mongomock.MongoClient()["http_cache"]["pages"])
+    return http_cache.HttpCache(store)
+
+
+URL = "https://realt.by/rent/flat-for-long/?sortType=createdAt&page=1"
+
+
+def test_first_fetch_is_changed_and_sends_no_validators(cache):
+    session = _Session(_Response(200, "<html>1</html>", {"ETag": '"v1"'}))
+
+    response = cache.fetch(session, URL, headers={"user-agent": "UA"})
+
+    assert response.changed is True
+    assert response.text == "<html>1</html>"
+    assert session.sent_headers == [{"user-agent": "UA"}]
+
+
+def test_not_modified_returns_cached_body(cache):
+    session = _Session(
+        _Response(200, "<html>страница</html>", {"ETag": '"v1"', "Last-Modified": "Wed, 01 Oct 2025 10:00:00 GMT"}),
+        _Response(304, ""),
+    )
+
+    cache.fetch(session, URL)
+    response = cache.fetch(session, URL)
+
+    assert session.sent_headers[1]["If-None-Match"] == '"v1"'
+    assert session.sent_headers[1]["If-Modified-Since"] == "Wed, 01 Oct 2025 10:00:00 GMT"
+    assert response.status_code == 304
+    assert response.changed is False
+    assert response.text == "<html>страница</html>"
+
+
+def test_same_body_without_validators_is_unchanged(cache):
+    session = _Session(_Response(200, "<html>same</html>"), _Response(200, "<html>same</html>"),
+                       _Response(200, "<html>new</html>"))
+
+    assert cache.fetch(session, URL).changed is True
+    assert cache.fetch(session, URL).changed is False
+    assert cache.fetch(session, URL).changed is True
+
+
+def test_error_responses_are_not_cached(cache):
+    session = _Session(_Response(503, "busy"), _Response(200, "<html>ok</html>"))
+
+    assert cache.fetch(session, URL).status_code == 503
+    assert cache.fetch(session, URL).changed is True
+
+
+def test_cache_without_store_passes_through():
+    cache = http_cache.HttpCache(store=None)
+    session = _Session(_Response(200, "a"), _Response(200, "a"))
+
+    assert cache.fetch(session, URL).changed is True
+    assert cache.fetch(session, URL).changed is True
+    assert session.sent_headers == [{}, {}]
+
+
+def test_broken_store_does_not_break_fetch():
+    class _BrokenStore:
+        def get(self, url):
+            raise OSError("disk full")
+
+        def set(self, url, entry):
+            raise OSError("disk full")
+
+    cache = http_cache.HttpCache(_BrokenStore())
+    response = cache.fetch(_Session(_Response(200, "ok")), URL)
+
+    assert response.text == "ok" and response.changed is True
+
+
+def _first_word(chunks):
+    """Читает поток до первого пробела и возвращает прочитанное слово"""
+    word = b""
+    for chunk in chunks:
+        word += chunk
+        if b" " in word:
+            break
+    return word.split(b" ")[0].decode()
+
+
+def test_fetch_streamed_caches_consumed_value(cache):
+    first = _StreamResponse(200, "alpha beta gamma delta", {"ETag": '"v1"'})
+    session = _Session(first, _StreamResponse(304, ""))
+
+    result = cache.fetch_streamed(session, URL, _first_word)
+    assert result.value == "alpha" and result.changed is True
+    # Поток прочитан не до конца
+    assert first.chunks_read < len(first.text) / 4
+
+    cached = cache.fetch_streamed(session, URL, _first_word)
+    assert session.sent_headers[1]["If-None-Match"] == '"v1"'
+    assert cached.value == "alpha" and cached.changed is False
+
+
+def test_fetch_streamed_same_value_is_unchanged(cache):
+    session = _Session(_StreamResponse(200, "alpha beta"), _StreamResponse(200, "alpha omega"))
+
+    assert cache.fetch_streamed(session, URL, _first_word).changed is True
+    assert cache.fetch_streamed(session, URL, _first_word).changed is False
+
+
+def test_fetch_streamed_defer_save_waits_for_commit(cache):
+    session = _Session(*(_StreamResponse(200, "alpha beta", {"ETag": '"v1"'}) for _ in range(3)))
+
+    first = cache.fetch_streamed(session, URL, _first_word, defer_save=True)
+    assert first.changed is True
+    # Результат не сохранён вызывающим - следующий запрос без валидаторов и снова changed
+    second = cache.fetch_streamed(session, URL, _first_word, defer_save=True)
+    assert "If-None-Match" not in session.sent_headers[1]
+    assert second.changed is True
+
+    second.commit()
+    third = cache.fetch_streamed(session, URL, _first_word, defer_save=True)
+    assert session.sent_headers[2]["If-None-Match"] == '"v1"'
+    assert third.changed is False
+
+
+def test_fetch_and_fetch_streamed_do_not_share_entries(cache):
+    session = _Session(_Response(200, "<html>page</html>", {"ETag": '"v1"'}), _StreamResponse(200, "alpha beta"))
+
+    cache.fetch(session, URL)
+    result = cache.fetch_streamed(session, URL, _first_word)
+
+    assert "If-None-Match" not in session.sent_headers[1]
+    assert result.value == "alpha"
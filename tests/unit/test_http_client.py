@@ -0,0 +1,41 @@
+import httpx
+import pytest
+
+import app.http_client as http_client
+
+
+@pytest.fixture(autouse=True)
+def fresh_client():
+    http_client.close_http_client()
+    yield
+    http_client.close_http_client()
+
+
+def test_client_is_shared_within_process():
+    client = http_client.get_http_client()
+
+    assert isinstance(client, httpx.Client)
+    assert http_client.get_http_client() is client
+
+
+def test_client_has_timeouts_and_follows_redirects():
+    client = http_client.get_http_client()
+
+    assert client.timeout.read == http_client.HTTP_READ_TIMEOUT
+    assert client.timeout.connect == http_client.HTTP_CONNECT_TIMEOUT
+    assert client.follow_redirects is True
+
+
+def test_client_recreated_after_fork():
+    client = http_client.get_http_client()
+    http_client._reset_after_fork()
+
+    assert http_client.get_http_client() is not client
+
+
+def test_close_http_client():
+    client = http_client.get_http_client()
+    http_client.close_http_client()
+
+    assert client.is_closed
+    assert http_client.get_http_client() is not client
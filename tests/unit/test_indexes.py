@@ -0,0 +1,87 @@
+from datetime import datetime
+
+import mongomock
+import pytest
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from app.indexes import (
+    LISTING_INDEXES,
+    IndexSpec,
+    ensure_indexes,
+    index_usage,
+    unused_indexes,
+)
+
+
+@pytest.fixture
+def coll():
+    return mongomock.MongoClient()["indexes"]["apartments"]
+
+
+def test_ensure_indexes_creates_missing_and_skips_existing(coll):
+    report = ensure_indexes(coll, LISTING_INDEXES)
+
+    assert set(report.values()) == {"created"}
+    info = coll.index_information()
+    assert info["state_first_created_at"]["partialFilterExpression"] == {"state": "first"}
+    assert info["state_first_created_at"]["key"] == [("state", 1), ("created_at", 1), ("_id", 1)]
+    assert info["link_unique"]["unique"] is True
+
+    assert set(ensure_indexes(coll, LISTING_INDEXES).values()) == {"exists"}
+
+
+def test_link_is_unique_only_for_documents_with_link(coll):
+    ensure_indexes(coll, LISTING_INDEXES)
+    coll.insert_many([{"_id": "a"}, {"_id": "b"}, {"_id": "c", "link": "http://x/1"}])
+
+    with pytest.raises(DuplicateKeyError):
+        coll.insert_one({"_id": "d", "link": "http://x/1"})
+
+
+def test_failed_index_does_not_block_the_rest(coll):
+    class Conflicting:
+        full_name = "indexes.apartments"
+
+        def __init__(self):
+            self.created = []
+
+        def index_information(self):
+            return {"_id_": {}}
+
+        def create_index(self, keys, name, **options):
+            if name == "broken":
+                raise OperationFailure("Index already exists with a different name", code=85)
+            self.created.append(name)
+
+    target = Conflicting()
+    specs = [IndexSpec("broken", [("state", 1)]), IndexSpec("ok", [("created_at", 1)])]
+
+    report = ensure_indexes(target, specs)
+
+    assert report["broken"].startswith("error:")
+    assert report["ok"] == "created"
+    assert target.created == ["ok"]
+
+
+def test_index_usage_reads_index_stats():
+    since = datetime(2025, 6, 1)
+
+    class WithStats:
+        full_name = "indexes.apartments"
+
+        def aggregate(self, pipeline):
+            assert pipeline == [{"$indexStats": {}}]
+            return iter([
+                {"name": "_id_", "accesses": {"ops": 0, "since": since}},
+                {"name": "state_first_created_at", "accesses": {"ops": 42, "since": since}},
+                {"name": "state_created_at", "accesses": {"ops": 0, "since": since}},
+            ])
+
+    usage = index_usage(WithStats())
+
+    assert usage["state_first_created_at"] == {"ops": 42, "since": since}
+    assert unused_indexes(usage) == ["state_created_at"]
+
+
+def test_index_usage_is_empty_without_server_support(coll):
+    assert index_usage(coll) == {}
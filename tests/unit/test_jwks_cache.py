@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+import app.jwks_cache as jwks_cache
+
+
+AUDIENCE = "test-aud"
+ISSUER = "https://issuer.test"
+
+
+def _make_key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    jwk.update({"kid": kid, "use": "sig", "alg": "RS256"})
+    return private_key, jwk
+
+
+class _FakeJWKS:
+    """Локальный JWKS-эндпоинт на случайном порту"""
+
+    def __init__(self):
+        self.keys = []
+        self.hits = 0
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                owner.hits += 1
+                body = json.dumps({"keys": owner.keys}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/keys"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def jwks_server():
+    server = _FakeJWKS()
+    yield server
+    server.close()
+
+
+class _Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _token(private_key, kid, exp_in=300):
+    claims = {"sub": "user", "aud": AUDIENCE, "iss": ISSUER, "exp": int(time.time()) + exp_in}
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+def test_signing_key_is_fetched_once_and_cached(jwks_server):
+    private_key, jwk = _make_key("k1")
+    jwks_server.keys = [jwk]
+    cache = jwks_cache.JWKSCache(jwks_server.url)
+    token = _token(private_key, "k1")
+
+    for _ in range(5):
+        key = cache.get_signing_key_from_jwt(token)
+        payload = jwt.decode(token, key.key, algorithms=["RS256"], audience=AUDIENCE, issuer=ISSUER)
+        assert payload["sub"] == "user"
+
+    assert jwks_server.hits == 1
+
+
+def test_keys_refreshed_after_ttl(jwks_server):
+    _, jwk = _make_key("k1")
+    jwks_server.keys = [jwk]
+    clock = _Clock()
+    cache = jwks_cache.JWKSCache(jwks_server.url, ttl=100, min_refresh_interval=10, clock=clock)
+
+    cache.get_signing_key("k1")
+    clock.now += 50
+    cache.get_signing_key("k1")
+    assert jwks_server.hits == 1
+
+    clock.now += 60
+    cache.get_signing_key("k1")
+    assert jwks_server.hits == 2
+
+
+def test_unknown_kid_refresh_is_rate_limited(jwks_server):
+    _, jwk1 = _make_key("k1")
+    _, jwk2 = _make_key("k2")
+    jwks_server.keys = [jwk1]
+    clock = _Clock()
+    cache = jwks_cache.JWKSCache(jwks_server.url, ttl=3600, min_refresh_interval=60, clock=clock)
+    cache.get_signing_key("k1")
+
+    # Неизвестный kid сразу после загрузки не вызывает повторный запрос
+    with pytest.raises(jwks_cache.PyJWKClientError):
+        cache.get_signing_key("k2")
+    with pytest.raises(jwks_cache.PyJWKClientError):
+        cache.get_signing_key("k2")
+    assert jwks_server.hits == 1
+
+    # После ротации ключей и паузы ключ подтягивается
+    jwks_server.keys = [jwk1, jwk2]
+    clock.now += 61
+    assert cache.get_signing_key("k2").key_id == "k2"
+    assert jwks_server.hits == 2
+
+
+def test_cached_keys_survive_jwks_outage(jwks_server):
+    _, jwk = _make_key("k1")
+    jwks_server.keys = [jwk]
+    clock = _Clock()
+    cache = jwks_cache.JWKSCache(jwks_server.url, ttl=10, min_refresh_interval=1, clock=clock)
+    cache.get_signing_key("k1")
+
+    cache.url = "http://127.0.0.1:9/unreachable"
+    clock.now += 20
+    assert cache.get_signing_key("k1").key_id == "k1"
+
+
+def test_decode_with_cache_skips_verification_for_known_token(jwks_server):
+    private_key, jwk = _make_key("k1")
+    jwks_server.keys = [jwk]
+    keys = jwks_cache.JWKSCache(jwks_server.url)
+    tokens = jwks_cache.TokenCache()
+    token = _token(private_key, "k1")
+
+    first = jwks_cache.decode_with_cache(token, keys, tokens, algorithms=["RS256"], audience=AUDIENCE, issuer=ISSUER)
+    keys.get_signing_key_from_jwt = lambda t: pytest.fail("signature must not be re-verified")
+    second = jwks_cache.decode_with_cache(token, keys, tokens, algorithms=["RS256"], audience=AUDIENCE, issuer=ISSUER)
+
+    assert first == second
+
+
+def test_token_cache_expires_and_is_bounded():
+    clock = _Clock(now=100)
+    cache = jwks_cache.TokenCache(maxsize=2, clock=clock)
+
+    cache.put("a", {"exp": 150})
+    cache.put("b", {"exp": 500})
+    cache.put("c", {"exp": 500})
+    assert cache.get("a") is None  # вытеснен как самый старый
+    assert cache.get("b") == {"exp": 500}
+
+    clock.now = 600
+    assert cache.get("b") is None
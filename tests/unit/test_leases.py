@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.leases import (
+    DETAIL_MAX_ATTEMPTS,
+    claim_listings,
+    dispatchable_query,
+    reap_expired_leases,
+    release_listings,
+    reserve_for_dispatch,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def coll(mongo_db):
+    mongo_db.apartments.insert_many([{"_id": str(i), "state": "first"} for i in range(5)])
+    mongo_db.apartments.insert_one({"_id": "done", "state": "second"})
+    return mongo_db.apartments
+
+
+def test_claim_moves_documents_to_processing(coll):
+    clock = FakeClock()
+    docs = claim_listings(coll, "w1", limit=3, lease_seconds=60, clock=clock)
+
+    assert [d["_id"] for d in docs] == ["0", "1", "2"]
+    for doc in coll.find({"_id": {"$in": ["0", "1", "2"]}}):
+        assert doc["state"] == "processing"
+        assert doc["lease_owner"] == "w1"
+        # Mongo хранит время в UTC без tzinfo
+        assert doc["lease_expires"] == (clock.now + timedelta(seconds=60)).replace(tzinfo=None)
+
+
+def test_concurrent_claims_do_not_overlap(coll):
+    first = claim_listings(coll, "w1", limit=3)
+    second = claim_listings(coll, "w2", limit=3)
+    third = claim_listings(coll, "w3", limit=3)
+
+    assert {d["_id"] for d in first}.isdisjoint(d["_id"] for d in second)
+    assert len(first) + len(second) == 5
+    assert third == []
+
+
+def test_claim_respects_query(coll):
+    docs = claim_listings(coll, "w1", query={"_id": {"$in": ["3", "done"]}})
+    assert [d["_id"] for d in docs] == ["3"]
+
+
+def test_release_only_touches_own_leases(coll):
+    claim_listings(coll, "w1", limit=2)
+    claim_listings(coll, "w2", limit=1)
+
+    clock = FakeClock()
+    assert release_listings(coll, ["0", "1", "2"], "w1", clock=clock) == 2
+    released = coll.find_one({"_id": "0"})
+    assert released.pop("updated_at")
+    assert released == {"_id": "0", "state": "first", "detail_attempts": 1,
+                        "next_attempt_at": (clock.now + timedelta(seconds=300)).replace(tzinfo=None)}
+    assert coll.find_one({"_id": "2"})["lease_owner"] == "w2"
+
+
+def test_reaper_returns_only_expired_leases(coll):
+    clock = FakeClock()
+    claim_listings(coll, "dead", limit=2, lease_seconds=60, clock=clock)
+    clock.now += timedelta(seconds=30)
+    claim_listings(coll, "alive", limit=1, lease_seconds=60, clock=clock)
+
+    clock.now += timedelta(seconds=45)
+    assert reap_expired_leases(coll, clock=clock) == 2
+    assert {d["_id"] for d in coll.find({"state": "first"})} == {"0", "1", "3", "4"}
+    assert coll.find_one({"_id": "2"})["lease_owner"] == "alive"
+
+
+def test_reserve_for_dispatch_skips_already_dispatched(coll):
+    clock = FakeClock()
+
+    assert reserve_for_dispatch(coll, 2, clock=clock) == ["0", "1"]
+    # Следующий тик не тратит бюджет на пачку, которая ещё ждёт в очереди
+    assert reserve_for_dispatch(coll, 2, clock=clock) == ["2", "3"]
+    assert reserve_for_dispatch(coll, 5, ids=["0", "1", "4"], clock=clock) == ["4"]
+    assert coll.count_documents(dispatchable_query(clock=clock)) == 0
+
+
+def test_reserve_for_dispatch_retries_after_ttl_and_release(coll):
+    clock = FakeClock()
+    assert reserve_for_dispatch(coll, 5, ttl_seconds=60, clock=clock) == ["0", "1", "2", "3", "4"]
+
+    claim_listings(coll, "w1", limit=1, query={"_id": "0"}, clock=clock)
+    release_listings(coll, ["0"], "w1", clock=clock)
+    # Неразобранное ждёт паузы после неудачи, остальные - истечения ttl
+    assert reserve_for_dispatch(coll, 5, ttl_seconds=60, clock=clock) == []
+
+    clock.now += timedelta(seconds=61)
+    assert reserve_for_dispatch(coll, 5, ttl_seconds=60, clock=clock) == ["1", "2", "3", "4"]
+
+    clock.now += timedelta(seconds=300)
+    assert reserve_for_dispatch(coll, 5, ttl_seconds=60, clock=clock) == ["0", "1", "2", "3", "4"]
+
+
+def test_failing_pages_do_not_starve_new_listings(mongo_db):
+    coll = mongo_db.apartments
+    clock = FakeClock()
+    # Снятые объявления старше и (по случайному uuid5) раньше по _id, чем новые
+    coll.insert_many([{"_id": f"a{i:02}", "state": "first", "created_at": clock.now} for i in range(60)])
+    coll.insert_many([{"_id": f"z{i:02}", "state": "first", "created_at": clock.now + timedelta(minutes=1)}
+                      for i in range(10)])
+    new = set()
+    for tick in range(3):
+        ids = reserve_for_dispatch(coll, 50, clock=clock)
+        new.update(_id for _id in ids if _id.startswith("z"))
+        claim_listings(coll, "w1", limit=50, query={"_id": {"$in": ids}}, clock=clock)
+        release_listings(coll, [_id for _id in ids if _id.startswith("a")], "w1", clock=clock)
+        coll.delete_many({"_id": {"$in": [_id for _id in ids if _id.startswith("z")]}})
+        clock.now += timedelta(minutes=1)
+
+    assert len(new) == 10
+
+
+def test_release_parks_listing_after_max_attempts(coll):
+    clock = FakeClock()
+    for attempt in range(1, DETAIL_MAX_ATTEMPTS + 1):
+        assert [d["_id"] for d in claim_listings(coll, "w1", query={"_id": "0"}, clock=clock)] == ["0"]
+        release_listings(coll, ["0"], "w1", clock=clock)
+        doc = coll.find_one({"_id": "0"})
+        assert doc["detail_attempts"] == attempt
+        # До следующей попытки объявление не забирается
+        assert claim_listings(coll, "w1", query={"_id": "0"}, clock=clock) == []
+        clock.now += timedelta(days=1)
+
+    assert doc["state"] == "failed"
+    assert coll.count_documents(dispatchable_query(["0"], clock=clock)) == 0
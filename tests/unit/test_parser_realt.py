@@ -1,26 +1,42 @@
 import types
+from contextlib import contextmanager
+
 import pytest
 
 from app.parsers import realt_apartments_parser
+from app.http_cache import DiskCacheStore, HttpCache
 
 
 class _FakeResponse:
     def __init__(self, text: str):
         self.text = text
+        self.status_code = 200
+        self.headers = {}
+
+
+class _FakeStreamResponse(_FakeResponse):
+    def iter_bytes(self, chunk_size: int = 64):
+        data = self.text.encode("utf-8")
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
 
 
 class _FakeSession:
-    """Замена requests.Session"""
+    """Замена общего HTTP-клиента"""
     def __init__(self, html_by_url: dict[str, str]):
         self._html_by_url = html_by_url
 
-    def get(self, url: str, headers=None):
+    def get(self, url: str, headers=None, **kwargs):
         html = self._html_by_url.get(url)
 
         if html is None:
             raise AssertionError(f"Unexpected get {url}")
         return _FakeResponse(html)
 
+    @contextmanager
+    def stream(self, method: str, url: str, headers=None):
+        yield _FakeStreamResponse(self.get(url, headers=headers).text)
+
 
 @pytest.fixture(autouse=True)
 def patch_useragent(monkeypatch):
@@ -32,6 +48,14 @@ def patch_useragent(monkeypatch):
     return None
 
 
+@pytest.fixture(autouse=True)
+def isolated_http_cache(monkeypatch, tmp_path):
+    """HTTP-кэш в tmp_path, чтобы тесты не видели ответы друг друга"""
+    cache = HttpCache(DiskCacheStore(str(tmp_path)))
+    monkeypatch.setattr(realt_apartments_parser, "get_http_cache", lambda: cache)
+    return cache
+
+
 def test_parse_all_apartments_ids_happy_path(monkeypatch):
     listing_url = "https://realt.by/belarus/sale/flats/?page=1&sortType=createdAt"
     listing_html = """
@@ -52,7 +76,7 @@ def test_parse_all_apartments_ids_happy_path(monkeypatch):
         """
 
     fake = _FakeSession({listing_url: listing_html})
-    monkeypatch.setattr(realt_apartments_parser.requests, "Session", lambda: fake)
+    monkeypatch.setattr(realt_apartments_parser, "get_http_client", lambda: fake)
 
     out = realt_apartments_parser.parse_all_apartments_ids_from_realt()
     assert isinstance(out, list)
@@ -66,7 +90,7 @@ def test_parse_all_apartments_ids_returns_empty_when_block_missing(monkeypatch):
     listing_url = "https://realt.by/belarus/sale/flats/?page=1&sortType=createdAt"
     html_without_block = "<html><body><div>no target block</div></body></html>"
     fake = _FakeSession({listing_url: html_without_block})
-    monkeypatch.setattr(realt_apartments_parser.requests, "Session", lambda: fake)
+    monkeypatch.setattr(realt_apartments_parser, "get_http_client", lambda: fake)
 
     out = realt_apartments_parser.parse_all_apartments_ids_from_realt()
     assert out == []
@@ -99,7 +123,7 @@ def test_parse_apartment_data_from_realt_full(monkeypatch):
     """
 
     fake = _FakeSession({card_url: card_html})
-    monkeypatch.setattr(realt_apartments_parser.requests, "Session", lambda: fake)
+    monkeypatch.setattr(realt_apartments_parser, "get_http_client", lambda: fake)
 
     out = realt_apartments_parser.parse_apartment_data_from_realt(card_url)
 
@@ -127,8 +151,38 @@ def test_parse_apartment_data_from_realt_when_value_only_in_anchor(monkeypatch):
     </body></html>
     """
     fake = _FakeSession({card_url: card_html})
-    monkeypatch.setattr(realt_apartments_parser.requests, "Session", lambda: fake)
+    monkeypatch.setattr(realt_apartments_parser, "get_http_client", lambda: fake)
 
     out = realt_apartments_parser.parse_apartment_data_from_realt(card_url)
     assert out["Сайт"] == "example site"  # NBSP обработан
     assert out["price"] == "1 $"
+
+
+def test_parse_all_apartments_ids_skips_unchanged_page(monkeypatch):
+    listing_url = "https://realt.by/belarus/sale/flats/?page=1&sortType=createdAt"
+    html_without_block = "<html><body><div>no target block</div></body></html>"
+    fake = _FakeSession({listing_url: html_without_block})
+    monkeypatch.setattr(realt_apartments_parser, "get_http_client", lambda: fake)
+
+    page = realt_apartments_parser.parse_all_apartments_ids_from_realt()
+    assert page == []
+    # Пока страница не отмечена через commit(), она разбирается снова
+    assert realt_apartments_parser.parse_all_apartments_ids_from_realt() == []
+    page.commit()
+    # Тело страницы не изменилось - разбор пропускается
+    assert realt_apartments_parser.parse_all_apartments_ids_from_realt() is None
+    assert realt_apartments_parser.parse_all_apartments_ids_from_realt(skip_unchanged=False) == []
+
+
+def test_detail_page_is_not_stored_in_http_cache(monkeypatch, tmp_path):
+    card_url = "https://realt.by/some/object/2/"
+    card_html = """
+    <html><body>
+      <h1 class="order-1 mb-0.5 md:-order-2 md:mb-4 block w-full !inline-block lg:text-h1Lg text-h1 font-raleway font-bold flex items-center">Тайтл</h1>
+      <h2 class="!inline-block mr-1 lg:text-h2Lg text-h2 font-raleway font-bold flex items-center">1&nbsp;$</h2>
+    </body></html>
+    """
+    monkeypatch.setattr(realt_apartments_parser, "get_http_client", lambda: _FakeSession({card_url: card_html}))
+
+    assert realt_apartments_parser.parse_apartment_data_from_realt(card_url)["title"] == "Тайтл"
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,314 @@
+import sys
+import threading
+import types
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from pymongo.errors import OperationFailure
+
+from app import pipeline_watcher
+from app.pipeline_watcher import (
+    PipelineSink,
+    _dispatch_details,
+    _supervise,
+    handle_change,
+    load_resume_token,
+    run_change_stream,
+    run_polling,
+    supports_change_streams,
+    watch_collection,
+)
+
+T0 = datetime(2025, 6, 1, 10, 0, 0)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Recorder:
+    def __init__(self):
+        self.details = []
+        self.webhooks = []
+
+    def on_details(self, kind, ids):
+        self.details.append((kind, ids))
+
+    def on_webhook(self, kind):
+        self.webhooks.append(kind)
+
+
+def make_sink(clock=None, **kwargs):
+    recorder = Recorder()
+    options = dict(detail_debounce=2, webhook_debounce=10, dedup_seconds=60)
+    options.update(kwargs)
+    sink = PipelineSink('apartments', recorder.on_details, recorder.on_webhook, clock=clock or FakeClock(), **options)
+    return sink, recorder
+
+
+def insert_event(_id):
+    return {'operationType': 'insert', 'documentKey': {'_id': _id}, 'fullDocument': {'_id': _id, 'state': 'first'}}
+
+
+def update_event(_id):
+    return {'operationType': 'update', 'documentKey': {'_id': _id},
+            'updateDescription': {'updatedFields': {'changed_at': T0}}}
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()['pipeline']
+
+
+def test_sink_batches_inserts_until_debounce_expires():
+    clock = FakeClock()
+    sink, recorder = make_sink(clock)
+
+    handle_change(insert_event('a'), sink)
+    clock.now = 1
+    handle_change(insert_event('b'), sink)
+    assert sink.flush() is False
+
+    clock.now = 2
+    assert sink.flush() is True
+    assert recorder.details == [('apartments', ['a', 'b'])]
+    assert recorder.webhooks == []
+
+
+def test_sink_skips_recently_dispatched_ids():
+    clock = FakeClock()
+    sink, recorder = make_sink(clock)
+    sink.pending('a')
+    sink.flush(force=True)
+
+    clock.now = 30
+    sink.pending('a')
+    assert sink.flush(force=True) is False
+
+    clock.now = 61
+    sink.pending('a')
+    sink.flush(force=True)
+    assert recorder.details == [('apartments', ['a']), ('apartments', ['a'])]
+
+
+def test_sink_is_idle_only_when_nothing_is_pending():
+    sink, _ = make_sink()
+    assert sink.idle
+    sink.pending('a')
+    assert not sink.idle
+    sink.flush(force=True)
+    sink.changed()
+    assert not sink.idle
+    sink.flush(force=True)
+    assert sink.idle
+
+
+def test_sink_coalesces_updates_into_one_webhook():
+    clock = FakeClock()
+    sink, recorder = make_sink(clock)
+    for i in range(5):
+        handle_change(update_event(i), sink)
+        clock.now += 1
+    sink.flush()
+    assert recorder.webhooks == []
+
+    clock.now = 10
+    sink.flush()
+    assert recorder.webhooks == ['apartments']
+    assert recorder.details == []
+
+
+class FakeStream:
+    def __init__(self, events, stop):
+        self.events = list(events)
+        self.stop = stop
+        self.resume_token = None
+        self.empty_reads = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def try_next(self):
+        if self.events:
+            event = self.events.pop(0)
+            self.resume_token = {'_data': event['documentKey']['_id']}
+            return event
+        self.empty_reads += 1
+        if self.empty_reads >= 2:
+            self.stop.set()
+        return None
+
+
+class WatchedCollection:
+    def __init__(self, stream):
+        self.stream = stream
+        self.watch_args = None
+
+    def watch(self, pipeline, **kwargs):
+        self.watch_args = (pipeline, kwargs)
+        return self.stream
+
+
+def test_change_stream_dispatches_and_saves_resume_token(db):
+    stop = threading.Event()
+    stream = FakeStream([insert_event('a'), insert_event('b'), update_event('c')], stop)
+    coll = WatchedCollection(stream)
+    db.pipeline_state.insert_one({'_id': 'apartments', 'resume_token': {'_data': 'old'}})
+    sink, recorder = make_sink(detail_debounce=0, webhook_debounce=0)
+
+    run_change_stream(coll, db.pipeline_state, 'apartments', sink, stop)
+
+    assert coll.watch_args[1]['resume_after'] == {'_data': 'old'}
+    assert recorder.details == [('apartments', ['a', 'b'])]
+    assert recorder.webhooks == ['apartments']
+    assert load_resume_token(db.pipeline_state, 'apartments') == {'_data': 'c'}
+
+
+def test_resume_token_is_not_saved_while_events_are_pending(db):
+    stop = threading.Event()
+    stream = FakeStream([insert_event('a')], stop)
+    sink, recorder = make_sink(detail_debounce=100)
+
+    run_change_stream(WatchedCollection(stream), db.pipeline_state, 'apartments', sink, stop)
+
+    # Пачка ушла только при остановке, позиция потока осталась прежней
+    assert recorder.details == [('apartments', ['a'])]
+    assert load_resume_token(db.pipeline_state, 'apartments') is None
+
+
+def test_mongomock_falls_back_to_polling(db, monkeypatch):
+    assert supports_change_streams(db.apartments) is False
+    called = []
+    monkeypatch.setattr(pipeline_watcher, 'run_polling', lambda coll, sink, stop: called.append(coll))
+
+    watch_collection(db.apartments, db.pipeline_state, 'apartments', make_sink()[0], threading.Event())
+
+    assert called == [db.apartments]
+
+
+def test_standalone_server_falls_back_to_polling(db, monkeypatch):
+    class Standalone:
+        def watch(self, *args, **kwargs):
+            raise OperationFailure('The $changeStream stage is only supported on replica sets', code=40573)
+
+    called = []
+    monkeypatch.setattr(pipeline_watcher, 'run_polling', lambda coll, sink, stop: called.append(coll))
+    coll = Standalone()
+
+    watch_collection(coll, db.pipeline_state, 'apartments', make_sink()[0], threading.Event())
+
+    assert called == [coll]
+
+
+def test_other_stream_errors_are_raised(db):
+    class Broken:
+        def watch(self, *args, **kwargs):
+            raise OperationFailure('unauthorized', code=13)
+
+    with pytest.raises(OperationFailure):
+        watch_collection(Broken(), db.pipeline_state, 'apartments', make_sink()[0], threading.Event())
+
+
+def test_lost_resume_token_is_dropped_and_gap_is_polled(db):
+    class HistoryLost(WatchedCollection):
+        def __init__(self, coll, stream):
+            super().__init__(stream)
+            self.coll = coll
+            self.opened = []
+
+        def watch(self, pipeline, **kwargs):
+            self.opened.append(kwargs['resume_after'])
+            if len(self.opened) == 1:
+                raise OperationFailure('Resume of change stream was not possible', code=286)
+            return super().watch(pipeline, **kwargs)
+
+        def __getattr__(self, name):
+            return getattr(self.coll, name)
+
+    db.apartments.insert_many([
+        {'_id': 'missed', 'state': 'first'},
+        {'_id': 'done', 'state': 'second', 'changed_at': T0},
+    ])
+    db.pipeline_state.insert_one({'_id': 'apartments', 'resume_token': {'_data': 'gone'}})
+    stop = threading.Event()
+    coll = HistoryLost(db.apartments, FakeStream([insert_event('new')], stop))
+    sink, recorder = make_sink(detail_debounce=0, webhook_debounce=0)
+
+    watch_collection(coll, db.pipeline_state, 'apartments', sink, stop)
+
+    assert coll.opened == [{'_data': 'gone'}, None]
+    assert recorder.details == [('apartments', ['missed']), ('apartments', ['new'])]
+    assert recorder.webhooks == ['apartments']
+    assert load_resume_token(db.pipeline_state, 'apartments') == {'_data': 'new'}
+
+
+def test_supervisor_survives_non_mongo_errors():
+    stop = threading.Event()
+    calls = []
+
+    def target(coll, state_coll, name, sink, stop):
+        calls.append(name)
+        if len(calls) == 1:
+            raise ConnectionError('redis is down')
+        stop.set()
+
+    _supervise(target, stop, None, None, 'apartments', None, retry_seconds=0)
+
+    assert calls == ['apartments', 'apartments']
+
+
+def test_polling_picks_up_first_state_and_new_changes(db):
+    coll = db.apartments
+    coll.insert_many([
+        {'_id': 'old', 'state': 'second', 'changed_at': T0},
+        {'_id': 'a', 'state': 'first'},
+        {'_id': 'b', 'state': 'first'},
+    ])
+
+    class StopAfter:
+        def __init__(self, rounds, on_round=None):
+            self.rounds = rounds
+            self.on_round = on_round
+
+        def wait(self, interval):
+            self.rounds -= 1
+            if self.on_round:
+                self.on_round()
+            return self.rounds <= 0
+
+    def detail_done():
+        coll.update_one({'_id': 'a'}, {'$set': {'state': 'second', 'changed_at': T0 + timedelta(minutes=1)}})
+
+    sink, recorder = make_sink(detail_debounce=0, webhook_debounce=0)
+    run_polling(coll, sink, StopAfter(2, detail_done), interval=0)
+
+    # Уже известное изменение old не даёт вебхука, завершённая деталь a - даёт
+    assert recorder.details == [('apartments', ['a', 'b'])]
+    assert recorder.webhooks == ['apartments']
+
+
+def test_watcher_dispatch_takes_budget_from_shared_plan(monkeypatch):
+    calls = {}
+
+    def dispatch_planned_details(backlog, candidates=None):
+        calls['plan'] = (backlog, candidates)
+        return {'apartments': 2}, {'apartments': {'ids': 2, 'chunks': 1}}
+
+    tasks = types.SimpleNamespace(
+        count_dispatchable=lambda kind, ids: len(ids) - 1,
+        dispatch_planned_details=dispatch_planned_details,
+        dispatch_detail_chunks=lambda *a: pytest.fail('budget must not be bypassed'),
+    )
+    monkeypatch.setitem(sys.modules, 'tasks', tasks)
+
+    _dispatch_details('apartments', ['a', 'b', 'c', 'd'])
+
+    assert calls['plan'] == ({'apartments': 3}, {'apartments': ['a', 'b', 'c', 'd']})
@@ -0,0 +1,205 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pytest
+
+from app.rate_limiter import (
+    FallbackRateStore,
+    LocalRateStore,
+    RateLimitedClient,
+    RateLimiter,
+    RateLimitTimeout,
+    RedisRateStore,
+    parse_retry_after,
+)
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None, text="ok"):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+
+
+class ScriptedClient:
+    """Отдаёт заранее заданные ответы по очереди"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+        self.closed = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+    @contextmanager
+    def stream(self, method, url, **kwargs):
+        self.calls += 1
+        try:
+            yield self.responses.pop(0)
+        finally:
+            self.closed += 1
+
+
+def make_limiter(clock, **kwargs):
+    params = dict(rate=2, burst=2, concurrency=2, max_wait=60, clock=clock, sleep=clock.sleep)
+    params.update(kwargs)
+    return RateLimiter(LocalRateStore(clock=clock), **params)
+
+
+def test_token_bucket_allows_burst_then_paces():
+    clock = FakeClock()
+    store = LocalRateStore(clock=clock)
+    assert store.take("realt.by", rate=2, burst=2) == 0
+    assert store.take("realt.by", rate=2, burst=2) == 0
+    assert store.take("realt.by", rate=2, burst=2) == pytest.approx(0.5)
+    assert store.take("other.by", rate=2, burst=2) == 0
+
+    clock.now += 0.5
+    assert store.take("realt.by", rate=2, burst=2) == 0
+
+
+def test_limiter_waits_for_tokens_and_times_out():
+    clock = FakeClock()
+    limiter = make_limiter(clock, concurrency=100, max_wait=1)
+    for _ in range(4):
+        limiter.release("realt.by", limiter.acquire("realt.by"))
+    assert clock.now == pytest.approx(101.0)  # 2 из запаса, ещё 2 по 0.5 с
+
+    limiter.store.penalize("realt.by", retry_after=30)
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire("realt.by")
+
+
+def test_concurrency_slots_per_host():
+    clock = FakeClock()
+    store = LocalRateStore(clock=clock)
+    first = store.try_slot("realt.by", limit=2)
+    second = store.try_slot("realt.by", limit=2)
+    assert first and second
+    assert store.try_slot("realt.by", limit=2) is None
+    assert store.try_slot("other.by", limit=2)
+
+    store.release_slot("realt.by", first)
+    assert store.try_slot("realt.by", limit=2)
+
+    clock.now += 3600  # забытые слоты истекают
+    assert store.try_slot("realt.by", limit=2, lease=60)
+
+
+def test_backoff_grows_and_resets_after_success():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    assert limiter.observe("realt.by", 503) == 2
+    assert limiter.observe("realt.by", 503) == 4
+    assert limiter.observe("realt.by", 429, "7") == 7
+    assert limiter.observe("realt.by", 200) == 0
+    assert limiter.observe("realt.by", 500) == 2
+
+
+def test_parse_retry_after():
+    now = datetime(2025, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after("Wed, 01 Jan 2025 12:00:30 GMT", now=now) == 30
+    assert parse_retry_after("Wed, 01 Jan 2025 11:00:00 GMT", now=now) == 0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_client_retries_after_429_respecting_retry_after():
+    clock = FakeClock()
+    client = ScriptedClient([FakeResponse(429, {"Retry-After": "10"}), FakeResponse(200, text="page")])
+    limited = RateLimitedClient(client, make_limiter(clock), retries=2)
+
+    response = limited.get("https://realt.by/object/1/")
+
+    assert response.text == "page"
+    assert client.calls == 2
+    assert clock.now >= 110
+
+
+def test_client_gives_up_after_retries_and_frees_slots():
+    clock = FakeClock()
+    limiter = make_limiter(clock, concurrency=1, max_wait=1000)
+    client = ScriptedClient([FakeResponse(503), FakeResponse(503)])
+
+    response = RateLimitedClient(client, limiter, retries=1).get("https://realt.by/object/1/")
+
+    assert response.status_code == 503
+    assert client.calls == 2
+    assert limiter.store.try_slot("realt.by", limit=1) is not None
+
+
+def test_stream_retries_and_closes_rejected_response():
+    clock = FakeClock()
+    client = ScriptedClient([FakeResponse(502), FakeResponse(200, text="list")])
+    limited = RateLimitedClient(client, make_limiter(clock))
+
+    with limited.stream("GET", "https://realt.by/list/?page=1") as response:
+        assert response.text == "list"
+        assert client.closed == 1
+    assert client.closed == 2
+
+
+class FakeScriptClient:
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+        self.deleted = []
+
+    def register_script(self, script):
+        name = "slot" if "ZADD" in script else "penalize" if "INCR" in script else "take"
+
+        def run(keys, args):
+            self.calls.append((name, keys, args))
+            return self.results[name]
+        return run
+
+    def delete(self, key):
+        self.deleted.append(key)
+
+
+def test_redis_store_uses_per_host_keys():
+    client = FakeScriptClient({"take": b"0.25", "penalize": b"8", "slot": 1})
+    store = RedisRateStore(client)
+
+    assert store.take("realt.by", 4, 8) == 0.25
+    assert store.penalize("realt.by", retry_after=None) == 8
+    assert store.try_slot("realt.by", 8)
+    store.forgive("realt.by")
+
+    take, penalize, slot = client.calls
+    assert take[1] == ["ratelimit:bucket:realt.by", "ratelimit:blocked:realt.by"]
+    assert penalize[1] == ["ratelimit:blocked:realt.by", "ratelimit:strikes:realt.by"]
+    assert penalize[2][0] == -1
+    assert slot[1] == ["ratelimit:slots:realt.by"]
+    assert client.deleted == ["ratelimit:strikes:realt.by"]
+
+
+def test_fallback_store_switches_to_local_limits():
+    class DownRedis:
+        def __getattr__(self, name):
+            def fail(*args):
+                raise ConnectionError("redis is down")
+            return fail
+
+    clock = FakeClock()
+    store = FallbackRateStore(DownRedis(), LocalRateStore(clock=clock))
+    assert store.take("realt.by", 1, 1) == 0
+    assert store.take("realt.by", 1, 1) == pytest.approx(1)
+    token = store.try_slot("realt.by", 1)
+    assert store.try_slot("realt.by", 1) is None
+    store.release_slot("realt.by", token)
+    assert store.try_slot("realt.by", 1)
@@ -0,0 +1,102 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.parsers import realt_extractor
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(__file__)), "fixtures")
+
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_extract_detail_from_saved_page():
+    data = realt_extractor.extract_detail(_fixture("realt_detail_page.html"))
+
+    assert data["title"] == "Продается 2-комнатная квартира, г. Минск, ул. Неманская, 65"
+    assert data["price"] == "185 400 р."
+    assert data["Площадь кухни"] == "9,5 м²"
+    assert data["Этаж / этажность"] == "5 / 9"
+    assert data["Улица"] == "Неманская ул."  # значение в <a>, NBSP заменён
+    assert data["Координаты"] == "53.9236, 27.4284"
+    # Комментарии в описании пропускаются, абзацы разделены переводом строки
+    assert data["description"].startswith("Продаётся светлая 2-комнатная квартира в тихом районе.")
+    assert "агент" not in data["description"]
+    assert "Звоните!" in data["description"]
+
+
+def test_extract_listing_links_from_saved_page():
+    links = realt_extractor.extract_listing_links(_fixture("realt_listing_page.html"))
+
+    assert len(links) == 30
+    assert links[0] == "https://realt.by/belarus/sale-flats/object/3900000/"
+
+
+def test_extract_listing_links_requires_id_span():
+    html = """
+    <div class="t-0 l-0 absolute w-full">
+      <div data-index="1"><span class="relative z-[2]">ID 1</span>
+        <a class="z-1 absolute top-0 left-0 w-full h-full cursor-pointer" href="/object/1/"></a></div>
+      <div data-index="2">
+        <a class="z-1 absolute top-0 left-0 w-full h-full cursor-pointer" href="/object/2/"></a></div>
+    </div>
+    """
+    assert realt_extractor.extract_listing_links(html) == ["https://realt.by/object/1/", "https://realt.by/object/2/"]
+    assert realt_extractor.extract_listing_links(html, require_id_span=True) == ["https://realt.by/object/1/"]
+
+
+def test_extract_listing_links_without_block():
+    assert realt_extractor.extract_listing_links("<html><body><div>empty</div></body></html>") is None
+    assert realt_extractor.extract_listing_links("") is None
+
+
+def test_extract_detail_without_title_raises():
+    with pytest.raises(ValueError):
+        realt_extractor.extract_detail("<html><body><h1>no classes</h1></body></html>")
+
+
+def test_extract_detail_is_thread_safe():
+    text = _fixture("realt_detail_page.html")
+    expected = realt_extractor.extract_detail(text)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(realt_extractor.extract_detail, [text] * 32))
+
+    assert all(result == expected for result in results)
+
+
+def _chunks(text, size, counter):
+    data = text.encode("utf-8")
+    for i in range(0, len(data), size):
+        counter.append(i)
+        yield data[i:i + size]
+
+
+def test_streamed_listing_matches_full_parse_and_stops_early():
+    text = _fixture("realt_listing_page.html")
+    read = []
+
+    links = realt_extractor.collect_listing_links(_chunks(text, 4096, read))
+
+    assert links == realt_extractor.extract_listing_links(text)
+    # После блока с результатами чтение прекращается
+    assert len(read) < len(text.encode("utf-8")) / 4096
+
+
+def test_streamed_listing_emits_links_before_page_end():
+    text = _fixture("realt_listing_page.html")
+    read = []
+
+    stream = iter(realt_extractor.ListingLinkStream(_chunks(text, 1024, read)))
+    first = next(stream)
+
+    assert first == "https://realt.by/belarus/sale-flats/object/3900000/"
+    assert len(read) * 1024 < text.encode("utf-8").index(b'data-index="1"') + 2048
+
+
+def test_streamed_listing_without_block():
+    chunks = [b"<html><body>", b"<div>empty</div>", b"</body></html>"]
+    assert realt_extractor.collect_listing_links(chunks) is None
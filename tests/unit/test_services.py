@@ -1,5 +1,7 @@
 import pytest
 import types
+from contextlib import contextmanager
+from datetime import datetime
 
 import app.services as srv
 
@@ -9,6 +11,13 @@ class FakeUpdateResult:
         self.modified_count = modified_count
 
 
+class FakeBulkResult:
+    def __init__(self, modified_count: int):
+        self.matched_count = modified_count
+        self.modified_count = modified_count
+        self.upserted_count = 0
+
+
 class FakeCollection:
     def __init__(self, docs=None):
         self.docs = list(docs or [])
@@ -77,6 +86,39 @@ def fake_db(monkeypatch):
     return db
 
 
+class BulkCollection:
+    """Коллекция mongomock с bulk_write, который понимает UpdateOne из pymongo 4"""
+
+    def __init__(self, coll):
+        self.coll = coll
+        self.updates = []
+        self.bulk_calls = []
+
+    def __getattr__(self, name):
+        return getattr(self.coll, name)
+
+    def bulk_write(self, ops, ordered=True):
+        self.bulk_calls.append(len(ops))
+        modified = 0
+        for op in ops:
+            self.updates.append(op._doc["$set"])
+            modified += self.coll.update_one(op._filter, op._doc, upsert=op._upsert).modified_count
+        return FakeBulkResult(modified_count=modified)
+
+
+@pytest.fixture
+def mongo_db_ctx(monkeypatch, mongo_db):
+    """mongomock-база с bulk_write, которая отдаётся через контекстный менеджер"""
+    db = types.SimpleNamespace(apartments=BulkCollection(mongo_db.apartments))
+
+    @contextmanager
+    def _get_db():
+        yield db
+
+    monkeypatch.setattr(srv, "get_apartments_db", _get_db)
+    return db
+
+
 @pytest.fixture
 def patch_parsers(monkeypatch):
     """Хелпер для подмены парсеров в конкретных тестах."""
@@ -132,6 +174,28 @@ def test_put_apartments_list_stops_at_last_apartment_and_inserts_new(fake_db, pa
     assert not any(d["_id"] == "99" for d in fake_db.apartments.docs)
 
 
+def test_put_apartments_list_commits_pages_only_after_insert(mongo_db_ctx, monkeypatch):
+    from app.crawler import ListingPage
+    committed = []
+
+    def parse_page(page):
+        if page > 1:
+            return []
+        return ListingPage([{"_id": "10", "state": "first"}], commit=lambda: committed.append(page))
+
+    monkeypatch.setattr(srv, "parse_all_apartments_ids_from_realt", parse_page)
+    real_insert = srv.insert_new_listings
+    monkeypatch.setattr(srv, "insert_new_listings", lambda coll, parsed: (_ for _ in ()).throw(RuntimeError("down")))
+
+    assert srv.put_apartments_list_from_realt_to_mongo() == []
+    # Запись не удалась - страница не отмечена в кэше и будет разобрана снова
+    assert committed == []
+
+    monkeypatch.setattr(srv, "insert_new_listings", real_insert)
+    assert [doc["_id"] for doc in srv.put_apartments_list_from_realt_to_mongo()] == ["10"]
+    assert committed == [1]
+
+
 def test_put_apartments_list_when_parser_returns_empty(fake_db, patch_parsers, capsys):
     patch_parsers(ids=[])
     out = srv.put_apartments_list_from_realt_to_mongo()
@@ -225,3 +289,183 @@ def test_send_ids_webhook_db_error_returns_empty(monkeypatch, capsys):
     out = srv.send_apartments_ids_webhook_to_django()
     assert out == []
     assert "Database connection error" in capsys.readouterr().out
+
+
+def test_insert_new_listings_skips_known_ids(mongo_db):
+    coll = mongo_db.apartments
+    coll.insert_many([{"_id": "1", "state": "second"}])
+
+    out = srv.insert_new_listings(coll, [{"_id": "1", "state": "first"}, {"_id": "2", "state": "first"}])
+
+    created_at = out[0].pop("created_at")
+    assert out[0].pop("updated_at") == created_at
+    assert out == [{"_id": "2", "state": "first"}]
+    assert coll.find_one({"_id": "2"})["created_at"] is not None
+    assert coll.find_one({"_id": "1"})["state"] == "second"
+    assert coll.count_documents({}) == 2
+
+
+def test_insert_new_listings_ignores_duplicates_from_concurrent_run(mongo_db, monkeypatch):
+    coll = mongo_db.apartments
+    # Конкурирующий запуск успел вставить "2" между проверкой и вставкой
+    monkeypatch.setattr(srv, "find_known_ids", lambda c, ids: set())
+    coll.insert_one({"_id": "2", "state": "first"})
+
+    out = srv.insert_new_listings(coll, [{"_id": "1", "state": "first"}, {"_id": "2", "state": "first"},
+                                         {"_id": "3", "state": "first"}])
+
+    assert [doc["_id"] for doc in out] == ["1", "3"]
+    assert coll.count_documents({}) == 3
+
+
+def test_put_apartment_info_writes_details_in_bulk(mongo_db_ctx, patch_parsers, patch_translator):
+    mongo_db_ctx.apartments.insert_many([
+        {"_id": str(i), "link": f"http://x/{i}", "state": "first"} for i in range(5)
+    ])
+    patch_parsers(details={"raw": True})
+    patch_translator({"title": "ok"})
+
+    assert srv.put_apartment_info_from_realt_to_mongo() == 5
+    docs = list(mongo_db_ctx.apartments.find())
+    assert all(d["state"] == "second" and d["title"] == "ok" for d in docs)
+    assert all("lease_owner" not in d and "lease_expires" not in d for d in docs)
+    assert mongo_db_ctx.apartments.bulk_calls == [5]
+
+
+def test_put_apartment_info_keeps_raw_record(mongo_db_ctx, patch_parsers, patch_translator):
+    mongo_db_ctx.apartments.insert_many([{"_id": "1", "link": "http://x/1", "state": "first"}])
+    patch_parsers(details={"_id": "1", "state": "second", "Этаж / этажность": "2 / 9"})
+    patch_translator({"title": "ok"})
+
+    srv.put_apartment_info_from_realt_to_mongo()
+
+    doc = mongo_db_ctx.apartments.find_one({"_id": "1"})
+    assert doc["raw"] == {"Этаж / этажность": "2 / 9"}
+    assert doc["raw_hash"] == srv.raw_hash({"Этаж / этажность": "2 / 9"})
+    assert doc["translator_version"] == srv.get_translator("apartments").version
+
+
+def test_put_apartment_info_skips_leased_and_releases_failed(mongo_db_ctx, patch_translator, monkeypatch):
+    from datetime import datetime, timedelta, timezone
+    coll = mongo_db_ctx.apartments
+    coll.insert_many([{"_id": str(i), "link": f"http://x/{i}", "state": "first"} for i in range(3)])
+    coll.insert_one({"_id": "busy", "link": "http://x/busy", "state": "processing", "lease_owner": "other",
+                     "lease_expires": datetime.now(timezone.utc) + timedelta(minutes=5)})
+    fetched = []
+
+    def parse(url):
+        fetched.append(url)
+        if url.endswith("/1"):
+            raise RuntimeError("broken page")
+        return {"title": url}
+
+    monkeypatch.setattr(srv, "parse_apartment_data_from_realt", parse)
+    patch_translator({"title": "ok"})
+
+    assert srv.put_apartment_info_from_realt_to_mongo() == 2
+    assert sorted(fetched) == ["http://x/0", "http://x/1", "http://x/2"]
+    released = coll.find_one({"_id": "1"})
+    assert released.pop("updated_at")
+    assert released.pop("next_attempt_at")
+    assert released == {"_id": "1", "link": "http://x/1", "state": "first", "detail_attempts": 1}
+    assert coll.find_one({"_id": "busy"})["state"] == "processing"
+
+
+def _stored_apartment(_id, raw, **extra):
+    translator = srv.get_translator("apartments")
+    data = translator(raw)
+    data.update(_id=_id, state="second", raw=raw, raw_hash=srv.raw_hash(raw),
+                translator_version=translator.version)
+    data.update(extra)
+    return data
+
+
+def test_retranslate_updates_only_stale_documents(mongo_db):
+    raw = {"title": "Квартира", "Этаж / этажность": "2 / 9"}
+    mongo_db.apartments.insert_many([
+        _stored_apartment("fresh", raw),
+        _stored_apartment("old", raw, translator_version="0.old", floor=1),
+        {"_id": "no-raw", "state": "first"},
+    ])
+    coll = BulkCollection(mongo_db.apartments)
+
+    stats = srv.retranslate_collection(coll, "apartments", batch_size=1)
+
+    assert stats == {"scanned": 1, "translated": 1, "modified": 1}
+    # Изменение попадёт в дельта-вебхук, метка ставится временем сервера
+    assert isinstance(mongo_db.apartments.find_one({"_id": "old"})["changed_at"], datetime)
+    assert "changed_at" not in mongo_db.apartments.find_one({"_id": "fresh"})
+    assert coll.updates == [{"floor": 2, "raw_hash": srv.raw_hash(raw),
+                             "translator_version": srv.get_translator("apartments").version}]
+    assert srv.retranslate_collection(coll, "apartments")["scanned"] == 0
+
+
+def test_retranslate_verify_hashes_picks_up_edited_raw(mongo_db):
+    mongo_db.apartments.insert_many([
+        _stored_apartment("a", {"title": "Старое"}),
+        _stored_apartment("b", {"title": "Без изменений"}),
+    ])
+    mongo_db.apartments.update_one({"_id": "a"}, {"$set": {"raw.title": "Новое"}})
+    coll = BulkCollection(mongo_db.apartments)
+
+    assert srv.retranslate_collection(coll, "apartments")["scanned"] == 0
+    stats = srv.retranslate_collection(coll, "apartments", verify_hashes=True)
+
+    assert stats == {"scanned": 2, "translated": 1, "modified": 1}
+    assert mongo_db.apartments.find_one({"_id": "a"})["title"] == "Новое"
+
+
+def test_ensure_all_indexes_covers_both_listing_collections(monkeypatch):
+    import mongomock
+    client = mongomock.MongoClient()
+
+    def _db(name):
+        @contextmanager
+        def _get_db():
+            yield client[name]
+        return _get_db
+
+    monkeypatch.setattr(srv, "get_apartments_db", _db("apartments"))
+    monkeypatch.setattr(srv, "get_rental_db", _db("rental"))
+
+    report = srv.ensure_all_indexes()
+
+    assert set(report) == {"apartments", "rent", "apartments_webhook_retries", "rent_webhook_retries"}
+    assert "state_first_created_at" in client.apartments.apartments.index_information()
+    assert "state_first_created_at" in client.rental.rental.index_information()
+    assert "kind_state_next_attempt" in client.rental.webhook_retries.index_information()
+    assert set(srv.ensure_all_indexes()["rent"].values()) == {"exists"}
+
+
+def test_slow_detail_batch_is_delivered_after_watermark_moved_on(mongo_db, monkeypatch):
+    import sys
+    import time
+    # Без перекрытия окна: документ с меткой старше отметки вебхуков потерялся бы навсегда
+    monkeypatch.setattr(sys.modules[srv.deliver_deltas.__module__], "WEBHOOK_WATERMARK_OVERLAP_SECONDS", 0)
+    coll = BulkCollection(mongo_db.apartments)
+    coll.insert_many([
+        {"_id": "slow", "link": "http://x/slow", "state": "processing", "lease_owner": "w1"},
+        {"_id": "fast", "state": "second"},
+    ])
+    delivered = []
+
+    def post(ids, since, key=None):
+        delivered.extend(ids)
+
+    def deliver():
+        srv.deliver_deltas(coll, mongo_db.webhook_state, mongo_db.webhook_retries, "apartments", post)
+
+    def parse(url):
+        # Пока страница грузится (ожидание лимита запросов), другой процесс
+        # записал свежее объявление, и вебхук сдвинул отметку дальше начала пачки
+        time.sleep(0.01)
+        now = datetime.utcnow()
+        # mongomock хранит $currentDate с микросекундами, сервер - с миллисекундами, как $set
+        coll.update_one({"_id": "fast"}, {"$set": {"changed_at": now.replace(microsecond=now.microsecond // 1000 * 1000)}})
+        deliver()
+        return {"title": url}
+
+    srv.update_listing_details(coll, [coll.find_one({"_id": "slow"})], parse, dict, "apartments", "w1")
+    deliver()
+
+    assert delivered == ["fast", "slow"]
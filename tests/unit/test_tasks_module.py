@@ -20,9 +20,10 @@ def app_celery_module(no_autodiscover):
 
 
 @pytest.fixture
-def tasks_module(app_celery_module):
+def tasks_module(app_celery_module, monkeypatch):
     sys.modules.pop("tasks", None)
     mod = importlib.import_module("app.tasks")
+    monkeypatch.setattr(mod, "record_list_run", lambda name, count: 3600.0)
     return mod
 
 
@@ -65,20 +66,39 @@ def test_parse_apartment_list_retry_on_error(tasks_module, monkeypatch, caplog):
 
 
 def test_parse_apartment_details_success(tasks_module, monkeypatch, caplog):
-    monkeypatch.setattr(tasks_module, "put_apartment_info_from_realt_to_mongo",
-                        lambda: 5)
+    ids = [str(i) for i in range(120)]
+    chunks = []
+
+    def fake_chunk(chunk):
+        chunks.append(list(chunk))
+        return len(chunk) - 1  # одна страница в каждой пачке не разобралась
+
+    monkeypatch.setattr(tasks_module, "list_apartment_ids_to_update", lambda: ids)
+    monkeypatch.setattr(tasks_module, "put_apartment_details_chunk", fake_chunk)
+    monkeypatch.setattr(tasks_module, "DETAIL_CHUNK_SIZE", 50)
+    # tasks импортирует app_celery без пакета, eager нужно включить и у этого экземпляра
+    monkeypatch.setattr(tasks_module.celery.conf, "task_always_eager", True)
 
     caplog.set_level("INFO")
     res = tasks_module.parse_apartment_details.run()
-    assert res == {"status": "success", "details_processed": 5}
+
+    assert res["status"] == "dispatched"
+    assert (res["chunks"], res["ids"]) == (3, 120)
+    assert [len(c) for c in chunks] == [50, 50, 20]
+    assert sum(chunks, []) == ids
     assert any("Начало парсинга деталей квартир" in r.message for r in caplog.records)
-    assert any("Успешно обработано 5 деталей квартир" in r.message for r in caplog.records)
+    assert any("обработано 117, неуспешных пачек 0 из 3" in r.message for r in caplog.records)
+
+
+def test_parse_apartment_details_nothing_to_do(tasks_module, monkeypatch):
+    monkeypatch.setattr(tasks_module, "list_apartment_ids_to_update", lambda: [])
+    assert tasks_module.parse_apartment_details.run() == {"status": "success", "details_processed": 0}
 
 
 def test_parse_apartment_details_retry_on_error(tasks_module, monkeypatch, caplog):
     monkeypatch.setattr(
         tasks_module,
-        "put_apartment_info_from_realt_to_mongo",
+        "list_apartment_ids_to_update",
         lambda: (_ for _ in ()).throw(RuntimeError("oops")),
     )
 
@@ -101,6 +121,30 @@ def test_parse_apartment_details_retry_on_error(tasks_module, monkeypatch, caplo
     assert any("Ошибка парсинга деталей: oops" in r.message for r in caplog.records)
 
 
+def test_detail_chunk_is_retried_then_reported_as_failed(tasks_module, monkeypatch):
+    attempts = []
+
+    def flaky_chunk(chunk):
+        attempts.append(chunk)
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(tasks_module, "put_apartment_details_chunk", flaky_chunk)
+    monkeypatch.setattr(tasks_module, "DETAIL_CHUNK_RETRY_COUNTDOWN", 0)
+
+    res = tasks_module.parse_apartment_details_chunk.apply(args=(["1", "2"],)).get()
+
+    assert len(attempts) == 4  # первая попытка и три повтора
+    assert res == {"status": "error", "ids": 2, "details_processed": 0, "error": "db down"}
+
+
+def test_aggregate_detail_results_reports_failed_chunks(tasks_module):
+    res = tasks_module.aggregate_detail_results.run([
+        {"status": "success", "ids": 50, "details_processed": 49},
+        {"status": "error", "ids": 50, "details_processed": 0, "error": "x"},
+    ], "rent")
+    assert res == {"status": "partial", "kind": "rent", "chunks": 2, "details_processed": 49, "failed_chunks": 1}
+
+
 def test_send_webhook_to_django_success(tasks_module, monkeypatch, caplog):
     monkeypatch.setattr(tasks_module, "send_apartments_ids_webhook_to_django",
                         lambda: ["1", "2", "3"])
@@ -137,3 +181,36 @@ def test_send_webhook_to_django_retry_on_error(tasks_module, monkeypatch, caplog
     assert any("Error in send_webhook_to_django task: net" in r.message for r in caplog.records)
 
 
+
+
+def test_schedule_detail_parsing_dispatches_within_plan(tasks_module, monkeypatch):
+    listed = {}
+    dispatched = []
+
+    def reserve_ids(kind, limit, ids=None):
+        listed[kind] = limit
+        return [f"{kind}-{i}" for i in range(limit)]
+
+    monkeypatch.setattr(tasks_module, "count_detail_backlog", lambda: {"apartments": 90, "rent": 10})
+    monkeypatch.setattr(tasks_module, "plan_detail_requests", lambda backlog: {"apartments": 45, "rent": 5})
+    monkeypatch.setattr(tasks_module, "reserve_detail_ids", reserve_ids)
+    monkeypatch.setattr(tasks_module, "dispatch_detail_chunks",
+                        lambda task, ids, kind: dispatched.append((task.name, len(ids), kind)) or {"ids": len(ids)})
+
+    res = tasks_module.schedule_detail_parsing.run()
+
+    assert listed == {"apartments": 45, "rent": 5}
+    assert dispatched == [
+        ("tasks.parse_apartment_details_chunk", 45, "apartments"),
+        ("tasks.parse_rent_details_chunk", 5, "rent"),
+    ]
+    assert res["planned"] == {"apartments": 45, "rent": 5}
+
+
+def test_schedule_detail_parsing_idle_without_budget(tasks_module, monkeypatch):
+    monkeypatch.setattr(tasks_module, "count_detail_backlog", lambda: {"apartments": 5, "rent": 0})
+    monkeypatch.setattr(tasks_module, "plan_detail_requests", lambda backlog: {})
+    monkeypatch.setattr(tasks_module, "dispatch_detail_chunks",
+                        lambda *a: pytest.fail("nothing should be dispatched"))
+
+    assert tasks_module.schedule_detail_parsing.run() == {"status": "success", "planned": {}, "dispatched": {}}
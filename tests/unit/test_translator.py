@@ -1,7 +1,18 @@
-import pytest
+import json
 import math
 
-from app.translator import transform_mongo_apartments_to_django
+import pytest
+
+from app.translator import (
+    _FAILED as FAILED,
+    compile_spec,
+    get_translator,
+    load_spec,
+    memoize_converter,
+    transform_mongo_apartments_to_django,
+    transform_mongo_rent_to_django,
+    translate_batch,
+)
 
 
 def test_defaults_are_applied_when_no_fields():
@@ -131,3 +142,171 @@ def test_invalid_coordinates_are_ignored():
     loc = out["building"]["location"]
     assert loc["latitude"] is None
     assert loc["longitude"] is None
+
+
+def test_output_does_not_share_template_state():
+    out = transform_mongo_apartments_to_django({"Улица": "Лидская ул."})
+    out["images"].append("img.jpg")
+    out["building"]["location"]["town"]["name"] = "Изменено"
+
+    fresh = transform_mongo_apartments_to_django({})
+    assert fresh["images"] == []
+    assert fresh["building"]["location"]["town"]["name"] == "Не указан"
+    assert fresh["building"]["location"]["street"] == "Не указана"
+
+
+def test_numeric_price_is_converted_to_float():
+    assert transform_mongo_apartments_to_django({"price": 120000})["price"] == 120000.0
+
+
+def test_floor_is_kept_when_floors_total_is_invalid():
+    out = transform_mongo_apartments_to_django({"Этаж / этажность": "3 / ?"})
+    assert out["floor"] == 3
+    assert out["building"]["floors_total"] is None
+
+
+def test_rent_mapping():
+    mongo = {
+        "price": "1 369 р./мес.",
+        "Площадь общая": "37.6 м²",
+        "Квартал": "2 кв. 2025",
+        "Балкон": "Лоджия",
+        "Мебель": "Нет",
+        "Срок аренды": "Длительная",
+        "Этаж / этажность": "9 / 9",
+        "Город": "Минск",
+    }
+    out = transform_mongo_rent_to_django(mongo)
+    assert math.isclose(out["total_area"], 37.6)
+    assert out["quarter"] == 2.0
+    assert out["balcony"] is True
+    assert out["furniture"] is False
+    assert out["term_of_rent"] == "long"
+    assert out["floor"] == 9
+    assert out["building"]["floors_total"] == 9
+    assert out["building"]["location"]["town"]["name"] == "Минск"
+    assert out["price"] == 0.0  # "/мес." не срезается, цена остаётся по умолчанию
+
+
+def test_translate_batch_matches_single_calls():
+    records = [
+        {"price": "100 000 р.", "Площадь общая": "40 м²", "Этаж / этажность": "2 / 9", "Улица": "Лидская ул."},
+        {"price": "100 000 р.", "Площадь общая": "40 м²", "Этаж / этажность": "2 / ?", "ул.": "Неманская"},
+        {"price": 95000, "Площадь общая": "не число", "Координаты": "53.9, 27.5", "Год постройки": True},
+        {"Количество комнат": 2, "Координаты": "53.9, x", "Балкон": ["Лоджия"]},
+        {},
+    ]
+    expected = [transform_mongo_apartments_to_django(r) for r in records]
+    assert list(translate_batch(records, "apartments", batch_size=2)) == expected
+
+
+def test_translate_many_without_memo_matches_single_calls():
+    spec = load_spec("apartments")
+    for config in [*spec["numeric"].values(), *spec["pairs"]]:
+        config["memo"] = False
+    translator = compile_spec(spec)
+    records = [
+        {"price": "100 000 р.", "Площадь общая": "40 м²", "Этаж / этажность": "2 / 9"},
+        {"price": "100 000 р.", "Площадь общая": "40 м²", "Этаж / этажность": "2 / ?"},
+        {"price": 95000, "Координаты": "53.9, 27.5", "Год постройки": True, "Балкон": ["Лоджия"]},
+        {},
+    ]
+
+    # Без кэшей конвертеров пачка разбирается по столбцам
+    assert translator._row_wise is False
+    assert translator.translate_many(records) == [translator(r) for r in records]
+    assert get_translator("apartments")._row_wise is True
+
+
+def test_translate_batch_accepts_iterators_and_rent():
+    records = [{"Квартал": "2 кв. 2025", "link": "l1"}, {"Квартал": 3}, {"Мебель": "Нет"}]
+    out = list(translate_batch(iter(records), "rent"))
+    assert out == [transform_mongo_rent_to_django(r) for r in records]
+    assert out[0]["link"] == "l1" and "link" not in out[1]
+    assert out[1]["quarter"] == 3.0
+
+
+def test_translate_batch_outputs_are_independent():
+    first, second = translate_batch([{}, {}], "apartments")
+    first["building"]["location"]["street"] = "Изменено"
+    assert second["building"]["location"]["street"] == "Не указана"
+
+
+def test_same_spec_is_compiled_once():
+    spec = load_spec("apartments")
+    assert compile_spec(load_spec("apartments")) is compile_spec(spec)
+    assert compile_spec(spec) is get_translator("apartments")
+    assert compile_spec(spec).spec_hash != get_translator("rent").spec_hash
+
+
+def test_new_category_is_a_spec_file(tmp_path):
+    base = load_spec("base")
+    (tmp_path / "base.json").write_text(json.dumps(base, ensure_ascii=False), encoding="utf-8")
+    (tmp_path / "houses.json").write_text(json.dumps({
+        "extends": "base",
+        "template": {"title": "Без названия", "plot_area": None},
+        "direct": {"title": "title"},
+        "numeric": {"plot_area": {"field": "Участок", "converter": "strip_units", "args": [" сот."]}},
+    }, ensure_ascii=False), encoding="utf-8")
+
+    translator = compile_spec(load_spec("houses", specs_dir=str(tmp_path)))
+    out = translator({"title": "Дом", "Участок": "12,5 сот.", "Этаж / этажность": "1 / 2", "Улица": "Лесная"})
+    assert out["title"] == "Дом"
+    assert out["plot_area"] == 12.5
+    assert out["building"]["floors_total"] == 2
+    assert out["building"]["location"]["street"] == "Лесная"
+
+
+@pytest.mark.parametrize("patch", [
+    {"numeric": {"price": {"field": "price", "converter": "nope"}}},
+    {"direct": {"building.nowhere.title": "title"}},
+    {"pairs": [{"field": "Этаж / этажность", "converter": "floor_and_total", "targets": ["floor"]}]},
+])
+def test_invalid_spec_is_rejected(patch):
+    spec = dict(load_spec("apartments"), **patch)
+    with pytest.raises(ValueError):
+        compile_spec(spec)
+
+
+def test_memoized_converter_counts_hits_and_stays_bounded():
+    calls = []
+
+    def parse(value):
+        calls.append(value)
+        return float(value.replace(" м²", ""))
+
+    convert = memoize_converter(parse, maxsize=2)
+    assert convert("40 м²") == 40.0
+    assert convert("40 м²") == 40.0
+    convert("50 м²")
+    convert("60 м²")
+    assert calls == ["40 м²", "50 м²", "60 м²"]
+    info = convert.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 3, 2)
+
+    convert("40 м²")  # вытеснено как самое старое
+    assert calls[-1] == "40 м²"
+
+
+def test_memoized_converter_caches_failures_and_keeps_types_apart():
+    convert = memoize_converter(str.upper)
+    assert convert("a") == "A"
+    assert convert(1) is FAILED
+    assert convert(1) is FAILED
+    assert convert.cache_info().hits == 1
+
+    quarter = memoize_converter(lambda x: float(str(x).split()[0]))
+    assert quarter(True) is FAILED
+    assert quarter(1) == 1.0
+
+
+def test_translator_memo_stats():
+    translator = get_translator("apartments")
+    translator.clear_memo()
+    transform_mongo_apartments_to_django({"Этаж / этажность": "2 / 9", "Координаты": "53.9, 27.5"})
+    transform_mongo_apartments_to_django({"Этаж / этажность": "2 / 9", "Координаты": "53.9, 27.5"})
+
+    stats = translator.memo_stats()
+    assert stats["Этаж / этажность"]["hits"] == 1
+    assert stats["Этаж / этажность"]["misses"] == 1
+    assert "Координаты" not in stats  # отключено в спецификации
@@ -0,0 +1,356 @@
+import gzip
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import mongomock
+import pytest
+
+from app.webhooks import (
+    DocumentWebhookClient,
+    WebhookClient,
+    document_fields,
+    deliver_deltas,
+    deliver_full,
+    load_watermark,
+    mark_delivered,
+    process_retry_queue,
+)
+
+
+class FakeBulkResult:
+    def __init__(self, modified_count):
+        self.matched_count = modified_count
+        self.modified_count = modified_count
+        self.upserted_count = 0
+
+
+class BulkCollection:
+    """Коллекция mongomock с bulk_write, который понимает UpdateOne из pymongo 4"""
+
+    def __init__(self, coll):
+        self.coll = coll
+
+    def __getattr__(self, name):
+        return getattr(self.coll, name)
+
+    def bulk_write(self, ops, ordered=True):
+        modified = sum(self.coll.update_one(op._filter, op._doc).modified_count for op in ops)
+        return FakeBulkResult(modified)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime(2025, 6, 1, 12, 0, 0)
+
+    def __call__(self):
+        return self.now
+
+
+class Recorder:
+    def __init__(self, fail_on=()):
+        self.calls = []
+        self.fail_on = set(fail_on)
+        self.lock = threading.Lock()
+
+    def __call__(self, ids, since, key=None):
+        with self.lock:
+            self.calls.append((list(ids), since))
+            number = len(self.calls)
+        if number in self.fail_on:
+            raise RuntimeError("502 Bad Gateway")
+
+
+class StubDjango(BaseHTTPRequestHandler):
+    """Локальная заглушка эндпоинта Django: распаковывает gzip и запоминает пачки"""
+
+    def do_POST(self):
+        server = self.server
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = self._read_chunked()
+        else:
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            if self.headers.get("Content-Type") == "application/x-ndjson":
+                payload = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+            else:
+                payload = json.loads(body)
+            server.requests.append((self.headers.get("Idempotency-Key"), payload,
+                                    self.headers.get("Content-Encoding")))
+            fail = server.fail_next > 0
+            server.fail_next -= int(fail)
+        time.sleep(server.latency)
+        with server.lock:
+            server.in_flight -= 1
+        self.send_response(503 if fail else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _read_chunked(self):
+        body = b""
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            if not size:
+                self.rfile.readline()
+                return body
+            body += self.rfile.read(size)
+            self.rfile.readline()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_django():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubDjango)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.in_flight = server.max_in_flight = server.fail_next = 0
+    server.latency = 0.0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/apartments-webhook-endpoint/"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+T0 = datetime(2025, 6, 1, 10, 0, 0)
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["webhooks"]
+
+
+@pytest.fixture
+def coll(db):
+    return BulkCollection(db.apartments)
+
+
+@pytest.fixture
+def retries(db):
+    return db.webhook_retries
+
+
+def _add(coll, _id, changed_at=T0, state="second"):
+    doc = {"_id": _id, "state": state}
+    if changed_at is not None:
+        doc["changed_at"] = changed_at
+    coll.insert_one(doc)
+
+
+def test_first_delivery_sends_everything_and_backfills_old_documents(coll, db, retries):
+    _add(coll, "a", changed_at=None)
+    _add(coll, "b", T0)
+    _add(coll, "c", T0, state="first")
+    post, clock = Recorder(), FakeClock()
+
+    sent = deliver_deltas(coll, db.webhook_state, retries, "apartments", post, clock=clock)
+
+    assert sorted(sent) == ["a", "b"]
+    assert post.calls[0][1] is None
+    assert coll.find_one({"_id": "a"})["changed_at"] == clock.now
+    assert all(coll.find_one({"_id": i})["sent_version"] for i in ("a", "b"))
+    assert load_watermark(db.webhook_state, "apartments") == clock.now
+
+
+def test_only_new_and_changed_listings_are_resent(coll, db, retries):
+    _add(coll, "a", T0)
+    _add(coll, "b", T0 + timedelta(minutes=1))
+    post = Recorder()
+    deliver_deltas(coll, db.webhook_state, retries, "apartments", post, clock=FakeClock())
+
+    assert deliver_deltas(coll, db.webhook_state, retries, "apartments", post, clock=FakeClock()) == []
+
+    coll.update_one({"_id": "a"}, {"$set": {"changed_at": T0 + timedelta(hours=1)}})
+    _add(coll, "c", T0 + timedelta(hours=1, minutes=1))
+    assert deliver_deltas(coll, db.webhook_state, retries, "apartments", post, clock=FakeClock()) == ["a", "c"]
+    assert post.calls[-1][1] == T0 + timedelta(minutes=1)
+    assert len(post.calls) == 2  # пустая дельта не отправляется
+
+
+def test_failed_chunk_goes_to_retry_queue_and_is_not_marked(coll, db, retries):
+    for i in range(5):
+        _add(coll, f"id{i}", T0 + timedelta(seconds=i))
+    clock = FakeClock()
+
+    sent = deliver_deltas(coll, db.webhook_state, retries, "apartments", Recorder(fail_on={2}),
+                          batch_size=2, concurrency=1, clock=clock)
+
+    assert sent == ["id0", "id1", "id4"]
+    assert "sent_version" not in coll.find_one({"_id": "id2"})
+    job = retries.find_one()
+    assert [d["_id"] for d in job["docs"]] == ["id2", "id3"]
+    assert (job["state"], job["attempts"]) == ("pending", 1)
+    assert job["next_attempt_at"] == clock.now + timedelta(seconds=30)
+    # Отметка остаётся перед самым старым недоставленным изменением
+    assert load_watermark(db.webhook_state, "apartments") == T0 + timedelta(seconds=2) - timedelta(milliseconds=1)
+
+
+def test_delta_skips_ids_waiting_in_retry_queue(coll, db, retries):
+    _add(coll, "a", T0)
+    deliver_deltas(coll, db.webhook_state, retries, "apartments", Recorder(fail_on={1}), clock=FakeClock())
+    _add(coll, "b", T0 + timedelta(seconds=1))
+
+    post = Recorder()
+    assert deliver_deltas(coll, db.webhook_state, retries, "apartments", post, clock=FakeClock()) == ["b"]
+    assert post.calls == [(["b"], T0 - timedelta(milliseconds=1))]
+    assert load_watermark(db.webhook_state, "apartments") == T0 - timedelta(milliseconds=1)
+
+
+def test_dead_retry_job_returns_to_delta_scan(coll, db, retries, monkeypatch):
+    import app.webhooks as webhooks
+    monkeypatch.setattr(webhooks, "WEBHOOK_RETRY_MAX_ATTEMPTS", 2)
+    _add(coll, "a", T0)
+    clock = FakeClock()
+    deliver_deltas(coll, db.webhook_state, retries, "apartments", Recorder(fail_on={1}), clock=clock)
+    _add(coll, "b", T0 + timedelta(hours=2))
+    deliver_deltas(coll, db.webhook_state, retries, "apartments", Recorder(), clock=clock)
+
+    clock.now += timedelta(hours=1)
+    assert process_retry_queue(retries, coll, "apartments", Recorder(fail_on={1}), clock=clock)["dead"] == 1
+
+    # Очередь отказалась от пачки, но отметка её не пропустила
+    assert deliver_deltas(coll, db.webhook_state, retries, "apartments", Recorder(), clock=clock) == ["a"]
+    assert coll.find_one({"_id": "a"})["sent_version"] == T0
+    assert load_watermark(db.webhook_state, "apartments") == T0
+
+
+def test_retry_queue_backs_off_then_delivers(coll, db, retries):
+    _add(coll, "a", T0)
+    clock = FakeClock()
+    deliver_deltas(coll, db.webhook_state, retries, "apartments", Recorder(fail_on={1}), clock=clock)
+
+    assert process_retry_queue(retries, coll, "apartments", Recorder(), clock=clock)["delivered"] == 0  # рано
+
+    clock.now += timedelta(seconds=30)
+    stats = process_retry_queue(retries, coll, "apartments", Recorder(fail_on={1}), clock=clock)
+    assert stats["rescheduled"] == 1
+    assert retries.find_one()["next_attempt_at"] == clock.now + timedelta(seconds=60)
+
+    clock.now += timedelta(seconds=60)
+    post = Recorder()
+    assert process_retry_queue(retries, coll, "apartments", post, clock=clock)["delivered"] == 1
+    assert post.calls == [(["a"], None)]
+    assert retries.count_documents({}) == 0
+    assert coll.find_one({"_id": "a"})["sent_version"] == T0
+
+
+def test_retry_queue_gives_up_after_max_attempts(coll, db, retries, monkeypatch):
+    import app.webhooks as webhooks
+    monkeypatch.setattr(webhooks, "WEBHOOK_RETRY_MAX_ATTEMPTS", 2)
+    _add(coll, "a", T0)
+    clock = FakeClock()
+    deliver_deltas(coll, db.webhook_state, retries, "apartments", Recorder(fail_on={1}), clock=clock)
+
+    clock.now += timedelta(hours=1)
+    assert process_retry_queue(retries, coll, "apartments", Recorder(fail_on={1}), clock=clock)["dead"] == 1
+    assert retries.find_one()["state"] == "dead"
+    clock.now += timedelta(days=1)
+    assert process_retry_queue(retries, coll, "apartments", Recorder(), clock=clock)["delivered"] == 0
+
+
+def test_late_write_just_before_watermark_is_still_delivered(coll, db, retries):
+    _add(coll, "a", T0)
+    deliver_deltas(coll, db.webhook_state, retries, "apartments", Recorder(), clock=FakeClock())
+
+    # Другой воркер с отстающими часами записал изменение "в прошлое"
+    _add(coll, "late", T0 - timedelta(seconds=30))
+    assert deliver_deltas(coll, db.webhook_state, retries, "apartments", Recorder(), clock=FakeClock()) == ["late"]
+
+
+def test_change_during_delivery_is_not_marked(coll):
+    _add(coll, "a", T0)
+    stale = coll.find_one({"_id": "a"})
+    coll.update_one({"_id": "a"}, {"$set": {"changed_at": T0 + timedelta(seconds=5)}})
+
+    assert mark_delivered(coll, [stale], clock=FakeClock()) == 0
+    assert "sent_version" not in coll.find_one({"_id": "a"})
+
+
+def test_chunked_gzip_delivery_to_stub_django(coll, db, retries, stub_django):
+    for i in range(250):
+        _add(coll, f"id{i:05d}", T0 + timedelta(milliseconds=i))
+    stub_django.latency = 0.02
+
+    with WebhookClient(stub_django.url) as client:
+        sent = deliver_deltas(coll, db.webhook_state, retries, "apartments", client,
+                              batch_size=50, concurrency=3, clock=FakeClock())
+
+    assert len(sent) == 250
+    keys, payloads, encodings = zip(*stub_django.requests)
+    assert sorted(len(p["ids"]) for p in payloads) == [50] * 5
+    assert sorted(i for p in payloads for i in p["ids"]) == sorted(sent)
+    assert set(encodings) == {"gzip"}
+    assert len(set(keys)) == 5 and all(keys)
+    assert 1 < stub_django.max_in_flight <= 3
+
+
+def test_stub_failure_is_retried_with_same_idempotency_key(coll, retries, stub_django):
+    _add(coll, "a", T0)
+    stub_django.fail_next = 1
+    clock = FakeClock()
+
+    with WebhookClient(stub_django.url) as client:
+        assert deliver_full(coll, retries, "apartments", client, clock=clock) == []
+        clock.now += timedelta(minutes=1)
+        assert process_retry_queue(retries, coll, "apartments", client, clock=clock)["delivered"] == 1
+
+    first, second = stub_django.requests
+    assert first[0] == second[0]
+    assert second[1] == {"ids": ["a"]}
+
+
+def _stored(coll, _id, changed_at=T0, **fields):
+    coll.insert_one({
+        "_id": _id, "state": "second", "changed_at": changed_at,
+        "title": f"Квартира {_id}", "price": 100000.0, "building": {"floors_total": 9},
+        "raw": {"title": "сырой"}, "raw_hash": "abc", "translator_version": "1.x", **fields,
+    })
+
+
+def test_document_fields_follow_translator_and_env(monkeypatch):
+    fields = document_fields("apartments")
+    assert {"title", "price", "link", "floor", "building"} <= set(fields)
+    assert not {"raw", "raw_hash", "state", "changed_at"} & set(fields)
+
+    monkeypatch.setenv("WEBHOOK_RENT_FIELDS", "title, price")
+    assert document_fields("rent") == ["title", "price"]
+
+
+def test_documents_are_streamed_as_ndjson_with_projection(coll, db, retries, stub_django):
+    for i in range(7):
+        _stored(coll, f"id{i}", T0 + timedelta(seconds=i))
+
+    with DocumentWebhookClient(stub_django.url, coll, ["title", "price", "building"]) as client:
+        sent = deliver_deltas(coll, db.webhook_state, retries, "apartments", client,
+                              batch_size=3, concurrency=2, clock=FakeClock())
+
+    assert len(sent) == 7
+    docs = [doc for _, payload, encoding in stub_django.requests for doc in payload]
+    assert {encoding for _, _, encoding in stub_django.requests} == {"gzip"}
+    assert sorted(doc["_id"] for doc in docs) == sorted(sent)
+    assert docs[0].keys() == {"_id", "title", "price", "building"}
+    assert next(d for d in docs if d["_id"] == "id0")["title"] == "Квартира id0"
+
+
+def test_document_retry_sends_current_version(coll, retries, stub_django):
+    _stored(coll, "a")
+    stub_django.fail_next = 1
+    clock = FakeClock()
+
+    with DocumentWebhookClient(stub_django.url, coll, ["title"], compress=False) as client:
+        assert deliver_full(coll, retries, "apartments", client, clock=clock) == []
+        coll.update_one({"_id": "a"}, {"$set": {"title": "Новое название"}})
+        clock.now += timedelta(minutes=1)
+        process_retry_queue(retries, coll, "apartments", client, clock=clock)
+
+    assert stub_django.requests[-1][1] == [{"_id": "a", "title": "Новое название"}]
+    assert stub_django.requests[-1][2] is None
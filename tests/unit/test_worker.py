@@ -0,0 +1,49 @@
+import sys
+import types
+import importlib
+
+import pytest
+
+
+@pytest.fixture
+def worker_module(monkeypatch):
+    monkeypatch.setitem(sys.modules, "tasks", types.ModuleType("tasks"))
+    sys.modules.pop("app_celery", None)
+    sys.modules.pop("app.worker", None)
+    return importlib.import_module("app.worker")
+
+
+def test_worker_argv_follows_profile(worker_module, monkeypatch):
+    monkeypatch.setitem(worker_module.WORKER_PROFILES, "detail", {
+        "queues": ["detail"],
+        "concurrency": 4,
+        "prefetch_multiplier": 1,
+        "soft_time_limit": 600.0,
+        "time_limit": 720.0,
+        "max_tasks_per_child": 50,
+    })
+
+    argv = worker_module.worker_argv("detail", hostname="node1")
+
+    assert argv[0] == "worker"
+    assert "--hostname=detail@node1" in argv
+    assert "--queues=detail" in argv
+    assert "--concurrency=4" in argv
+    assert "--prefetch-multiplier=1" in argv
+    assert "--soft-time-limit=600" in argv
+    assert "--time-limit=720" in argv
+    assert "--max-tasks-per-child=50" in argv
+
+
+def test_worker_argv_rejects_unknown_profile(worker_module):
+    with pytest.raises(ValueError, match="Unknown worker profile"):
+        worker_module.worker_argv("everything")
+
+
+def test_main_starts_worker_with_profile(worker_module, monkeypatch):
+    started = []
+    monkeypatch.setattr(worker_module.celery, "worker_main", lambda argv: started.append(argv))
+
+    assert worker_module.main(["list"]) == 0
+    assert started and "--queues=list" in started[0]
+    assert worker_module.main([]) == 2